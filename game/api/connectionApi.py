@@ -0,0 +1,23 @@
+import json
+
+
+class ConnectionListResource:
+    """How far behind each client's connection is with what we are sending it"""
+    def __init__(self, listening_thread):
+        self.listeningThread = listening_thread
+
+    def on_get(self, _req, resp):
+        connections = [
+            dict(stats, teamId=team_id, playerId=player_id)
+            for ((team_id, player_id), stats) in sorted(self.listeningThread.connectionStats().items())
+        ]
+        resp.body = json.dumps({'connections': connections})
+
+
+class IngestResource:
+    """How long each stage of handling the clients' messages is taking"""
+    def __init__(self, listening_thread):
+        self.listeningThread = listening_thread
+
+    def on_get(self, _req, resp):
+        resp.body = json.dumps(self.listeningThread.msgHandler.sequencer.stats())
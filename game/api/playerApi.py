@@ -1,4 +1,5 @@
 import json
+import time
 from falcon import HTTPBadRequest
 
 
@@ -33,8 +34,9 @@ class PlayerListResource:
         except:
             pass
 
+        now = time.time()
         player_list = {
-            'players': self.gameState.withCurrGameState(lambda cgs: [extractPlayerInfo(cgs, player, full_info) for player in cgs.players.values()]),
+            'players': self.gameState.withCurrGameState(lambda cgs: [extractPlayerInfo(cgs, cgs.playerAt(key, now), full_info) for key in cgs.players.keys()]),
         }
 
         # resp.media = playerList
@@ -47,7 +49,7 @@ class PlayerResource:
 
     def on_get(self, _req, resp, team_id, player_id):
 
-        player = self.gameState.withCurrGameState(lambda cgs: extractPlayerInfo(cgs, cgs.players[(team_id, player_id)]))
+        player = self.gameState.withCurrGameState(lambda cgs: extractPlayerInfo(cgs, cgs.playerAt((team_id, player_id), time.time())))
         # resp.media = player
         resp.body = json.dumps(player)
         # TODO handle 404
@@ -61,12 +63,8 @@ class PlayerInitialisationResource:
         self.listening_thread = listening_thread
 
     def on_post(self, _req, _resp):
-        try:
-            connection = self.listening_thread.uninitialisedConnections.pop()
-        except KeyError:
+        if self.listening_thread.startInitialising() is None:
             raise HTTPBadRequest(title='No player waiting to initialise')
 
-        self.listening_thread.startInitialising(connection)
-
     def on_patch(self, req, resp, team_id, player_id):
         pass
@@ -9,6 +9,7 @@ import mimetypes
 from core import ClientServer
 from api.game import GameResource
 from api.playerApi import PlayerResource, PlayerListResource, PlayerInitialisationResource
+from api.connectionApi import ConnectionListResource, IngestResource
 # from api.helpers import CORSMiddleware
 
 
@@ -25,6 +26,9 @@ def create_api(game_state, game_logic, listening_thread, app_path):
     api.add_route('/players/{team_id:int}/{player_id:int}', PlayerResource(game_state))
     api.add_route('/players:startInitialising', PlayerInitialisationResource(listening_thread))
 
+    api.add_route('/connections', ConnectionListResource(listening_thread))
+    api.add_route('/ingest', IngestResource(listening_thread))
+
     return api
 
 
@@ -0,0 +1,45 @@
+# pylint:disable=redefined-outer-name
+import pytest
+from falcon import testing
+
+from restapi import create_api
+
+
+@pytest.fixture()
+def listening_thread(mocker):
+    return mocker.MagicMock()
+
+
+@pytest.fixture()
+def client(mocker, listening_thread):
+    return testing.TestClient(create_api(mocker.MagicMock(), mocker.MagicMock(), listening_thread, None))
+
+
+def test_get(client, listening_thread):
+    listening_thread.connectionStats.return_value = {
+        (2, 1): {'depth': 0, 'collapsed': 0},
+        (1, 3): {'depth': 12, 'collapsed': 4},
+    }
+
+    result = client.simulate_get('/connections')
+
+    assert result.json == {
+        u'connections': [
+            {u'teamId': 1, u'playerId': 3, u'depth': 12, u'collapsed': 4},
+            {u'teamId': 2, u'playerId': 1, u'depth': 0, u'collapsed': 0},
+        ]
+    }
+
+
+def test_get_ingest(client, listening_thread):
+    stats = {
+        'batches': 2,
+        'parse': {'count': 3, 'meanSeconds': 0.001, 'maxSeconds': 0.002},
+        'queue': {'count': 3, 'meanSeconds': 0.01, 'maxSeconds': 0.02},
+        'apply': {'count': 3, 'meanSeconds': None, 'maxSeconds': 0.0},
+    }
+    listening_thread.msgHandler.sequencer.stats.return_value = stats
+
+    result = client.simulate_get('/ingest')
+
+    assert result.json == stats
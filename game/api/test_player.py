@@ -11,6 +11,7 @@ from parameters import Parameters
 def current_game_state(mocker):
     cgs = mocker.MagicMock()
     cgs.parameters = Parameters()
+    cgs.playerAt.side_effect = lambda key, serverTime: cgs.players[key]
 
     return cgs
 
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+"""Micro-benchmark of the text and binary encodings of the events a server receives.
+
+Reports the bytes per event and the cost of turning the received bytes back into Events for each encoding,
+using the same synthetic traffic as bench_parse.py.
+Run from the game directory: python benchmarks/bench_encoding.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_parse import makeTraffic  # noqa: E402 pylint: disable=wrong-import-position
+from binaryProto import encodeEvent  # noqa: E402 pylint: disable=wrong-import-position
+from connection import LineBuffer  # noqa: E402 pylint: disable=wrong-import-position
+import proto  # noqa: E402 pylint: disable=wrong-import-position
+
+CHUNK_SIZE = 4096
+
+
+def receiveAll(chunks):
+    """Split the stream into messages and parse them into Events, as a ReadThread and msgHandler would"""
+    events = []
+    received = LineBuffer()
+    for chunk in chunks:
+        received.feed(chunk)
+        events.extend(proto.toEvent(message) for message in received.takeMessages())
+    return events
+
+
+def timeReceive(chunks, count, repeat=3):
+    """Return the best time per event"""
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        events = receiveAll(chunks)
+        elapsed = timeit.default_timer() - start
+        assert len(events) == count
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / count
+
+
+def main():
+    events = [proto.parseEvent(line) for line in makeTraffic()]
+    print("%8s %16s %16s" % ("encoding", "bytes/event", "parse (us/event)"))
+    for (name, binary) in [("text", False), ("binary", True)]:
+        stream = "".join(encodeEvent(event, binary) for event in events)
+        chunks = [stream[i:i + CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)]
+        parse = timeReceive(chunks, len(events))
+        print("%8s %16.1f %16.2f" % (name, float(len(stream)) / len(events), parse * 1e6))
+
+
+if __name__ == '__main__':
+    main()
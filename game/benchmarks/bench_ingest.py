@@ -0,0 +1,166 @@
+#!/usr/bin/python
+"""Load test of the server handling messages from many guns at once.
+
+Each simulated gun has its own thread (as each connection does with the threaded transport) sending bursts of
+trigger, trigger release and hit messages, some of which arrive late. Compares:
+  locked    - parsing and applying each message under the handler's lock, as the handler used to
+  inline    - parsing outside the lock and applying each connection's messages straight away
+  sequenced - parsing on the guns' threads and applying everything on the Sequencer's thread in batches
+Run from the game directory: python benchmarks/bench_ingest.py
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverConnection'))
+
+import proto  # noqa: E402 pylint: disable=wrong-import-position
+from gameLogic import GameLogic  # noqa: E402 pylint: disable=wrong-import-position
+from gameState import GameState  # noqa: E402 pylint: disable=wrong-import-position
+from msgHandler import ServerMsgHandler  # noqa: E402 pylint: disable=wrong-import-position
+
+GUNS = 64
+TEAMS = 2
+BURSTS = 20
+BURST_SIZE = 5
+# How far in the past (in seconds) a late event can be.
+MAX_LATENESS = 0.2
+LATE_FRACTION = 0.1
+
+
+class LockedMsgHandler(ServerMsgHandler):
+    """The handler as it was, holding a lock while it parses as well as while it applies"""
+    ingestLock = threading.Lock()
+
+    def handleMsgs(self, full_lines, connection):
+        with self.ingestLock:
+            parsed = [self.parse(full_line) for full_line in full_lines]
+            with self.gameLogic.batch():
+                self.apply(parsed, connection)
+        connection.eventsApplied([parsed_event.event.time for parsed_event in parsed])
+        return [parsed_event.event.time for parsed_event in parsed]
+
+
+class FakeConnection(object):
+    """Just enough of a ServerConnection for the handlers, counting how many of its events have been applied"""
+    def __init__(self):
+        self.applied = 0
+
+    def clientTimeToServer(self, client_time):  # pylint: disable=no-self-use
+        return client_time
+
+    def isNewEvent(self, event):  # pylint: disable=no-self-use,unused-argument
+        return True
+
+    def eventsApplied(self, event_times):
+        self.applied += len(event_times)
+
+    def queueMessage(self, msg):
+        pass
+
+
+def makeBursts(team, player, rng):
+    bursts = []
+    for _ in range(BURSTS):
+        burst = []
+        for _ in range(BURST_SIZE):
+            roll = rng.random()
+            if roll < 0.1:
+                gunMsg = proto.HIT.create(rng.randint(1, TEAMS), rng.randint(1, GUNS // TEAMS), 0)
+            elif roll < 0.55:
+                gunMsg = proto.TRIGGER.create()
+            else:
+                gunMsg = proto.TRIGGER_RELEASE.create()
+            burst.append(proto.RECV.create(team, player, gunMsg))
+        bursts.append(burst)
+    return bursts
+
+
+def runGuns(handlerClass, sequenced):
+    """Return (seconds, events handled, sequencer stats or None)"""
+    gameState = GameState()
+    gameLogic = GameLogic(gameState)
+    for gun in range(GUNS):
+        gameState.getOrCreatePlayer(gun % TEAMS + 1, gun // TEAMS + 1)
+    # Started a little while ago so that late events are still in the game.
+    gameLogic.startGame(time.time() - 1)
+
+    handler = handlerClass(None, gameLogic, sequenced=sequenced)
+    if handler.sequencer:
+        handler.sequencer.start()
+
+    rng = random.Random(1)
+    guns = []
+    for gun in range(GUNS):
+        (team, player) = (gun % TEAMS + 1, gun // TEAMS + 1)
+        guns.append((gun + 1, FakeConnection(), makeBursts(team, player, rng), random.Random(gun)))
+
+    def gunThread(gunId, connection, bursts, gunRng):
+        for burst in bursts:
+            now = time.time()
+            lines = []
+            for msg in burst:
+                eventTime = now - gunRng.uniform(0, MAX_LATENESS) if gunRng.random() < LATE_FRACTION else now
+                lines.append(proto.Event(msg, gunId, eventTime).toStr())
+            handler.handleMsgs(lines, connection)
+
+    total = GUNS * BURSTS * BURST_SIZE
+    threads = [threading.Thread(target=gunThread, args=args) for args in guns]
+    start = timeit.default_timer()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    while sum(connection.applied for (_, connection, _, _) in guns) < total:
+        time.sleep(0.001)
+    elapsed = timeit.default_timer() - start
+
+    stats = None
+    if handler.sequencer:
+        handler.sequencer.stop()
+        stats = handler.sequencer.stats()
+    gameState.stop()
+    return (elapsed, total, stats)
+
+
+def quietly(func, *args):
+    """Call func without the game's own printing (e.g. of every player which is adjusted)"""
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            return func(*args)
+        finally:
+            sys.stdout = stdout
+
+
+def main():
+    print("%d guns, %d messages each" % (GUNS, BURSTS * BURST_SIZE))
+    print("%10s %14s" % ("mode", "events/s"))
+    for (name, handlerClass, sequenced) in [
+            ("locked", LockedMsgHandler, False),
+            ("inline", ServerMsgHandler, False),
+            ("sequenced", ServerMsgHandler, True)]:
+        best = None
+        for _ in range(3):
+            result = quietly(runGuns, handlerClass, sequenced)
+            if best is None or result[0] < best[0]:
+                best = result
+        (elapsed, total, stats) = best
+        print("%10s %14.0f" % (name, total / elapsed))
+        if stats:
+            print("  %d batches" % stats['batches'])
+            for stage in ['parse', 'queue', 'apply']:
+                print("  %-6s mean %8.1fus  max %8.1fus" % (
+                    stage, stats[stage]['meanSeconds'] * 1e6, stats[stage]['maxSeconds'] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+"""Micro-benchmark of parsing and dispatching the messages a server receives.
+
+Compares the old per-call regex parseEvent and trying each handler's regex in turn with
+proto's precompiled regex parseEvent and dispatch on the message name. The traffic is a synthetic mix in the
+proportions seen in a game: mostly trigger and hit reports with watermarks and pings between them.
+The two are timed in alternating rounds and the spread is reported as well, as the difference between them is
+within the noise between runs.
+Run from the game directory: python benchmarks/bench_parse.py
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import proto  # noqa: E402 pylint: disable=wrong-import-position
+
+LINES = 20000
+
+
+def oldParseEvent(line):
+    """The parsing which proto.parseEvent used to do"""
+    regex = re.compile(r"^E\(([0-9a-f]+),([0-9.]+),(.*)\)$")
+    m = regex.match(line)
+    if not m:
+        raise proto.MessageParseException("Couldn't parse an event from '%s'" % line)
+    (event_id, time, msgStr) = m.groups()
+    return proto.Event(msgStr, long(event_id, 16), float(time))
+
+
+class OldMessageHandler(object):
+    """The dispatch which proto.MessageHandler used to do, trying each message's regex in turn"""
+    def __init__(self):
+        self.handlers = []
+
+    def handles(self, msg):
+        def handles_decorator(f):
+            def handles_inner(msgStr):
+                m = msg.regex.match(msgStr)
+                if m:
+                    f(*m.groups())
+                    return True
+            self.handlers.append(handles_inner)
+            return f
+        return handles_decorator
+
+    def handle(self, msgStr):
+        for handler in self.handlers:
+            if handler(msgStr):
+                return True
+        return False
+
+
+def makeTraffic():
+    random.seed(1)
+    gunMessages = ["T", "t", "H1,2,3", "H2,1,1", "FA"]
+    lines = []
+    time = 1516565652.0
+    for _ in range(LINES):
+        time += random.uniform(0, 0.01)
+        r = random.random()
+        if r < 0.75:
+            msgStr = proto.RECV.create(random.randint(1, 4), random.randint(1, 32), random.choice(gunMessages))
+        elif r < 0.9:
+            msgStr = proto.WATERMARK.create()
+        elif r < 0.95:
+            msgStr = proto.PING.create()
+        else:
+            msgStr = proto.PONG.create(time - 0.05, random.randint(0, 1))
+        lines.append(proto.Event(msgStr, random.getrandbits(64), time).toStr())
+    return lines
+
+
+def parseAll(parseEvent, handlerClass, lines):
+    """Parse and dispatch lines to handlers like ServerMsgHandler's. The handlers are only built once
+    as it is the parsing and dispatch we are interested in."""
+    gunHandler = handlerClass()
+    gunHandler.handles(proto.HIT)(lambda sentTeam, sentPlayer, damage: None)
+    gunHandler.handles(proto.INIT_HIT)(lambda: None)
+    gunHandler.handles(proto.TRIGGER)(lambda: None)
+    gunHandler.handles(proto.TRIGGER_RELEASE)(lambda: None)
+    gunHandler.handles(proto.FULL_AMMO)(lambda: None)
+
+    handler = handlerClass()
+    handler.handles(proto.RECV)(lambda recvTeam, recvPlayer, line: gunHandler.handle(line))
+    handler.handles(proto.HELLO)(lambda: None)
+    handler.handles(proto.WATERMARK)(lambda: None)
+    handler.handles(proto.PING)(lambda: None)
+    handler.handles(proto.PONG)(lambda startTime, reply: None)
+
+    for line in lines:
+        event = parseEvent(line)
+        if not handler.handle(event.msgStr):
+            raise RuntimeError("Couldn't handle %s" % line)
+
+
+def timeParse(parseEvent, handlerClass, lines):
+    """Return the time per line"""
+    start = timeit.default_timer()
+    parseAll(parseEvent, handlerClass, lines)
+    return (timeit.default_timer() - start) / len(lines)
+
+
+def main(rounds=9):
+    lines = makeTraffic()
+    times = {'regex': [], 'dispatch': []}
+    # Alternate so that both see the same changes in machine load.
+    for _ in range(rounds):
+        times['regex'].append(timeParse(oldParseEvent, OldMessageHandler, lines))
+        times['dispatch'].append(timeParse(proto.parseEvent, proto.MessageHandler, lines))
+
+    print("%10s %10s %10s %10s  (us/line over %d rounds)" % ("", "best", "median", "worst", rounds))
+    for name in ['regex', 'dispatch']:
+        results = sorted(times[name])
+        print("%10s %10.2f %10.2f %10.2f" % (name, results[0] * 1e6, results[len(results) // 2] * 1e6, results[-1] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
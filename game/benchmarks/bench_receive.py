@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""Micro-benchmark of splitting a received stream of large ParametersSnapshot messages into lines.
+
+Compares the old str concatenation + ReadThread._takeCompleteResponses with LineBuffer.
+Run from the game directory: python benchmarks/bench_receive.py
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from connection import LineBuffer  # noqa: E402 pylint: disable=wrong-import-position
+import proto  # noqa: E402 pylint: disable=wrong-import-position
+
+LINE_SIZES = [1024, 4096, 16384, 65536]
+CHUNK_SIZE = 1024
+LINES = 50
+
+
+def takeCompleteResponses(received):
+    """The splitting which ReadThread._takeCompleteResponses used to do"""
+    allResp = received.split('\n')
+    partial = allResp.pop(-1)
+
+    return partial, allResp
+
+
+def oldReceive(chunks):
+    lines = []
+    received = ''
+    for chunk in chunks:
+        received = received + chunk
+        (partial, complete) = takeCompleteResponses(received)
+        received = partial
+        lines.extend(complete)
+    return lines
+
+
+def lineBufferReceive(chunks):
+    lines = []
+    received = LineBuffer()
+    for chunk in chunks:
+        received.feed(chunk)
+        lines.extend(received.takeMessages())
+    return lines
+
+
+def makeStream(lineSize):
+    """A stream of ParametersSnapshot events of about lineSize bytes each, cut up as recv would return it"""
+    parameters = {}
+    i = 0
+    while len(json.dumps(parameters)) < lineSize:
+        parameters["effect%d.maxHealth" % i] = {"baseValue": 100, "effects": [{"id": i, "multiplier": 1.5}]}
+        i += 1
+    line = proto.Event(proto.PARAMETERS_SNAPSHOT.create(json.dumps(parameters)), 0x123def, 1516565652.0).toStr()
+    stream = (line + "\n") * LINES
+    return [stream[i:i + CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)], len(line)
+
+
+def timeReceive(receive, chunks, repeat=5):
+    """Return the best time per line"""
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        lines = receive(chunks)
+        elapsed = timeit.default_timer() - start
+        assert len(lines) == LINES
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / LINES
+
+
+def main():
+    print("%8s %20s %20s" % ("line", "concat (us/line)", "LineBuffer (us/line)"))
+    for size in LINE_SIZES:
+        (chunks, lineSize) = makeStream(size)
+        assert oldReceive(chunks) == lineBufferReceive(chunks)
+
+        old = timeReceive(oldReceive, chunks)
+        new = timeReceive(lineBufferReceive, chunks)
+        print("%8d %20.2f %20.2f" % (lineSize, old * 1e6, new * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+"""Micro-benchmark of inserting late events into the uncertain window as it grows.
+
+Compares the old linear scan + list.insert with UncertainEventList's bisect.
+Run from the game directory: python benchmarks/bench_uncertainEvents.py
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gameEvents import GameEvent  # noqa: E402 pylint: disable=wrong-import-position
+from uncertainEventList import UncertainEventList  # noqa: E402 pylint: disable=wrong-import-position
+
+WINDOW_SIZES = [100, 1000, 5000, 10000]
+LATE_EVENTS = 200
+
+
+def linearInsert(events, event):
+    """The insertion which GameState._addPastEvent used to do"""
+    newIndex = 0
+    for e in events:
+        if event.serverTime > e.serverTime:
+            newIndex = newIndex + 1
+        else:
+            break
+    events.insert(newIndex, event)
+    return newIndex
+
+
+def timeInserts(makeEvents, insert, lateEvents, repeat=3):
+    """Return the best time per insert, not counting building the window"""
+    best = None
+    for _ in range(repeat):
+        events = makeEvents()
+        start = timeit.default_timer()
+        for e in lateEvents:
+            insert(events, e)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(lateEvents)
+
+
+def main():
+    random.seed(1)
+    print("%8s %16s %16s" % ("window", "linear (us/op)", "bisect (us/op)"))
+    for size in WINDOW_SIZES:
+        window = [GameEvent(float(t)) for t in range(size)]
+        # Late events land somewhere in the second half of the window, as they would with a lagging confidence point.
+        lateEvents = [GameEvent(random.uniform(size / 2, size)) for _ in range(LATE_EVENTS)]
+
+        linear = timeInserts(lambda: list(window), linearInsert, lateEvents)
+        bisected = timeInserts(lambda: UncertainEventList(window), UncertainEventList.insert, lateEvents)
+        print("%8d %16.2f %16.2f" % (size, linear * 1e6, bisected * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""A compact binary encoding of the most frequent events, used instead of the text E(id,time,msg) lines
+once both ends have said (in their HELLO) that they understand it.
+
+Each frame starts with FRAME_MARKER, which a text line never starts with, so a stream can mix frames and
+text lines. Events which don't have a binary form are still sent as text.
+"""
+
+import struct
+
+import proto
+
+FRAME_MARKER = '\x00'
+FRAME_MARKER_BYTE = ord(FRAME_MARKER)
+
+# marker, length of the rest of the frame
+FRAME_HEADER = struct.Struct("!cH")
+# message type, event id, event time
+_ENVELOPE = struct.Struct("!BQd")
+# If the message type has this bit set, the envelope is followed by the event's sequence number.
+_SEQUENCED = 0x80
+_SEQ = struct.Struct("!I")
+
+_PING = 1
+_PONG = 2
+_RECV_TRIGGER = 3
+_RECV_TRIGGER_RELEASE = 4
+_RECV_HIT = 5
+_STARTGAME = 6
+
+_PONG_ARGS = struct.Struct("!dB")  # ping event time, reply wanted
+_RECV_ARGS = struct.Struct("!BB")  # recvTeam, recvPlayer
+_RECV_HIT_ARGS = struct.Struct("!BBBBB")  # recvTeam, recvPlayer, sentTeam, sentPlayer, damage
+_STARTGAME_ARGS = struct.Struct("!I")  # duration
+
+_MAX_ID = 2 ** 64
+_MAX_SEQ = 2 ** 32
+
+
+def _fitsInByte(numStr):
+    return numStr != "" and int(numStr) < 256
+
+
+def _encodePing(msgStr):
+    if proto.PING.parseArgs(msgStr) is not None:
+        return (_PING, "")
+
+
+def _encodePong(msgStr):
+    args = proto.PONG.parseArgs(msgStr)
+    if args is not None:
+        try:
+            startTime = float(args[0])
+        except ValueError:
+            return None
+        return (_PONG, _PONG_ARGS.pack(startTime, int(args[1])))
+
+
+def _encodeStartGame(msgStr):
+    args = proto.STARTGAME.parseArgs(msgStr)
+    if args is not None and args[0] != "" and int(args[0]) < 2 ** 32:
+        return (_STARTGAME, _STARTGAME_ARGS.pack(int(args[0])))
+
+
+def _encodeRecv(msgStr):
+    args = proto.RECV.parseArgs(msgStr)
+    if args is None or not _fitsInByte(args[0]) or not _fitsInByte(args[1]):
+        return None
+    (recvTeam, recvPlayer, line) = (int(args[0]), int(args[1]), args[2])
+
+    if proto.TRIGGER.parseArgs(line) is not None:
+        return (_RECV_TRIGGER, _RECV_ARGS.pack(recvTeam, recvPlayer))
+    if proto.TRIGGER_RELEASE.parseArgs(line) is not None:
+        return (_RECV_TRIGGER_RELEASE, _RECV_ARGS.pack(recvTeam, recvPlayer))
+    hitArgs = proto.HIT.parseArgs(line)
+    if hitArgs is not None:
+        return (_RECV_HIT, _RECV_HIT_ARGS.pack(recvTeam, recvPlayer, *[int(arg) for arg in hitArgs]))
+    return None
+
+
+_ENCODERS = {
+    proto.PING.name: _encodePing,
+    proto.PONG.name: _encodePong,
+    proto.STARTGAME.name: _encodeStartGame,
+    proto.RECV.name: _encodeRecv,
+}
+
+# The text form of each gun message inside a Recv, with the receiving team and player left to be filled in.
+_RECV_TRIGGER_FORMAT = proto.RECV.subst.replace("%s", proto.TRIGGER.create())
+_RECV_TRIGGER_RELEASE_FORMAT = proto.RECV.subst.replace("%s", proto.TRIGGER_RELEASE.create())
+_RECV_HIT_FORMAT = proto.RECV.subst.replace("%s", proto.HIT.subst)
+
+_DECODERS = {
+    _PING: (None, proto.PING.create),
+    _PONG: (_PONG_ARGS, proto.PONG.create),
+    _RECV_TRIGGER: (_RECV_ARGS, lambda *args: _RECV_TRIGGER_FORMAT % args),
+    _RECV_TRIGGER_RELEASE: (_RECV_ARGS, lambda *args: _RECV_TRIGGER_RELEASE_FORMAT % args),
+    _RECV_HIT: (_RECV_HIT_ARGS, lambda *args: _RECV_HIT_FORMAT % args),
+    _STARTGAME: (_STARTGAME_ARGS, proto.STARTGAME.create),
+}
+
+
+def encodeFrame(event):
+    """Return event as a binary frame or None if it doesn't have a binary form"""
+    encoder = _ENCODERS.get(proto.messageName(event.msgStr))
+    if encoder is None or not 0 <= event.id < _MAX_ID:
+        return None
+    if event.seq is not None and not 0 <= event.seq < _MAX_SEQ:
+        return None
+    encoded = encoder(event.msgStr)
+    if encoded is None:
+        return None
+
+    (msgType, args) = encoded
+    if event.seq is None:
+        body = _ENVELOPE.pack(msgType, event.id, event.time) + args
+    else:
+        body = _ENVELOPE.pack(msgType | _SEQUENCED, event.id, event.time) + _SEQ.pack(event.seq) + args
+    return FRAME_HEADER.pack(FRAME_MARKER, len(body)) + body
+
+
+def encodeEvent(event, binary):
+    """Encode event to be sent, as a binary frame if binary is True and it has one or as a text line"""
+    if binary:
+        frame = encodeFrame(event)
+        if frame is not None:
+            return frame
+    return event.toStr() + "\n"
+
+
+def decodeFrame(buf, start, end):
+    """Decode the body of the frame in buf[start:end] (i.e. after the FRAME_HEADER) into an Event"""
+    if end - start < _ENVELOPE.size:
+        raise proto.MessageParseException("Binary frame is too short: %r" % str(buf[start:end]))
+    try:
+        (msgType, eventId, eventTime) = _ENVELOPE.unpack_from(buf, start)
+        argsStart = start + _ENVELOPE.size
+        seq = None
+        if msgType & _SEQUENCED:
+            msgType &= ~_SEQUENCED
+            (seq,) = _SEQ.unpack_from(buf, argsStart)
+            argsStart += _SEQ.size
+        (argsStruct, create) = _DECODERS[msgType]
+        argsSize = argsStruct.size if argsStruct else 0
+        if argsStart + argsSize != end:
+            raise proto.MessageParseException("Binary frame of type %d has the wrong length" % msgType)
+        args = argsStruct.unpack_from(buf, argsStart) if argsStruct else ()
+    except (struct.error, KeyError):
+        raise proto.MessageParseException("Couldn't decode a binary frame: %r" % str(buf[start:end]))
+    return proto.Event(create(*args), eventId, eventTime, seq)
@@ -53,9 +53,8 @@ class Client():
 
         self.connectToArduino()
 
-        # This blocks until a connection is established so do it after connecting to the hardware
+        # This tries to connect (and keeps trying in the background if it can't) so do it after connecting to the hardware
         self.connection = ClientConnection(self, self.logic)
-        self._sendToServer(proto.HELLO.create())
 
     def serialWrite(self, line):
         if self.responsiveSerial:
@@ -70,42 +69,41 @@ class Client():
             print("<a-", repr(line))
             sys.stdout.flush()
 
-            h = proto.MessageHandler()
-
-            @h.handles(proto.HIT)
-            def hit(sentTeam, sentPlayer, damage):  # pylint: disable=W0612
-                self.logic.hit(time.time(), None, None, sentTeam, sentPlayer, damage)
-                return True
-
-            @h.handles(proto.FULL_AMMO)
-            def fullAmmo():  # pylint: disable=W0612
-                # TODO
-                # self.logic.fullAmmo(self.gameState, self.player)
-                return True
-
-            @h.handles(proto.TRIGGER)
-            def trigger():  # pylint: disable=W0612
-                self.logic.trigger(time.time(), None, None)
-                return True
-
-            @h.handles(proto.TRIGGER_RELEASE)
-            def triggerRelease():  # pylint: disable=W0612
-                self.logic.triggerRelease(time.time(), None, None)
-                return True
-
             # TODO be more discerning about unparseable input here.
-            h.handle(line)
+            self.gunHandlers.handle(line, self)
 
             main_player = self.gameState.getMainPlayer()
             if main_player:
                 msg = proto.RECV.create(main_player.team_id, main_player.player_id, line)
             else:
                 msg = proto.RECV.create(0, 0, line)
-            self._sendToServer(msg)
-
-    def _sendToServer(self, msg):
-        """queue this packet to be sent to the server"""
-        self.connection.queueMessage(msg)
+            # These are kept until the server has them, so nothing is lost while we are reconnecting.
+            self.connection.queueReliable(msg)
+
+    # The handlers for messages from the gun, called with (self, *args).
+    # These are built once, when the class is defined.
+    gunHandlers = proto.MessageHandler()
+
+    @gunHandlers.handles(proto.HIT)
+    def _hit(self, sentTeam, sentPlayer, damage):
+        self.logic.hit(time.time(), None, None, sentTeam, sentPlayer, damage)
+        return True
+
+    @gunHandlers.handles(proto.FULL_AMMO)
+    def _fullAmmo(self):  # pylint: disable=R0201
+        # TODO
+        # self.logic.fullAmmo(self.gameState, self.player)
+        return True
+
+    @gunHandlers.handles(proto.TRIGGER)
+    def _trigger(self):
+        self.logic.trigger(time.time(), None, None)
+        return True
+
+    @gunHandlers.handles(proto.TRIGGER_RELEASE)
+    def _triggerRelease(self):
+        self.logic.triggerRelease(time.time(), None, None)
+        return True
 
     def connectToArduino(self):
         self.serialWrite(proto.CLIENTCONNECT.create())
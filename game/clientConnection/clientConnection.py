@@ -1,101 +1,174 @@
 from __future__ import print_function
 
 import socket
-import sys
 import time
 import json
+from threading import Lock
 
 from player import Player
 from core import ClientServer
 from connection import ClientServerConnection
 import proto
 from parameters import Parameters
+from outbox import Outbox
+from reconnector import Reconnector
 
 
 class ClientConnection(ClientServerConnection):
+    # Keep the server's confidence point moving on even when nothing is happening.
+    heartbeatInterval = 5
+    # Don't wait long for the server when connecting, if it isn't there we try again later.
+    connectTimeout = 3
+
     def __init__(self, main, game_logic, *args, **kwargs):
         ClientServerConnection.__init__(self, *args, **kwargs)
         self.main = main
         self.game_logic = game_logic
-        self.retryCount = 0
 
-        self._openConnection()
+        # The events which must reach the server, kept until it acknowledges them so they survive reconnecting.
+        self.outbox = Outbox()
+        # Held while queueing from the outbox so that events are sent in sequence.
+        self.outboxLock = Lock()
+        # Whether we have told the server about our session and sent it the events it was missing,
+        # until then new events just wait in the outbox.
+        self.resumed = False
+        # Whether the server understands sequence numbers, if it doesn't we can't resend anything.
+        self.sequenced = False
+
+        # Try to connect straight away, if that doesn't work the reconnector keeps trying in the background.
+        # It has to exist first as the new connection's read thread tells it if we are disconnected straight away.
+        self.reconnector = Reconnector(self._openConnection)
+        try:
+            self._openConnection()
+        except socket.error as e:
+            print("Couldn't connect to the server:", e)
+            self.reconnector.disconnected()
+        self.reconnector.start()
+
+    def queueReliable(self, msg):
+        """Queue a message which should reach the server even if we are disconnected for a while"""
+        with self.outboxLock:
+            if self.resumed and not self.sequenced:
+                self.queueMessage(msg)
+                return
+            event = self.outbox.add(msg, self.idProvider(), time.time())
+            if self.resumed:
+                self.queueEvent(event)
+
+    def _resume(self, sequenced):
+        """Send everything in the outbox, from now on new events are sent straight away too"""
+        with self.outboxLock:
+            self.sequenced = sequenced
+            for event in self.outbox.unacknowledged():
+                if sequenced:
+                    self.queueEvent(event)
+                else:
+                    self.queueEvent(proto.Event(event.msgStr, event.id, event.time))
+            if not sequenced:
+                # Nothing is going to acknowledge these.
+                self.outbox.acknowledge(self.outbox.nextSeq)
+            self.resumed = True
 
     def handleMsg(self, fullLine):
-        event = proto.parseEvent(fullLine)
-        msg_str = event.msgStr
-
-        h = proto.MessageHandler()
-
-        @h.handles(proto.PLAYER_SNAPSHOT)
-        def playerSnapshot(jsonStr):  # pylint: disable=W0612
-            self.game_logic.setPlayerSnapshot(time.time(), json.loads(jsonStr, cls=Player.Decoder))
-
-        @h.handles(proto.PARAMETERS_SNAPSHOT)
-        def parametersSnapshot(jsonStr):  # pylint: disable=W0612
-            self.game_logic.setParametersSnapshot(time.time(), Parameters.fromSimpleTypes(json.loads(jsonStr)))
-
-        @h.handles(proto.STARTGAME)
-        def startGame(duration):  # pylint: disable=W0612
-            # Note that we assume latency is zero here however the server will be the ultimate arbiter of when a game ends
-            # even if the client thinks there is extra time, it will not be able to change the server gamestate
-            self.game_logic.startGame(time.time(), int(duration))
-
-        @h.handles(proto.STOPGAME)
-        def stopGame():  # pylint: disable=W0612
-            self.game_logic.stopGame(time.time())
-
-        @h.handles(proto.DELETED)
-        def deleted():  # pylint: disable=W0612
-            # just treat this as the game stopping for us.
-            self.game_logic.stopGame(time.time())
-            # then shutdown as the server won't want us back.
-            self.main.shutdown()
-
-        @h.handles(proto.RESETGAME)
-        def resetGame():  # pylint: disable=W0612
-            self.game_logic.resetGame(time.time())
-
-        @h.handles(proto.PING)
-        def ping():  # pylint: disable=W0612
+        event = proto.toEvent(fullLine)
+
+        return self.eventHandlers.handle(event.msgStr, self, event)
+
+    # The handlers for messages from the server, called with (self, event, *args).
+    # These are built once, when the class is defined.
+    eventHandlers = proto.MessageHandler()
+
+    @eventHandlers.handles(proto.PLAYER_SNAPSHOT)
+    def _playerSnapshot(self, event, jsonStr):  # pylint: disable=W0613
+        self.game_logic.setPlayerSnapshot(time.time(), json.loads(jsonStr, cls=Player.Decoder))
+
+    @eventHandlers.handles(proto.PARAMETERS_SNAPSHOT)
+    def _parametersSnapshot(self, event, jsonStr):  # pylint: disable=W0613
+        self.game_logic.setParametersSnapshot(time.time(), Parameters.fromSimpleTypes(json.loads(jsonStr)))
+
+    @eventHandlers.handles(proto.STARTGAME)
+    def _startGame(self, event, duration):  # pylint: disable=W0613
+        # Note that we assume latency is zero here however the server will be the ultimate arbiter of when a game ends
+        # even if the client thinks there is extra time, it will not be able to change the server gamestate
+        self.game_logic.startGame(time.time(), int(duration))
+
+    @eventHandlers.handles(proto.STOPGAME)
+    def _stopGame(self, event):  # pylint: disable=W0613
+        self.game_logic.stopGame(time.time())
+
+    @eventHandlers.handles(proto.DELETED)
+    def _deleted(self, event):  # pylint: disable=W0613
+        # just treat this as the game stopping for us.
+        self.game_logic.stopGame(time.time())
+        # then shutdown as the server won't want us back.
+        self.main.shutdown()
+
+    @eventHandlers.handles(proto.RESETGAME)
+    def _resetGame(self, event):  # pylint: disable=W0613
+        self.game_logic.resetGame(time.time())
+
+    @eventHandlers.handles(proto.HELLO)
+    def _hello(self, event, version):  # pylint: disable=W0613
+        # The server has told us which protocol version to use.
+        self.setProtocolVersion(int(version))
+        if self.protocolVersion >= proto.SEQUENCE_PROTOCOL_VERSION:
+            # We resume once the server has told us which of our events it already has.
+            self.queueMessage(proto.SESSION.create(self.outbox.session))
+        else:
+            self._resume(sequenced=False)
+
+    @eventHandlers.handles(proto.ACK)
+    def _ack(self, event, seq):  # pylint: disable=W0613
+        with self.outboxLock:
+            self.outbox.acknowledge(int(seq))
+        if not self.resumed:
+            # This is the answer to our SESSION, send the events which the server doesn't have in one go.
+            self._resume(sequenced=True)
+
+    @eventHandlers.handles(proto.PING)
+    def _ping(self, event):
+        self.queueMessage(proto.PONG.create(event.time, 0))
+
+    @eventHandlers.handles(proto.PONG)
+    def _pong(self, event, _startTime, reply):
+        if int(reply):
             self.queueMessage(proto.PONG.create(event.time, 0))
 
-        @h.handles(proto.PONG)
-        def pong(_startTime, reply):  # pylint: disable=W0612
-            if int(reply):
-                self.queueMessage(proto.PONG.create(event.time, 0))
+    @eventHandlers.handles(proto.START_INITIALISING)
+    def _startInitialising(self, event):  # pylint: disable=W0613
+        self.game_logic.gameState.startInitialisation()
 
-        @h.handles(proto.START_INITIALISING)
-        def startInitialising():  # pylint: disable=W0612
-            self.game_logic.gameState.startInitialisation()
-
-        return h.handle(msg_str)
+    def handleMsgs(self, fullLines):
+        # Add the game events from a backlog of messages as one batch.
+        with self.game_logic.batch():
+            return [self.handleMsg(line) for line in fullLines]
 
     def _openConnection(self):
+        """Connect to the server, raising socket.error if we can't"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        print("Connecting to " + ClientServer.SERVER + ":" + str(ClientServer.PORT))
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            print("Connecting to " + ClientServer.SERVER + ":" + str(ClientServer.PORT))
-            self.sock.connect((ClientServer.SERVER, ClientServer.PORT))
-
-            self.setSocket(self.sock)
+            sock.settimeout(self.connectTimeout)
+            sock.connect((ClientServer.SERVER, ClientServer.PORT))
         except socket.error:
-            self.onDisconnect()
+            sock.close()
+            raise
 
-    def onDisconnect(self):
-        self.retryCount = self.retryCount + 1
-
-        # retry with an exponential backoff, from 2 seconds to 32s
-        # 2, 4, 8, 16, 32 = 62 + 60 * 32 = 33:02
-        if self.retryCount >= 65:
-            super.onDisconnect()
-            return
+        old_sock = self.sock
+        self.setSocket(sock)
+        if old_sock:
+            old_sock.close()
 
-        if self.retryCount > 6:
-            wait_time = 64 + 32 * (self.retryCount - 6)
-        else:
-            wait_time = 2 * 2 ** (self.retryCount - 1)
-        print("Disconnected from server, waiting " + str(wait_time) + " seconds to try again")
-        sys.stdout.flush()
-        time.sleep(wait_time)
+        # Every connection starts with a HELLO, the server's reply tells us how to carry on.
+        self.queueMessage(proto.HELLO.create(proto.PROTOCOL_VERSION))
 
-        self._openConnection()
+    def onDisconnect(self):
+        print("Disconnected from server")
+        # Anything else which happens is kept in the outbox until we have reconnected.
+        with self.outboxLock:
+            self.resumed = False
+        self.reconnector.disconnected()
+
+    def stop(self):
+        self.reconnector.stop()
+        super(ClientConnection, self).stop()
@@ -0,0 +1,45 @@
+from __future__ import print_function
+
+import random
+from collections import deque
+
+from proto import Event
+
+
+class Outbox(object):
+    """The events we have sent (or are waiting to send) to the server which it hasn't acknowledged yet.
+
+    Each event is given the next sequence number of this session, so the server can tell us (with a cumulative ACK)
+    how far it has got and ignore any it has already seen when we send them again after reconnecting.
+    If the server doesn't acknowledge anything for a long time, the oldest events are dropped to keep us to maxSize.
+    """
+    maxSize = 2000
+
+    def __init__(self):
+        # The server keeps the last sequence number of each session so that a restarted client isn't mistaken
+        # for one which has already sent everything up to there.
+        self.session = random.getrandbits(32)
+        self.nextSeq = 1
+        self.events = deque()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, msg, event_id, event_time):
+        """Return a new sequenced Event for msg, which is kept until it has been acknowledged"""
+        event = Event(msg, event_id, event_time, self.nextSeq)
+        self.nextSeq += 1
+        if len(self.events) >= self.maxSize:
+            self.events.popleft()
+            self.dropped += 1
+        self.events.append(event)
+        return event
+
+    def acknowledge(self, seq):
+        """Forget about the events up to and including seq, which the server has got"""
+        while self.events and self.events[0].seq <= seq:
+            self.events.popleft()
+
+    def unacknowledged(self):
+        return list(self.events)
@@ -0,0 +1,126 @@
+from __future__ import print_function
+
+import random
+import socket
+import sys
+import time
+import traceback
+from threading import Thread, Condition
+
+CONNECTED = "connected"
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+STOPPED = "stopped"
+
+
+class Reconnector(Thread):
+    """Connects to the server again whenever the connection is lost, without holding up anything else.
+
+    The read thread just tells us it has been disconnected and carries on (i.e. finishes) so the serial loop and
+    the outbound queue keep going in the meantime. We retry with an exponential backoff, which is jittered so that
+    a field of guns which all lost the server at once don't all come back at the same moment.
+    """
+    # seconds to wait after the first failed attempt, doubling up to maxBackoff.
+    initialBackoff = 1
+    maxBackoff = 30
+    # Each wait is reduced by a random amount of up to this fraction of it.
+    jitter = 0.5
+
+    def __init__(self, connect, state=CONNECTED):
+        """connect is called to open a new connection, and should raise socket.error if it can't"""
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.name = "Reconnector"
+        self.connect = connect
+        self.state = state
+        self._stateChanged = Condition()
+        self.failedAttempts = 0  # since we were last connected
+
+        # How long it took to reconnect, from noticing the disconnection to being connected again.
+        self.disconnectedAt = None if state == CONNECTED else time.time()
+        self.reconnects = 0
+        self.totalFailedAttempts = 0
+        self.lastReconnectLatency = None
+        self.maxReconnectLatency = None
+        self.totalReconnectLatency = 0.0
+
+    def disconnected(self):
+        """Note that the connection has been lost, we will start trying to reconnect straight away"""
+        with self._stateChanged:
+            if self.state == CONNECTED:
+                self.state = DISCONNECTED
+                self.disconnectedAt = time.time()
+                self._stateChanged.notify()
+
+    def stop(self):
+        with self._stateChanged:
+            self.state = STOPPED
+            self._stateChanged.notify()
+
+    def backoff(self, attempt):
+        """How long to wait after the attempt'th failed attempt in a row"""
+        delay = min(self.maxBackoff, self.initialBackoff * 2 ** (attempt - 1))
+        return delay * (1 - random.uniform(0, self.jitter))
+
+    def run(self):
+        while True:
+            with self._stateChanged:
+                while self.state == CONNECTED:
+                    self._stateChanged.wait()
+                if self.state == STOPPED:
+                    return
+                self.state = CONNECTING
+
+            self._attempt()
+
+    def _attempt(self):
+        try:
+            self.connect()
+        except socket.error as e:
+            self.failedAttempts += 1
+            self.totalFailedAttempts += 1
+            delay = self.backoff(self.failedAttempts)
+            print("Couldn't connect to the server (%s), trying again in %.1f seconds" % (e, delay))
+            sys.stdout.flush()
+            self._wait(delay)
+            return
+        except Exception:  # pylint:disable=broad-except
+            # Keep trying, whatever went wrong.
+            traceback.print_exc()
+            self._wait(self.maxBackoff)
+            return
+
+        with self._stateChanged:
+            if self.state == STOPPED:
+                return
+            self.state = CONNECTED
+            self._connected(time.time())
+
+    def _wait(self, delay):
+        """Wait for delay seconds, unless we are stopped first"""
+        with self._stateChanged:
+            end = time.time() + delay
+            while self.state != STOPPED and time.time() < end:
+                self._stateChanged.wait(end - time.time())
+            if self.state != STOPPED:
+                self.state = DISCONNECTED
+
+    def _connected(self, now):
+        """Update the metrics now that we have reconnected. Hold _stateChanged while calling this."""
+        latency = now - self.disconnectedAt
+        self.reconnects += 1
+        self.lastReconnectLatency = latency
+        self.maxReconnectLatency = max(self.maxReconnectLatency, latency)
+        self.totalReconnectLatency += latency
+        self.failedAttempts = 0
+
+    def stats(self):
+        with self._stateChanged:
+            return {
+                'state': self.state,
+                'reconnects': self.reconnects,
+                'failedAttempts': self.totalFailedAttempts,
+                'lastReconnectLatency': self.lastReconnectLatency,
+                'maxReconnectLatency': self.maxReconnectLatency,
+                'meanReconnectLatency': self.totalReconnectLatency / self.reconnects if self.reconnects else None,
+            }
@@ -1,5 +1,8 @@
 """Test how the client handles messages from the server"""
 
+import threading
+import time
+
 import pytest
 from clientConnection import ClientConnection
 from player import Player
@@ -11,7 +14,11 @@ from parameters import Parameters
 @pytest.fixture
 def client_connection(mocker, monkeypatch):
     """Fixture for a client connection being tested"""
-    monkeypatch.setattr('socket.socket', mocker.MagicMock())
+    socket_class = mocker.MagicMock()
+    # The server never sends us anything, the messages are passed to handleMsg directly.
+    socket_class.return_value.recv_into.side_effect = lambda *args: threading.Event().wait()
+    socket_class.return_value.send.side_effect = len
+    monkeypatch.setattr('socket.socket', socket_class)
     game_logic = mocker.MagicMock()
     main = mocker.MagicMock()
     cc = ClientConnection(main, game_logic)
@@ -22,7 +29,7 @@ def client_connection(mocker, monkeypatch):
 def test_ping(client_connection):
     """Test handling of PING message"""
     assert client_connection.handleMsg("E(123def,1516565652,Ping())")
-    client_connection.queueMessage.assert_called_once_with("Pong(1516565652,0)")
+    client_connection.queueMessage.assert_called_once_with("Pong(1516565652.000000,0)")
 
 
 def test_simple_pong(client_connection):
@@ -34,13 +41,13 @@ def test_simple_pong(client_connection):
 def test_reply_pong(client_connection):
     """Test handling of PONG message which requests a response"""
     assert client_connection.handleMsg("E(123def,1516565852,Pong(1516565652,1))")
-    client_connection.queueMessage.assert_called_once_with("Pong(1516565852,0)")
+    client_connection.queueMessage.assert_called_once_with("Pong(1516565852.000000,0)")
 
 
 def test_playerSnapshot(client_connection, mocker, monkeypatch):
     """Test handling of PLAYER_SNAPSHOT message"""
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     assert client_connection.handleMsg('E(123def,1516565852,PlayerSnapshot({"playerID": 2, "teamID": 1, "health": 5, "gunDamage": 1, "ammo": 100}))')
 
     p = Player(team_id=1, player_id=2, ammo=100, health=5, gun_damage=1)
@@ -51,7 +58,7 @@ def test_playerSnapshot(client_connection, mocker, monkeypatch):
 def test_parametersSnapshot(client_connection, mocker, monkeypatch):
     """Test handling of PARAMETERS_SNAPSHOT message"""
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     assert client_connection.handleMsg('E(123def,1516565852,ParametersSnapshot({"parameters": {"player.maxHealth": {"effects": [], "baseValue": 100}, "gun.damage": {"effects": [], "baseValue": 2}}}))')
 
     client_connection.game_logic.setParametersSnapshot.assert_called_once_with(300, Parameters())
@@ -60,7 +67,92 @@ def test_parametersSnapshot(client_connection, mocker, monkeypatch):
 def test_startInitialising(client_connection, mocker, monkeypatch):
     """Test handling of START_INITIALISING message"""
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     assert client_connection.handleMsg('E(123def,1516565852,StartInitialising())')
 
     client_connection.game_logic.gameState.startInitialisation.assert_called_once()
+
+
+def test_hello(client_connection):
+    """Test handling of the server's HELLO telling us which protocol version to use"""
+    assert client_connection.protocolVersion == 1
+    assert not client_connection.writeThread.binary
+
+    assert client_connection.handleMsg("E(0,1516565652,Hello(2))")
+
+    assert client_connection.protocolVersion == 2
+    assert client_connection.writeThread.binary
+
+
+def test_hello_sequenced(client_connection, mocker):
+    """Test that events are kept until the server has told us what it has got and then sent together"""
+    client_connection.queueEvent = mocker.MagicMock()
+    client_connection.queueReliable("Recv(1,2,T)")
+    client_connection.queueReliable("Recv(1,2,t)")
+    client_connection.queueEvent.assert_not_called()
+
+    assert client_connection.handleMsg("E(0,1516565652,Hello(3))")
+    client_connection.queueMessage.assert_called_once_with("Session(%x)" % client_connection.outbox.session)
+    client_connection.queueEvent.assert_not_called()
+
+    assert client_connection.handleMsg("E(0,1516565653,Ack(1))")
+    assert [call[0][0].toStr() for call in client_connection.queueEvent.call_args_list] == [
+        client_connection.outbox.unacknowledged()[0].toStr()]
+    assert client_connection.outbox.unacknowledged()[0].seq == 2
+
+    # Once resumed, events are sent as they happen
+    client_connection.queueReliable("Recv(1,2,T)")
+    assert client_connection.queueEvent.call_args[0][0].seq == 3
+
+    # and are kept while we are disconnected.
+    client_connection.handleMsg("E(0,1516565654,Ack(3))")
+    client_connection.resumed = False
+    client_connection.queueReliable("Recv(1,2,t)")
+    assert client_connection.queueEvent.call_count == 2
+    assert len(client_connection.outbox) == 1
+
+
+def test_hello_unsequenced(client_connection, mocker):
+    """Test that an older server which doesn't acknowledge events still gets them"""
+    client_connection.queueEvent = mocker.MagicMock()
+    client_connection.queueReliable("Recv(1,2,T)")
+
+    assert client_connection.handleMsg("E(0,1516565652,Hello(2))")
+    client_connection.queueEvent.assert_called_once()
+    assert client_connection.queueEvent.call_args[0][0].seq is None
+    assert len(client_connection.outbox) == 0
+
+    client_connection.queueReliable("Recv(1,2,t)")
+    client_connection.queueMessage.assert_called_once_with("Recv(1,2,t)")
+
+
+def test_disconnect(client_connection, mocker):
+    """Test that a disconnection is handed over to the reconnector and new events are kept until we resume"""
+    client_connection.reconnector = mocker.MagicMock()
+    client_connection.resumed = True
+
+    client_connection.onDisconnect()
+
+    client_connection.reconnector.disconnected.assert_called_once_with()
+    assert not client_connection.resumed
+
+
+def test_disconnected_while_connecting(mocker, monkeypatch):
+    """Test that being disconnected as soon as the first connection is made is noticed, and we connect again"""
+    opened = []
+
+    def openConnection(self):
+        opened.append(True)
+        if len(opened) == 1:
+            # as the read thread would if the server closed the socket straight away.
+            self.onDisconnect()
+
+    monkeypatch.setattr(ClientConnection, '_openConnection', openConnection)
+    connection = ClientConnection(mocker.MagicMock(), mocker.MagicMock())
+    try:
+        end = time.time() + 2
+        while len(opened) < 2 and time.time() < end:
+            time.sleep(0.01)
+        assert len(opened) == 2
+    finally:
+        connection.reconnector.stop()
@@ -0,0 +1,39 @@
+"""Test keeping events until the server acknowledges them"""
+
+from outbox import Outbox
+
+
+def test_sequence_numbers():
+    outbox = Outbox()
+    events = [outbox.add("Recv(1,2,T)", 0x123def, t) for t in [100, 101, 102]]
+
+    assert [event.seq for event in events] == [1, 2, 3]
+    assert events[0].toStr() == "E(123def,100.000000,#1,Recv(1,2,T))"
+    assert outbox.unacknowledged() == events
+
+
+def test_acknowledge():
+    outbox = Outbox()
+    for t in range(5):
+        outbox.add("Recv(1,2,T)", 0x123def, t)
+
+    outbox.acknowledge(3)
+    assert [event.seq for event in outbox.unacknowledged()] == [4, 5]
+
+    # Acknowledgements can arrive again (e.g. after reconnecting)
+    outbox.acknowledge(2)
+    assert len(outbox) == 2
+
+    outbox.acknowledge(5)
+    assert len(outbox) == 0
+    assert outbox.add("Recv(1,2,t)", 0x123def, 10).seq == 6
+
+
+def test_bounded():
+    outbox = Outbox()
+    outbox.maxSize = 3
+    for t in range(5):
+        outbox.add("Recv(1,2,T)", 0x123def, t)
+
+    assert [event.seq for event in outbox.unacknowledged()] == [3, 4, 5]
+    assert outbox.dropped == 2
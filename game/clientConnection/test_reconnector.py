@@ -0,0 +1,76 @@
+"""Test reconnecting to the server in the background"""
+
+import socket
+import time
+
+import pytest
+from reconnector import Reconnector, CONNECTED, DISCONNECTED
+
+# pylint:disable=redefined-outer-name
+
+
+def waitFor(condition, timeout=2):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def connect(mocker):
+    return mocker.MagicMock()
+
+
+@pytest.fixture
+def reconnector(connect):
+    reconnector = Reconnector(connect)
+    reconnector.initialBackoff = 0.01
+    yield reconnector
+    reconnector.stop()
+
+
+def test_backoff(reconnector):
+    reconnector.initialBackoff = 1
+    reconnector.maxBackoff = 30
+    for attempt in range(1, 10):
+        delay = reconnector.backoff(attempt)
+        expected = min(30, 2 ** (attempt - 1))
+        assert expected * (1 - reconnector.jitter) <= delay <= expected
+
+
+def test_reconnect_after_failures(reconnector, connect):
+    connect.side_effect = [socket.error("refused"), socket.timeout("timed out"), None]
+    reconnector.start()
+    assert reconnector.state == CONNECTED
+    connect.assert_not_called()
+
+    reconnector.disconnected()
+
+    assert waitFor(lambda: reconnector.state == CONNECTED and connect.call_count == 3)
+    stats = reconnector.stats()
+    assert stats['reconnects'] == 1
+    assert stats['failedAttempts'] == 2
+    assert stats['lastReconnectLatency'] >= 0.01
+    assert stats['meanReconnectLatency'] == stats['lastReconnectLatency']
+
+
+def test_start_disconnected(connect):
+    reconnector = Reconnector(connect, DISCONNECTED)
+    reconnector.start()
+    try:
+        assert waitFor(lambda: reconnector.state == CONNECTED)
+        connect.assert_called_once_with()
+    finally:
+        reconnector.stop()
+
+
+def test_stop_while_waiting(reconnector, connect):
+    connect.side_effect = socket.error("refused")
+    reconnector.initialBackoff = 60
+    reconnector.start()
+    reconnector.disconnected()
+    assert waitFor(lambda: connect.call_count == 1)
+
+    reconnector.stop()
+    reconnector.join(1)
+    assert not reconnector.is_alive()
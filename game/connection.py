@@ -3,10 +3,12 @@ from __future__ import print_function
 import socket
 import sys
 import time
-from threading import Thread, Lock
+from collections import deque
+from threading import Thread, Lock, Condition
 import Queue
 
-from proto import Event, PING
+from proto import Event, PING, WATERMARK, ACK, PLAYER_SNAPSHOT, PARAMETERS_SNAPSHOT, BINARY_PROTOCOL_VERSION, messageName
+from binaryProto import FRAME_MARKER_BYTE, FRAME_HEADER, decodeFrame, encodeEvent
 
 
 class PiSerialIdProvider():
@@ -35,12 +37,176 @@ class PiSerialIdProvider():
         return self.clientId
 
 
+# The id we send our messages with unless a connection is given a different idProvider.
+defaultIdProvider = PiSerialIdProvider()
+
+
+class PreparedEvent(object):
+    """A message which has been stamped once so that it can be queued on many connections.
+    Each encoding of it is only done once and the result is shared by all the connections using that encoding.
+    """
+    __slots__ = ('event', '_encoded')
+
+    def __init__(self, msg, idProvider=defaultIdProvider):
+        self.event = Event(msg, idProvider(), time.time())
+        self._encoded = {}
+
+    def encode(self, binary):
+        encoded = self._encoded.get(binary)
+        if encoded is None:
+            # If two threads get here at once we encode twice but it doesn't matter which one is kept.
+            encoded = self._encoded[binary] = encodeEvent(self.event, binary)
+        return encoded
+
+    def __repr__(self):
+        return repr(self.event)
+
+
+def encodeQueued(item, binary):
+    """Encode an Event or PreparedEvent which has been queued to be sent"""
+    if isinstance(item, PreparedEvent):
+        return item.encode(binary)
+    return encodeEvent(item, binary)
+
+
+def _queuedEvent(item):
+    if isinstance(item, PreparedEvent):
+        return item.event
+    return item
+
+
+class OutboundQueue(object):
+    """The Events (or PreparedEvents) waiting to be sent on a connection, with a limit on how many can build up.
+
+    Snapshots and pings are superseded by a later one of the same kind so only the latest of each is kept,
+    and pings which have waited too long are dropped as the round trip they measure would be meaningless.
+    Anything else is refused once maxSize messages are waiting, and the connection should be dropped.
+    """
+    maxSize = 1000
+    # The messages which a later one with the same name makes pointless.
+    collapsibleNames = frozenset([PLAYER_SNAPSHOT.name, PARAMETERS_SNAPSHOT.name, PING.name, ACK.name])
+    # How long (in seconds) a ping can wait to be sent before it is dropped.
+    maxPingAge = 5
+
+    def __init__(self, maxSize=None):
+        if maxSize is not None:
+            self.maxSize = maxSize
+        # entries are [name, item, live], live is False once the entry has been superseded.
+        self._entries = deque()
+        self._latest = {}  # collapsible message name -> its latest entry
+        self._supersededCount = 0
+        self._notEmpty = Condition()
+        # Once closed, get doesn't wait for anything more to be queued.
+        self.closed = False
+
+        # Counters so we can see which connections are lagging.
+        self.highWater = 0
+        self.collapsed = 0
+        self.droppedPings = 0
+        self.refused = 0
+
+    def __len__(self):
+        return len(self._entries) - self._supersededCount
+
+    def empty(self):
+        return len(self) == 0
+
+    def put(self, item):
+        """Queue item, returning False (without queueing it) if the queue is full"""
+        name = messageName(_queuedEvent(item).msgStr)
+        with self._notEmpty:
+            if name in self.collapsibleNames:
+                # These never make the queue longer than it would be with only the latest of each.
+                previous = self._latest.get(name)
+                if previous is not None:
+                    previous[2] = False
+                    self._supersededCount += 1
+                    self.collapsed += 1
+            elif len(self) >= self.maxSize:
+                self.refused += 1
+                return False
+
+            entry = [name, item, True]
+            self._entries.append(entry)
+            if name in self.collapsibleNames:
+                self._latest[name] = entry
+            self.highWater = max(self.highWater, len(self))
+            self._notEmpty.notify()
+        return True
+
+    def get(self, block=True, timeout=None):
+        """Take the next item to send, raising Queue.Empty if there isn't one (before the timeout)"""
+        with self._notEmpty:
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                item = self._take()
+                if item is not None:
+                    return item
+                remaining = None if deadline is None else deadline - time.time()
+                if not block or self.closed or (remaining is not None and remaining <= 0):
+                    raise Queue.Empty
+                self._notEmpty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def close(self):
+        """Wake up anything waiting in get, and stop it waiting from now on"""
+        with self._notEmpty:
+            self.closed = True
+            self._notEmpty.notify_all()
+
+    def _take(self):
+        """Pop the next item which should still be sent, or return None. Hold _notEmpty while calling this."""
+        while self._entries:
+            entry = self._entries.popleft()
+            (name, item, live) = entry
+            if not live:
+                self._supersededCount -= 1
+                continue
+            if self._latest.get(name) is entry:
+                del self._latest[name]
+            if name == PING.name and _queuedEvent(item).time < time.time() - self.maxPingAge:
+                self.droppedPings += 1
+                continue
+            return item
+        return None
+
+    def stats(self):
+        return {
+            'depth': len(self),
+            'highWater': self.highWater,
+            'collapsed': self.collapsed,
+            'droppedPings': self.droppedPings,
+            'refused': self.refused,
+        }
+
+
 class ClientServerConnection(object):
-    def __init__(self, idProvider=PiSerialIdProvider()):
+    # If set, send a watermark after this many seconds without sending anything else
+    # so that the other end knows we haven't got any older events for it.
+    heartbeatInterval = None
+    # How long (in seconds) sending can block before we give up on the other end and disconnect.
+    sendTimeout = 30
+
+    def __init__(self, idProvider=defaultIdProvider, eventLoop=None):
         self.sock = None
         self.readThread = None
-        self.writeThread = WriteThread(idProvider)
-        self.writeThread.start()
+        self.idProvider = idProvider
+        # If we have an eventLoop, it does our reading and writing instead of a pair of threads.
+        self.eventLoop = eventLoop
+        if eventLoop is None:
+            self.writeThread = WriteThread(idProvider, self.heartbeatInterval, self.onSlowConsumer)
+            self.writeThread.start()
+        else:
+            self.writeThread = eventLoop.createWriter(idProvider, self.onSlowConsumer)
+        self.protocolVersion = 1
+        self.slowConsumerDisconnects = 0
+
+    def setProtocolVersion(self, version):
+        """Set the protocol version which the other end has agreed to, this decides how we encode what we send"""
+        self.protocolVersion = version
+        self.writeThread.binary = version >= BINARY_PROTOCOL_VERSION
 
     def queueMessage(self, msg):
         print("-->", repr(msg))
@@ -48,38 +214,179 @@ class ClientServerConnection(object):
 
         self.writeThread.queueMessage(msg)
 
+    def queuePrepared(self, prepared):
+        """Queue a PreparedEvent, which may also be queued on other connections"""
+        print("-->", repr(prepared))
+        sys.stdout.flush()
+
+        self.writeThread.queuePrepared(prepared)
+
+    def queueEvent(self, event):
+        """Queue an Event which has already been stamped, e.g. one which is being sent again"""
+        print("-->", repr(event))
+        sys.stdout.flush()
+
+        self.writeThread.queueEvent(event)
+
     def setSocket(self, sock):
         self.sock = sock
+        # Whatever is at the other end of the new socket has to tell us what it understands again.
+        self.setProtocolVersion(1)
 
         # clean up old thread
         if self.readThread:
             self.readThread.stop()
 
-        # start new one
-        self.readThread = ReadThread(self.sock, self)
-        self.readThread.start()
+        if self.eventLoop is None:
+            # The read thread is fine with this as it just tries again.
+            self.sock.settimeout(self.sendTimeout)
+
+            # start new one
+            self.readThread = ReadThread(self.sock, self)
+            self.readThread.start()
+        else:
+            self.eventLoop.register(self.sock, self)
 
         self.writeThread.setSocket(self.sock)
 
+    def onSlowConsumer(self):
+        """Called when the other end isn't taking what we send quickly enough.
+        Shut the socket down, the reading side will then notice the disconnection as usual."""
+        print("Disconnecting a connection which isn't keeping up with what we send")
+        self.slowConsumerDisconnects += 1
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def queueStats(self):
+        """The counters of what has been queued and sent on this connection"""
+        stats = self.writeThread.stats()
+        stats['slowConsumerDisconnects'] = self.slowConsumerDisconnects
+        return stats
+
     def _closeConnection(self):
         if self.sock:
             self.sock.shutdown(2)
             self.sock.close()
             self.sock = None
 
+    def handleMsgs(self, fullLines):
+        """Handle several messages which arrived together, returning a list of the results of handling each.
+        Subclasses can override this to handle them as one batch."""
+        return [self.handleMsg(line) for line in fullLines]
+
     def onDisconnect(self):
         """Called when this connection is disconnected. Should be overridden in subclasses"""
         raise RuntimeError("onDisconnectCalled")
 
-    def stop(self):
-        self.writeThread.stop()
-        self.readThread.stop()
+    def stop(self, wait=True):
+        """Close the connection. If wait is False, don't wait for the write thread to finish."""
+        self.writeThread.stop(wait)
+        if self.readThread:
+            self.readThread.stop()
+        if self.eventLoop and self.sock:
+            self.eventLoop.unregister(self.sock)
         self._closeConnection()
 
     def startLatencyCheck(self):
         self.queueMessage(PING.create())
 
 
+class LineBuffer(object):
+    """Collects the bytes received on a connection and splits them into lines.
+
+    Data is received straight into a reusable bytearray and only the newly arrived bytes are searched for
+    newlines, so a long line arriving in many chunks isn't copied or searched again for each one.
+    """
+    def __init__(self, size=4096):
+        self._buffer = bytearray(size)
+        self._start = 0  # where the data we haven't made into lines yet starts
+        self._end = 0  # where the data we have received ends
+        self._scanned = 0  # where the data we haven't searched for newlines yet starts
+
+    def __len__(self):
+        """The number of bytes of an incomplete line we are holding"""
+        return self._end - self._start
+
+    def _makeRoom(self, size):
+        """Make sure there are at least size free bytes after the end of the data"""
+        if len(self._buffer) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if self._start > 0 and len(self._buffer) - pending >= size:
+            # Move the incomplete line to the front. This only happens once the buffer has filled up.
+            self._buffer[0:pending] = self._buffer[self._start:self._end]
+        else:
+            newBuffer = bytearray(max(len(self._buffer) * 2, pending + size))
+            newBuffer[0:pending] = self._buffer[self._start:self._end]
+            self._buffer = newBuffer
+        self._scanned -= self._start
+        self._start = 0
+        self._end = pending
+
+    def recvFrom(self, sock, size=4096):
+        """Receive up to size bytes from sock, returning how many were received (0 means the socket was closed)"""
+        self._makeRoom(size)
+        received = sock.recv_into(memoryview(self._buffer)[self._end:], size)
+        self._end += received
+        return received
+
+    def feed(self, data):
+        """Add data which has been received some other way"""
+        self._makeRoom(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def takeMessages(self):
+        """Return the complete messages we have received and forget about them.
+        Text lines are returned as strings (without their newlines) and binary frames as the Events they decode to.
+        """
+        messages = []
+        while self._start < self._end:
+            if self._buffer[self._start] == FRAME_MARKER_BYTE:
+                if self._end - self._start < FRAME_HEADER.size:
+                    break
+                frameStart = self._start + FRAME_HEADER.size
+                frameEnd = frameStart + FRAME_HEADER.unpack_from(self._buffer, self._start)[1]
+                if frameEnd > self._end:
+                    break
+                # Move past the frame first so that a frame which can't be decoded isn't tried again.
+                self._start = frameEnd
+                messages.append(decodeFrame(self._buffer, frameStart, frameEnd))
+            else:
+                newline = self._buffer.find('\n', max(self._scanned, self._start), self._end)
+                if newline == -1:
+                    break
+                messages.append(str(self._buffer[self._start:newline]))
+                self._start = newline + 1
+
+        if self._start == self._end:
+            # Nothing left over, start at the beginning again.
+            self._start = self._end = 0
+        self._scanned = self._end
+        return messages
+
+
+def dispatchLines(connection, complete):
+    """Pass the complete messages (text lines or decoded Events) received on a connection to it to be handled."""
+    for i in complete:
+        print("<--", repr(i))
+    sys.stdout.flush()
+
+    if len(complete) > 1:
+        # A backlog of messages, handle them together.
+        results = connection.handleMsgs(complete)
+    else:
+        results = [connection.handleMsg(line) for line in complete]
+
+    for (line, result) in zip(complete, results):
+        if not result:
+            raise RuntimeError("Received unknown message: %s" % line)
+
+
 class ReadThread(Thread):
     def __init__(self, sock, parent):
         super(ReadThread, self).__init__(group=None)
@@ -90,10 +397,10 @@ class ReadThread(Thread):
         self.shouldStop = False
 
     def run(self):
-        received = ''
+        received = LineBuffer()
         while True:
             try:
-                chunk = self.sock.recv(1024)
+                receivedCount = received.recvFrom(self.sock)
             except socket.timeout:
                 if self.shouldStop:
                     # this is expected
@@ -105,80 +412,128 @@ class ReadThread(Thread):
                     return
                 self.parent.onDisconnect()
                 break
-            if chunk == '':
+            if receivedCount == 0:
                 if self.shouldStop:
                     # this is expected
                     return
                 self.parent.onDisconnect()
                 break
-            received = received + chunk
-
-            (partial, complete) = self._takeCompleteResponses(received)
-            received = partial
-
-            for i in complete:
-                print("<--", repr(i))
-                sys.stdout.flush()
 
-                if self.parent.handleMsg(i):
-                    continue
-                else:
-                    raise RuntimeError("Received unknown message: %s" % i)
-
-    @staticmethod
-    def _takeCompleteResponses(received):
-        """Extract complete responses from a char stream.
-           return a tuple containing the remaining partial response and a list of complete responses
-        """
-        allResp = received.split('\n')
-        partial = allResp.pop(-1)
-
-        return partial, allResp
+            dispatchLines(self.parent, received.takeMessages())
 
     def stop(self):
         self.shouldStop = True
 
 
 class WriteThread(Thread):
-    def __init__(self, idProvider):
+    """Sends the messages queued for a connection.
+    Everything which has been queued by the time we are ready to send is sent together, so a burst of messages
+    costs a few send calls rather than one each. Nothing waits for more messages to arrive though.
+    """
+    # Don't build up batches larger than this, so one slow burst can't hold the memory of all of it twice.
+    maxBatchMessages = 256
+
+    def __init__(self, idProvider, heartbeatInterval=None, onSlowConsumer=None):
         super(WriteThread, self).__init__(group=None)
         self.setDaemon(True)
         self.name = "Client/Server Write Thread"
         self.sock = None  # this will be set by setSocket
-        self.queue = Queue.Queue()
+        self.queue = OutboundQueue()
+        # Called when the other end isn't keeping up, either our queue is full or sending timed out.
+        self.onSlowConsumer = onSlowConsumer
+        # Held while timestamping and queueing a message so a heartbeat can't be stamped later than a message which isn't queued yet.
+        self.queueLock = Lock()
         self.shouldStop = False
 
         self.idProvider = idProvider
+        self.heartbeatInterval = heartbeatInterval
+        # Whether to send the messages which have a binary form as binary frames
+        self.binary = False
+
+        # Counters so we can see how well the batching is working.
+        self.messagesSent = 0
+        self.batchesSent = 0
+        self.sendCalls = 0
+        self.bytesSent = 0
 
     def run(self):
         while not self.shouldStop:
             try:
-                msg = self.queue.get(True, 5).toStr() + "\n"
+                batch = [encodeQueued(self.queue.get(True, self.heartbeatInterval or 5), self.binary)]
             except Queue.Empty:
-                # timeout, go back round the loop to see if we should be stopping.
-                continue
+                if self.shouldStop or self.heartbeatInterval is None or self.sock is None:
+                    # timeout, go back round the loop to see if we should be stopping.
+                    continue
+                # We've been quiet for a while, let the other end know that we have nothing older to send.
+                with self.queueLock:
+                    if not self.queue.empty():
+                        continue
+                    batch = [encodeEvent(Event(WATERMARK.create(), self.idProvider(), time.time()), self.binary)]
+
+            # Take everything else which is already waiting.
+            while len(batch) < self.maxBatchMessages:
+                try:
+                    batch.append(encodeQueued(self.queue.get_nowait(), self.binary))
+                except Queue.Empty:
+                    break
+
+            msg = "".join(batch)
             try:
                 totalsent = 0
                 while totalsent < len(msg):
                     sent = self.sock.send(msg[totalsent:])
+                    self.sendCalls += 1
                     if sent == 0:
                         # NB. we should rely on the readThread to signal a closed connection
                         # TODO handle this
                         raise RuntimeError("socket connection broken")
                     totalsent = totalsent + sent
+                self.messagesSent += len(batch)
+                self.batchesSent += 1
+                self.bytesSent += totalsent
+            except socket.timeout:
+                self._slowConsumer()
+            except socket.error as e:
+                # We rely on the readThread to notice the disconnection, what we were sending is lost.
+                print("Error sending:", e)
             except:
                 print("Unexpected error:", sys.exc_info()[0])
                 raise
                 # TODO retry sending the packet
         print ("Write Thread exiting")
 
-    def stop(self):
-        """shut the client server connection down nicely. This blocks until shutdown is finished."""
+    def stop(self, wait=True):
+        """shut the client server connection down nicely. If wait is True, this blocks until shutdown is finished."""
         self.shouldStop = True
-        self.join()
+        self.queue.close()
+        if wait:
+            self.join()
 
     def queueMessage(self, msg):
-        self.queue.put(Event(msg, self.idProvider(), time.time()))
+        with self.queueLock:
+            queued = self.queue.put(Event(msg, self.idProvider(), time.time()))
+        if not queued:
+            self._slowConsumer()
+
+    def queuePrepared(self, prepared):
+        """Queue a PreparedEvent. It was stamped when it was prepared so shouldn't be used with heartbeats,
+        which might have been sent with a later time in the meantime."""
+        with self.queueLock:
+            queued = self.queue.put(prepared)
+        if not queued:
+            self._slowConsumer()
+
+    # An Event which has already been stamped is queued in the same way.
+    queueEvent = queuePrepared
+
+    def _slowConsumer(self):
+        if self.onSlowConsumer:
+            self.onSlowConsumer()
+
+    def stats(self):
+        stats = self.queue.stats()
+        stats.update(messagesSent=self.messagesSent, batchesSent=self.batchesSent, sendCalls=self.sendCalls, bytesSent=self.bytesSent)
+        return stats
 
     def setSocket(self, sock):
         self.sock = sock
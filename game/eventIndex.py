@@ -0,0 +1,61 @@
+class EventIndex(object):
+    """An index of events by their type and by the player they are for (recvTeam, recvPlayerId)
+    so that matching events can be found without checking every event.
+    """
+
+    def __init__(self):
+        # Each of these map to a dict from id(event) to event.
+        self._byType = {}
+        self._byPlayer = {}
+        self._byTypeAndPlayer = {}
+
+    @staticmethod
+    def _playerKey(event):
+        """The player an event is for, or None if it isn't for a particular player"""
+        if hasattr(event, 'recvTeam'):
+            return (event.recvTeam, event.recvPlayerId)
+        return None
+
+    def add(self, event):
+        eventType = type(event)
+        player = self._playerKey(event)
+        self._byType.setdefault(eventType, {})[id(event)] = event
+        if player is not None:
+            self._byPlayer.setdefault(player, {})[id(event)] = event
+            self._byTypeAndPlayer.setdefault((eventType, player), {})[id(event)] = event
+
+    def remove(self, event):
+        eventType = type(event)
+        player = self._playerKey(event)
+        self._removeFrom(self._byType, eventType, event)
+        if player is not None:
+            self._removeFrom(self._byPlayer, player, event)
+            self._removeFrom(self._byTypeAndPlayer, (eventType, player), event)
+
+    @staticmethod
+    def _removeFrom(index, key, event):
+        events = index.get(key)
+        if events is not None:
+            events.pop(id(event), None)
+            if not events:
+                del index[key]
+
+    def clear(self):
+        self._byType = {}
+        self._byPlayer = {}
+        self._byTypeAndPlayer = {}
+
+    def find(self, eventType=None, player=None):
+        """Return the events which are instances of eventType and for the given (team, playerId) player.
+        Either can be None to match any type or any player.
+        """
+        if eventType is None:
+            if player is None:
+                return [e for events in self._byType.values() for e in events.values()]
+            return self._byPlayer.get(player, {}).values()
+
+        # Subclasses of eventType match too.
+        matchingTypes = [t for t in self._byType if issubclass(t, eventType)]
+        if player is None:
+            return [e for t in matchingTypes for e in self._byType[t].values()]
+        return [e for t in matchingTypes for e in self._byTypeAndPlayer.get((t, player), {}).values()]
@@ -0,0 +1,263 @@
+from __future__ import print_function
+
+import errno
+import select
+import socket
+import time
+import traceback
+from threading import Lock
+import Queue
+
+from connection import LineBuffer, OutboundQueue, dispatchLines, encodeQueued
+from proto import Event
+
+
+class EventLoop(object):
+    """Does the reading and writing for many connections on one thread by waiting for all of their sockets with select,
+    rather than each connection having its own read and write threads.
+
+    Connections use it by passing it to ClientServerConnection, which then registers its socket here and uses a
+    LoopWriter instead of a WriteThread. Their handleMsg(s) and onDisconnect methods are called on the loop's thread.
+    """
+    # How long to wait in select before checking if we should stop. Anything that needs the loop sooner wakes it up.
+    timeout = 1
+
+    def __init__(self):
+        self._lock = Lock()
+        self._listeners = {}  # listening socket -> function to call when there is a connection to accept
+        self._connections = {}  # socket -> _LoopConnection
+        self._writers = set()  # LoopWriters which have something to send
+        # Sending to _wakeSender wakes the loop up so that it notices new sockets and messages.
+        (self._wakeReceiver, self._wakeSender) = socket.socketpair()
+        self._wakeReceiver.setblocking(0)
+        self._wakeSender.setblocking(0)
+        self.shouldStop = False
+
+    def addListeningSocket(self, sock, onAcceptable):
+        """Call onAcceptable (on the loop's thread) whenever sock has a connection waiting to be accepted"""
+        sock.setblocking(0)
+        with self._lock:
+            self._listeners[sock] = onAcceptable
+        self._wake()
+
+    def register(self, sock, connection):
+        """Start reading from sock and passing what is received to connection"""
+        sock.setblocking(0)
+        with self._lock:
+            self._connections[sock] = _LoopConnection(connection)
+        self._wake()
+
+    def unregister(self, sock):
+        """Stop reading from sock. It is fine if it isn't registered."""
+        with self._lock:
+            self._connections.pop(sock, None)
+        self._wake()
+
+    def createWriter(self, idProvider, onSlowConsumer=None):
+        """Create something to use in place of a WriteThread which sends using this loop"""
+        return LoopWriter(self, idProvider, onSlowConsumer)
+
+    def wantsToWrite(self, writer):
+        """Note that writer has something to send"""
+        with self._lock:
+            self._writers.add(writer)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeSender.send('x')
+        except socket.error:
+            # The buffer is full so the loop is going to wake up anyway.
+            pass
+
+    def stop(self):
+        self.shouldStop = True
+        self._wake()
+
+    def run(self):
+        while not self.shouldStop:
+            with self._lock:
+                listeners = dict(self._listeners)
+                connections = dict(self._connections)
+                # Writers without a socket have been stopped (or will ask again when they get one).
+                self._writers = set(writer for writer in self._writers if writer.sock is not None)
+                writers = dict((writer.sock, writer) for writer in self._writers)
+
+            try:
+                (readable, writable, dummy_exceptional) = select.select(
+                    [self._wakeReceiver] + listeners.keys() + connections.keys(), writers.keys(), [], self.timeout)
+            except (select.error, socket.error):
+                # A socket was probably closed by another thread, forget about it and try again.
+                self._forgetClosedSockets()
+                continue
+
+            for sock in readable:
+                if sock is self._wakeReceiver:
+                    self._drainWakeups()
+                elif sock in listeners:
+                    self._call(listeners[sock])
+                else:
+                    self._read(sock, connections[sock])
+
+            for sock in writable:
+                writer = writers[sock]
+                if writer.writeSome():
+                    with self._lock:
+                        writer.finishedWriting(self._writers)
+
+    def _drainWakeups(self):
+        try:
+            while self._wakeReceiver.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    @staticmethod
+    def _call(func, *args):
+        """Call func without letting an exception out and stopping the loop (and all the other connections)"""
+        try:
+            func(*args)
+        except Exception:  # pylint:disable=broad-except
+            traceback.print_exc()
+
+    def _read(self, sock, loopConnection):
+        with self._lock:
+            if self._connections.get(sock) is not loopConnection:
+                # unregistered since we started waiting
+                return
+
+        try:
+            receivedCount = loopConnection.received.recvFrom(sock)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            receivedCount = 0
+
+        if receivedCount == 0:
+            self.unregister(sock)
+            self._call(loopConnection.connection.onDisconnect)
+            return
+
+        self._call(dispatchLines, loopConnection.connection, loopConnection.received.takeMessages())
+
+    def _forgetClosedSockets(self):
+        def isOpen(sock):
+            try:
+                sock.fileno()
+                select.select([sock], [], [], 0)
+                return True
+            except (select.error, socket.error):
+                return False
+
+        with self._lock:
+            for sock in [sock for sock in self._listeners if not isOpen(sock)]:
+                del self._listeners[sock]
+            for sock in [sock for sock in self._connections if not isOpen(sock)]:
+                del self._connections[sock]
+            for writer in [writer for writer in self._writers if writer.sock is not None and not isOpen(writer.sock)]:
+                self._writers.discard(writer)
+
+
+class _LoopConnection(object):
+    """A connection registered with an EventLoop and what we have received from it so far"""
+    __slots__ = ('connection', 'received')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.received = LineBuffer()
+
+
+class LoopWriter(object):
+    """Stands in for a WriteThread when the writing is done by an EventLoop.
+    It doesn't send heartbeats so it is only suitable for connections without a heartbeatInterval.
+
+    Messages wait in an OutboundQueue and are only encoded into outgoing once the socket has taken what was there before,
+    so that superseded snapshots are dropped rather than sent to a connection which is behind.
+    """
+    # Encode up to this much from the queue at a time, which is plenty to fill the socket's buffer.
+    maxOutgoing = 64 * 1024
+
+    def __init__(self, eventLoop, idProvider, onSlowConsumer=None):
+        self.eventLoop = eventLoop
+        self.idProvider = idProvider
+        self.onSlowConsumer = onSlowConsumer
+        self.sock = None  # this will be set by setSocket
+        self.queue = OutboundQueue()
+        self.outgoing = bytearray()
+        # Whether to send the messages which have a binary form as binary frames
+        self.binary = False
+        # Held while timestamping and queueing a message so that messages are sent in the order they were stamped.
+        self.queueLock = Lock()
+
+        # Counters like a WriteThread's. Each call to writeSome which sends something counts as a batch.
+        self.batchesSent = 0
+        self.sendCalls = 0
+        self.bytesSent = 0
+
+    def queueMessage(self, msg):
+        with self.queueLock:
+            queued = self.queue.put(Event(msg, self.idProvider(), time.time()))
+        self._queued(queued)
+
+    def queuePrepared(self, prepared):
+        with self.queueLock:
+            queued = self.queue.put(prepared)
+        self._queued(queued)
+
+    queueEvent = queuePrepared
+
+    def _queued(self, queued):
+        if queued:
+            self.eventLoop.wantsToWrite(self)
+        elif self.onSlowConsumer:
+            self.onSlowConsumer()
+
+    def stats(self):
+        stats = self.queue.stats()
+        stats.update(batchesSent=self.batchesSent, sendCalls=self.sendCalls, bytesSent=self.bytesSent)
+        return stats
+
+    def setSocket(self, sock):
+        self.sock = sock
+        self.eventLoop.wantsToWrite(self)
+
+    def stop(self, wait=True):  # pylint: disable=unused-argument
+        # There is no thread to wait for.
+        with self.queueLock:
+            del self.outgoing[:]
+            self.queue = OutboundQueue()
+            self.sock = None
+
+    def writeSome(self):
+        """Send as much as the socket will take without blocking, returning True if there is nothing left to send"""
+        with self.queueLock:
+            self._encodeQueued()
+            if self.outgoing and self.sock is not None:
+                try:
+                    sent = self.sock.send(self.outgoing)
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        return False
+                    # The loop will notice the disconnection when it next reads, there's no point keeping this.
+                    print("Unexpected error sending:", e)
+                    sent = len(self.outgoing)
+                else:
+                    self.sendCalls += 1
+                    self.batchesSent += 1
+                    self.bytesSent += sent
+                del self.outgoing[:sent]
+            return not self.outgoing and self.queue.empty()
+
+    def _encodeQueued(self):
+        """Move messages from the queue to outgoing. Hold queueLock while calling this."""
+        try:
+            while len(self.outgoing) < self.maxOutgoing:
+                self.outgoing += encodeQueued(self.queue.get_nowait(), self.binary)
+        except Queue.Empty:
+            pass
+
+    def finishedWriting(self, writers):
+        """Remove ourselves from the loop's set of writers unless something has been queued since we finished"""
+        with self.queueLock:
+            if not self.outgoing and self.queue.empty():
+                writers.discard(self)
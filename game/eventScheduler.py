@@ -0,0 +1,138 @@
+from __future__ import print_function
+
+import heapq
+import itertools
+import time
+import traceback
+from threading import Thread, Condition
+
+from eventIndex import EventIndex
+
+
+class FutureEventQueue(object):
+    """The events which are due to happen in the future, ordered by serverTime.
+
+    This is a min-heap so adding an event and taking the next due event are O(log n).
+    Cancelled events are left in the heap as tombstones and skipped when they reach the top.
+    Events are also indexed by type and player so they can be found with find().
+    """
+
+    def __init__(self):
+        # entries are [serverTime, sequence, event], event is None once it has been cancelled.
+        # The sequence number keeps events with the same serverTime in the order they were added.
+        self._heap = []
+        self._entries = {}
+        self._index = EventIndex()
+        self._sequence = itertools.count()
+
+    def push(self, event):
+        entry = [event.serverTime, next(self._sequence), event]
+        self._entries[id(event)] = entry
+        self._index.add(event)
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, event):
+        """Cancel an event, returns whether it was still waiting to happen"""
+        entry = self._entries.pop(id(event), None)
+        if entry is None:
+            return False
+        self._index.remove(event)
+        entry[2] = None
+        return True
+
+    def find(self, eventType=None, player=None):
+        """Return the events of eventType for player (either can be None to match anything) in no particular order"""
+        return self._index.find(eventType, player)
+
+    def _dropTombstones(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+    def nextTime(self):
+        """The serverTime of the next event or None if there are no events"""
+        self._dropTombstones()
+        if self._heap:
+            return self._heap[0][0]
+        else:
+            return None
+
+    def popDue(self, currTime):
+        """Remove and return all events which are due at currTime, in order"""
+        due = []
+        self._dropTombstones()
+        while self._heap and self._heap[0][0] <= currTime:
+            entry = heapq.heappop(self._heap)
+            del self._entries[id(entry[2])]
+            self._index.remove(entry[2])
+            due.append(entry[2])
+            self._dropTombstones()
+        return due
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, event):
+        return id(event) in self._entries
+
+    def __iter__(self):
+        """Iterate over the events in the order they are due. This is O(n log n) so don't use it on a hot path."""
+        return iter([entry[2] for entry in sorted(self._entries.values())])
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "FutureEventQueue(%s)" % (list(self),)
+
+
+class EventScheduler(Thread):
+    """A single long-lived thread which calls a callback when the earliest requested time has passed.
+    Call wakeAt to request a callback, there is only ever one pending wake-up time so the callback
+    should call wakeAt again if it still has something to wait for.
+    """
+
+    def __init__(self, callback):
+        super(EventScheduler, self).__init__(group=None)
+        self.setDaemon(True)
+        self.name = "Event Scheduler Thread"
+        self.callback = callback
+        self.condition = Condition()
+        self.wakeTime = None
+        self.shouldStop = False
+
+    def wakeAt(self, wakeTime):
+        """Make sure the callback is called no later than wakeTime"""
+        with self.condition:
+            if self.wakeTime is None or wakeTime < self.wakeTime:
+                self.wakeTime = wakeTime
+                self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.shouldStop:
+                    if self.wakeTime is None:
+                        self.condition.wait()
+                    else:
+                        delay = self.wakeTime - time.time()
+                        if delay <= 0:
+                            break
+                        self.condition.wait(delay)
+                if self.shouldStop:
+                    return
+                self.wakeTime = None
+
+            # Don't hold the condition while calling back as the callback is likely to call wakeAt.
+            try:
+                self.callback()
+            except Exception:  # pylint: disable=broad-except
+                # Keep going, otherwise no future events would ever be applied again.
+                traceback.print_exc()
+
+    def stop(self):
+        """Stop calling back. This blocks until a callback which is in progress has finished."""
+        with self.condition:
+            self.shouldStop = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,73 @@
+from player import Player
+
+
+class FiringInterval(object):
+    """A trigger which is being held down.
+
+    The first shot is at startTime and then there is one every repeatRate seconds until the
+    trigger is released, the player runs out of ammo or dies. Rather than having an event
+    for every shot, the shots are worked out from the interval for whatever time they are needed.
+
+    shotsSettled is how many of the shots have already been taken off the player. Anything which
+    changes the player (or stops the shooting) should settle the interval up to its time first.
+
+    This is immutable, settle() returns a new interval.
+    """
+
+    def __init__(self, startTime, repeatRate, shotsSettled=1, countStats=True):
+        self.startTime = startTime
+        self.repeatRate = repeatRate
+        self.shotsSettled = shotsSettled
+        # Only the server keeps stats.
+        self.countStats = countStats
+
+    def shotsDueBy(self, serverTime):
+        """How many shots the trigger would have fired by serverTime if the player had unlimited ammo"""
+        if serverTime < self.startTime:
+            return 0
+        # Allow for rounding errors so that a shot counts at exactly its shotTime().
+        return int((serverTime - self.startTime) / float(self.repeatRate) + 1e-9) + 1
+
+    def shotTime(self, shotNumber):
+        """The time of a shot, counting from 0 for the shot when the trigger was pressed"""
+        return self.startTime + shotNumber * self.repeatRate
+
+    def unsettledShots(self, player, serverTime):
+        """How many shots have been fired by serverTime which haven't been taken off the player yet"""
+        if player.health <= 0:
+            return 0
+        return max(0, min(self.shotsDueBy(serverTime) - self.shotsSettled, player.ammo))
+
+    def isFiringAt(self, player, serverTime):
+        """Whether every shot due by serverTime has actually been fired, i.e. we haven't run out of ammo or died"""
+        return player.health > 0 and self.shotsDueBy(serverTime) - self.shotsSettled <= player.ammo
+
+    def settle(self, player, serverTime):
+        """Take the shots fired by serverTime off the player.
+        Returns the updated player and interval, the interval is None if the shooting has stopped.
+        """
+        shots = self.unsettledShots(player, serverTime)
+        stopped = not self.isFiringAt(player, serverTime)
+        if shots:
+            player = Player(copy_from=player, ammo=player.ammo - shots)
+            if self.countStats:
+                player = Player(copy_from=player, stats={'shots_fired': player.stats.shots_fired + shots})
+
+        if stopped:
+            return (player, None)
+        return (player, FiringInterval(self.startTime, self.repeatRate, self.shotsSettled + shots, self.countStats))
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.__dict__ == other.__dict__
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "FiringInterval(%s, %s, %s)" % (self.startTime, self.repeatRate, self.shotsSettled)
@@ -1,10 +1,16 @@
 from __future__ import print_function
 from gameState import CS_OFFLINE, CS_UNINITIALISED, CS_INITIALISING, CS_ESTABLISHED
 from player import Player
+from firingInterval import FiringInterval
 
 
 class GameEvent(object):
     """An event in the game. Not to be confused with the class representing the string passed over the wire between client and server"""
+
+    # Transient events don't change the game state, they only tell listeners about something which
+    # already follows from it. They are applied once when they are due and never kept for replaying.
+    transient = False
+
     def __init__(self, serverTime):
         self.serverTime = serverTime
 
@@ -48,6 +54,13 @@ class GameEndedEvent(GameEvent):
         super(GameEndedEvent, self).__init__(serverTime)
 
     def apply(self, gameState):
+        # Nobody fires any more shots once the game has ended.
+        for key in list(gameState.currGameState.firing.keys()):
+            player = gameState.currGameState.players.get(key)
+            if player:
+                _settleFiring(gameState, player, self.serverTime)
+        gameState.currGameState.firing.clear()
+
         gameState.endGame()
 
 
@@ -59,7 +72,28 @@ class ClientGameEvent(GameEvent):
         self.recvTeam = recvTeam
 
 
+def _settleFiring(gameState, player, serverTime):
+    """Take any shots from a trigger the player is holding down up to serverTime off the player.
+    This should be done before anything else changes the player. Returns the updated player.
+    """
+    key = (player.team_id, player.player_id)
+    interval = gameState.currGameState.firing.get(key)
+    if interval is None:
+        return player
+
+    (player, interval) = interval.settle(player, serverTime)
+    gameState.currGameState.players[key] = player
+    if interval is None:
+        del gameState.currGameState.firing[key]
+    else:
+        gameState.currGameState.firing[key] = interval
+    return player
+
+
 class FireEvent(ClientGameEvent):
+    """The trigger being pressed. This fires one shot and, if the gun repeats, starts a FiringInterval
+    which fires the rest until a TriggerReleaseEvent.
+    """
     repeatRate = 1  # seconds per shot
 
     def __init__(self, serverTime, recvTeam, recvPlayerId):
@@ -89,6 +123,10 @@ class FireEvent(ClientGameEvent):
 
         # print("Applying FireEvent to", player)
 
+        # A new press replaces any trigger which we didn't see being released.
+        player = _settleFiring(gameState, player, self.serverTime)
+        gameState.currGameState.firing.pop((player.team_id, player.player_id), None)
+
         if player.ammo > 0 and player.health > 0:
             player = Player(copy_from=player, ammo=player.ammo - 1)
 
@@ -100,10 +138,57 @@ class FireEvent(ClientGameEvent):
             # Let listeners know this has just been processed
             gameState.notifyFiredListeners()
             # TODO: lookup repeatRate from the player and what their gun does.
-            if self.repeatRate > 0 and self.firstApplication:
-                # Add the next event
-                self.firstApplication = False
-                return FireEvent(self.serverTime + self.repeatRate, self.recvTeam, self.recvPlayerId)
+            if self.repeatRate > 0:
+                interval = FiringInterval(self.serverTime, self.repeatRate, countStats=not gameState.isClient)
+                gameState.currGameState.firing[(player.team_id, player.player_id)] = interval
+
+                if gameState.isClient and self.firstApplication:
+                    # Tell the gun when to fire the next shot
+                    self.firstApplication = False
+                    return ShotTickEvent(interval.shotTime(1), self.recvTeam, self.recvPlayerId, self.serverTime)
+
+
+class TriggerReleaseEvent(ClientGameEvent):
+    """The trigger being released, which stops the shots from the FiringInterval started when it was pressed."""
+    def apply(self, gameState):
+        if gameState.isClient:
+            if gameState.clientState != CS_ESTABLISHED:
+                return
+            player = gameState.getMainPlayer()
+        else:
+            player = gameState.getOrCreatePlayer(self.recvTeam, self.recvPlayerId)
+
+        player = _settleFiring(gameState, player, self.serverTime)
+        gameState.currGameState.firing.pop((player.team_id, player.player_id), None)
+
+
+class ShotTickEvent(ClientGameEvent):
+    """A shot from a held trigger is due so tell the gun to fire it. Client only.
+
+    The shot itself is worked out from the FiringInterval so this doesn't change the state.
+    """
+    transient = True
+
+    def __init__(self, serverTime, recvTeam, recvPlayerId, startTime):
+        super(ShotTickEvent, self).__init__(serverTime, recvTeam, recvPlayerId)
+        # When the trigger was pressed, so we can tell if it has been released and pressed again since.
+        self.startTime = startTime
+
+    def apply(self, gameState):
+        if gameState.clientState != CS_ESTABLISHED:
+            return
+        player = gameState.getMainPlayer()
+        interval = gameState.currGameState.firing.get((player.team_id, player.player_id))
+        if interval is None or interval.startTime != self.startTime:
+            # The trigger has been released since this was scheduled.
+            return
+        if not interval.isFiringAt(player, self.serverTime):
+            # Out of ammo or dead.
+            return
+
+        gameState.notifyFiredListeners()
+        nextShotTime = interval.shotTime(interval.shotsDueBy(self.serverTime))
+        return ShotTickEvent(nextShotTime, self.recvTeam, self.recvPlayerId, self.startTime)
 
 
 class HitEvent(ClientGameEvent):
@@ -118,11 +203,11 @@ class HitEvent(ClientGameEvent):
             if gameState.clientState != CS_ESTABLISHED:
                 # Don't apply a hit to an uninitialised player.
                 return
-            toPlayer = gameState.getMainPlayer()
+            toPlayer = _settleFiring(gameState, gameState.getMainPlayer(), self.serverTime)
             fromPlayer = None
         else:
-            toPlayer = gameState.getOrCreatePlayer(self.recvTeam, self.recvPlayerId)
-            fromPlayer = gameState.getOrCreatePlayer(self.sentTeam, self.sentPlayerId)
+            fromPlayer = _settleFiring(gameState, gameState.getOrCreatePlayer(self.sentTeam, self.sentPlayerId), self.serverTime)
+            toPlayer = _settleFiring(gameState, gameState.getOrCreatePlayer(self.recvTeam, self.recvPlayerId), self.serverTime)
 
         if not gameState.isGameStarted():
             print("hit before game started")
@@ -136,6 +221,9 @@ class HitEvent(ClientGameEvent):
             origToPlayer = toPlayer
             toPlayer = toPlayer.reduceHealth(self.damage)
             died = origToPlayer != toPlayer and toPlayer.health == 0
+            if died:
+                # Dead players don't keep shooting.
+                gameState.currGameState.firing.pop((toPlayer.team_id, toPlayer.player_id), None)
             if not gameState.isClient:
                 toPlayer = Player(copy_from=toPlayer, stats={'hits_received': toPlayer.stats.hits_received + 1})
                 fromPlayer = Player(copy_from=fromPlayer, stats={'hits_given': fromPlayer.stats.hits_given + 1})
@@ -163,6 +251,10 @@ class SetMainPlayerEvent(GameEvent):
         self.player = player
 
     def apply(self, gameState):
+        # The snapshot includes any shots fired up to now.
+        mainPlayer = gameState.getMainPlayer()
+        if mainPlayer:
+            _settleFiring(gameState, mainPlayer, self.serverTime)
         gameState.setMainPlayer(self.player)
 
 
@@ -1,29 +1,83 @@
 from __future__ import print_function
-from gameEvents import FireEvent, HitEvent, GameStartedEvent, GameEndedEvent, SetMainPlayerEvent, SetParametersEvent
+from contextlib import contextmanager
+import threading
+
+from gameEvents import FireEvent, TriggerReleaseEvent, HitEvent, GameStartedEvent, GameEndedEvent, SetMainPlayerEvent, SetParametersEvent
 
 
 class GameLogic(object):
     def __init__(self, gameState):
         super(GameLogic, self).__init__()
         self.gameState = gameState
+        # Each thread has its own batch (if it is in one) so other threads' events don't get caught up in it.
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        """Collect the events from the calls made inside this block and add them to the gameState
+        all at once when it finishes, so that many late events only cause one re-apply.
+        """
+        if getattr(self._local, 'batch', None) is not None:
+            # Already in a batch, the outer one will add our events.
+            yield
+            return
+
+        self._local.batch = []
+        try:
+            yield
+        finally:
+            events = self._local.batch
+            self._local.batch = None
+            self._addEvents(events)
+
+    def _addEvent(self, event):
+        batch = getattr(self._local, 'batch', None)
+        if batch is None:
+            self._addEvents([event])
+        else:
+            batch.append(event)
+
+    def _addEvents(self, events):
+        with self.gameState.stateLock:
+            for event in events:
+                self._clampToConfidencePoint(event)
+            if len(events) == 1:
+                self.gameState.addEvent(events[0])
+            else:
+                self.gameState.addEvents(events)
+
+    def _clampToConfidencePoint(self, event):
+        """Events from a connection which we gave up waiting for can be from before the confidence point.
+        It is too late to put them where they belong so treat them as happening at the confidence point."""
+        confidencePoint = self.gameState.confidencePoint
+        if event.serverTime < confidencePoint:
+            print("Event at", event.serverTime, "is before the confidence point, treating it as at", confidencePoint)
+            event.serverTime = confidencePoint
+
+    def _flushBatch(self):
+        """Add any events which have been batched so far, e.g. so they can be cancelled."""
+        batch = getattr(self._local, 'batch', None)
+        if batch:
+            self._local.batch = []
+            self._addEvents(batch)
 
     def trigger(self, serverTime, recvTeam, recvPlayer):
-        self.gameState.addEvent(FireEvent(serverTime, recvTeam, recvPlayer))
+        self._addEvent(FireEvent(serverTime, recvTeam, recvPlayer))
 
-    def triggerRelease(self, serverTime, _recvTeam, _recvPlayer):
-        # cancel all fire events after we release the trigger.
-        self.gameState.cancelEvent(lambda e: isinstance(e, FireEvent) and e.serverTime > serverTime)
+    def triggerRelease(self, serverTime, recvTeam, recvPlayer):
+        self._addEvent(TriggerReleaseEvent(serverTime, recvTeam, recvPlayer))
 
     def hit(self, serverTime, recvTeam, recvPlayerId, sentTeam, sentPlayerId, damage):
-        self.gameState.addEvent(HitEvent(serverTime, recvTeam, recvPlayerId, sentTeam, sentPlayerId, damage))
+        self._addEvent(HitEvent(serverTime, recvTeam, recvPlayerId, sentTeam, sentPlayerId, damage))
 
     # TODO: should we take serverTime or just use time.time()
     def startGame(self, serverTime, duration=0):
-        self.gameState.addEvent(GameStartedEvent(serverTime, duration))
+        self._addEvent(GameStartedEvent(serverTime, duration))
 
     def stopGame(self, serverTime):
-        self.gameState.cancelEvent(lambda e: isinstance(e, GameEndedEvent) and e.serverTime > serverTime)
-        self.gameState.addEvent(GameEndedEvent(serverTime))
+        self._flushBatch()
+        self.gameState.cancelEvents(GameEndedEvent, after=serverTime)
+        self._addEvent(GameEndedEvent(serverTime))
 
     # TODO:
     def resetGame(self, serverTime):
@@ -32,10 +86,10 @@ class GameLogic(object):
     #############
     # Client Only
     def setMainPlayer(self, serverTime, player):
-        self.gameState.addEvent(SetMainPlayerEvent(serverTime, player))
+        self._addEvent(SetMainPlayerEvent(serverTime, player))
 
     def setPlayerSnapshot(self, serverTime, player):
-        self.gameState.addEvent(SetMainPlayerEvent(serverTime, player))
+        self._addEvent(SetMainPlayerEvent(serverTime, player))
 
     def setParametersSnapshot(self, serverTime, parameters):
-        self.gameState.addEvent(SetParametersEvent(serverTime, parameters))
+        self._addEvent(SetParametersEvent(serverTime, parameters))
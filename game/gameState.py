@@ -1,14 +1,20 @@
 from __future__ import print_function
 import time
-from copy import deepcopy
-from threading import Timer, RLock
+from bisect import bisect_right
+from threading import RLock
 
 from player import Player
 from parameters import Parameters
+from persistentMap import PersistentMap
+from eventScheduler import EventScheduler, FutureEventQueue
+from uncertainEventList import UncertainEventList
 
 # initial game settings, these are told to the clients and can be changed in the UI.
 TEAM_COUNT = 2
 
+# How many uncertain events are applied between each checkpoint of the game state.
+CHECKPOINT_INTERVAL = 32
+
 # Client states
 CS_OFFLINE = "CS_OFFLINE"  # Not yet connected to the server
 CS_UNINITIALISED = "CS_UNINITIALISED"  # Not yet added to game
@@ -16,19 +22,39 @@ CS_INITIALISING = "CS_INITIALISING"  # Being added to game
 CS_ESTABLISHED = "CS_ESTABLISHED"  # Added to game
 
 
-class Stats():
+class Stats(object):
     def __init__(self):
-        self.teamPoints = {}
+        self._teamPoints = {}
+        # Whether _teamPoints is shared with a clone and so must be copied before it is used.
+        self._sharedTeamPoints = False
+
+    @property
+    def teamPoints(self):
+        """map from team to the points they have scored.
+        This is a plain dict which callers can change so we take our own copy if we were sharing it with a clone.
+        """
+        if self._sharedTeamPoints:
+            self._teamPoints = dict(self._teamPoints)
+            self._sharedTeamPoints = False
+        return self._teamPoints
+
+    def clone(self):
+        """Take a copy of these stats in constant time"""
+        other = Stats()
+        other._teamPoints = self._teamPoints
+        other._sharedTeamPoints = True
+        self._sharedTeamPoints = True
+        return other
 
     def __str__(self):
-        return "Stats(%s)" % (str(self.__dict__),)
+        return "Stats(%s)" % (str(self.toSimpleTypes()),)
 
     def __repr__(self):
         return self.__str__()
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self._teamPoints == other._teamPoints
         else:
             return False
 
@@ -36,20 +62,24 @@ class Stats():
         return not self.__eq__(other)
 
     def toSimpleTypes(self):
-        return self.__dict__
+        return {'teamPoints': self.teamPoints}
 
 
-# TODO: Can we make this (and Player) immutable and have events create a new one based on their changes?
 class MomentaryGameState(object):
     """The state of the game at any given moment in time.
     This is mutable and you should be careful that you only use instances of this
     class when it is guaranteed not to be being changed by another thread trying to
     recalculate the current state.
+
+    Copies are taken with clone() which is constant time: the players, stats and parameters
+    are shared between the copies until one of them changes them.
     """
 
     def __init__(self):
-        # map from (team, player) to the Player instance
-        self.players = {}
+        # map from (team, player) to the (immutable) Player instance
+        self.players = PersistentMap()
+        # map from (team, player) to the (immutable) FiringInterval of a trigger they are holding down.
+        self.firing = PersistentMap()
         self.teamCount = 0
         self.largestTeam = 0
         self.targetTeamCount = TEAM_COUNT
@@ -61,6 +91,37 @@ class MomentaryGameState(object):
         self.gameTime = 1200  # 20 mins
         self.gameEndTime = None
 
+    def playerAt(self, key, serverTime):
+        """The player with key as they are at serverTime, including any shots fired by a trigger
+        they are still holding down. Returns None if there is no such player.
+        """
+        player = self.players.get(key)
+        if player is None:
+            return None
+        interval = self.firing.get(key)
+        if interval is not None:
+            (player, _) = interval.settle(player, serverTime)
+        return player
+
+    def writtenKeys(self):
+        """The (team, player) keys of the players (or their triggers) which have been changed
+        since this state was cloned or takeWrittenKeys was last called."""
+        return self.players.writtenKeys() | self.firing.writtenKeys()
+
+    def takeWrittenKeys(self):
+        """Return the written keys and start recording afresh"""
+        return self.players.takeWrittenKeys() | self.firing.takeWrittenKeys()
+
+    def clone(self):
+        """Take a copy of this state in constant time"""
+        other = MomentaryGameState.__new__(MomentaryGameState)
+        other.__dict__.update(self.__dict__)
+        other.players = self.players.clone()
+        other.firing = self.firing.clone()
+        other.stats = self.stats.clone()
+        other.parameters = self.parameters.clone()
+        return other
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.__dict__ == other.__dict__
@@ -71,6 +132,74 @@ class MomentaryGameState(object):
         return not self.__eq__(other)
 
 
+class Checkpoints(object):
+    """Copies of the game state taken part way through the uncertain events.
+    A checkpoint at index i is the state after applying the first i uncertain events to the baseline,
+    so a late event only needs to be replayed from the nearest checkpoint before it.
+
+    The stored states are never modified, take a copy before applying events to them.
+
+    Each checkpoint also has the keys of the players which were written between the previous
+    checkpoint and it, so we know which players a re-apply might have changed.
+    """
+
+    def __init__(self):
+        self.indexes = []
+        self.states = []
+        self.writtenKeys = []
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def lastIndex(self):
+        """The index of the latest checkpoint (the baseline counts as index 0)"""
+        if self.indexes:
+            return self.indexes[-1]
+        else:
+            return 0
+
+    def add(self, index, state, writtenKeys):
+        """Add a checkpoint, this must be later than all of the existing ones"""
+        self.indexes.append(index)
+        self.states.append(state)
+        self.writtenKeys.append(writtenKeys)
+
+    def latestAtOrBefore(self, index):
+        """Return an (index, state) tuple for the latest checkpoint at or before index or (0, None) if there isn't one"""
+        i = bisect_right(self.indexes, index)
+        if i == 0:
+            return (0, None)
+        return (self.indexes[i - 1], self.states[i - 1])
+
+    def writtenSince(self, index):
+        """The keys of the players written between the checkpoint at index and the last checkpoint"""
+        written = set()
+        for keys in self.writtenKeys[bisect_right(self.indexes, index):]:
+            written.update(keys)
+        return written
+
+    def truncate(self, index):
+        """Forget all checkpoints after index as the events after it have changed"""
+        i = bisect_right(self.indexes, index)
+        del self.indexes[i:]
+        del self.states[i:]
+        del self.writtenKeys[i:]
+
+    def rebase(self, index):
+        """The first index events have become certain.
+        Forget the checkpoints which are no longer in the uncertain window and shift the rest to match
+        """
+        i = bisect_right(self.indexes, index)
+        self.indexes = [cpIndex - index for cpIndex in self.indexes[i:]]
+        self.states = self.states[i:]
+        self.writtenKeys = self.writtenKeys[i:]
+
+    def clear(self):
+        self.indexes = []
+        self.states = []
+        self.writtenKeys = []
+
+
 class GameState(object):
     """A store of all of the gamestate which the server knows about.
     There is only one instance of this class on the server.
@@ -88,8 +217,12 @@ class GameState(object):
     all events up to a point (the confidence point) effectively moving events
     from the uncertain past to the certain past.
 
-    We maintain a timer which applies future events when they are due,
-    moving them to the uncertain past.
+    We also keep checkpoints of the state every CHECKPOINT_INTERVAL uncertain events
+    so that an event which arrives late only needs the events after the nearest
+    checkpoint to be re-applied rather than all of the uncertain events.
+
+    Future events are kept in a heap ordered by when they are due and a single
+    scheduler thread applies them when they are due, moving them to the uncertain past.
     """
 
     def __init__(self, isClient=False):
@@ -102,11 +235,11 @@ class GameState(object):
         self.stateLock = RLock()
 
         self.confidencePoint = 0
-        self.uncertainEvents = []
+        self.uncertainEvents = UncertainEventList()
+        self.checkpoints = Checkpoints()
 
-        self.nextFutureEventTime = 0
-        self.futureEvents = []
-        self.nextFutureEventTimer = None
+        self.futureEvents = FutureEventQueue()
+        self.scheduler = None  # created when the first future event is added
 
         self.pauseListeners = False
         self.stateChangedListeners = []
@@ -118,6 +251,7 @@ class GameState(object):
         self.connectionsChangedListeners = []
         self.playerInitialisingListeners = []
         self.playerInitialisedListeners = []
+        self.playerOutOfContactListeners = []
 
     ####################
     # # Players and teams
@@ -136,6 +270,16 @@ class GameState(object):
                 # self.playerAdded.emit(sentTeam, sentPlayer)
             return self.currGameState.players[(sentTeam, sentPlayer)]
 
+    def getCurrentPlayer(self, teamID, playerID):
+        """
+        Get the (immutable) Player object as they are right now.
+
+        Unlike getOrCreatePlayer this includes the shots from a trigger they are still holding down,
+        so use this for showing the player rather than in events.
+        """
+        with self.stateLock:
+            return self.currGameState.playerAt((teamID, playerID), time.time())
+
     def createNewPlayer(self):
         with self.stateLock:
             created_player = self._createNewPlayer0()
@@ -163,6 +307,8 @@ class GameState(object):
             self.currGameState.players[(dstTeamID, dstPlayerID)] = player
             # TODO: should we reset their stats.
             del self.currGameState.players[(srcTeamID, srcPlayerID)]
+            if (srcTeamID, srcPlayerID) in self.currGameState.firing:
+                self.currGameState.firing[(dstTeamID, dstPlayerID)] = self.currGameState.firing.pop((srcTeamID, srcPlayerID))
 
             if dstTeamID > self.currGameState.teamCount:
                 self.currGameState.teamCount = dstTeamID
@@ -190,6 +336,7 @@ class GameState(object):
                 return
 
             del self.currGameState.players[(teamID, playerID)]
+            self.currGameState.firing.pop((teamID, playerID), None)
 
             if teamID == self.currGameState.teamCount:
                 # check if this was the only player in this team
@@ -304,7 +451,7 @@ class GameState(object):
 
     def setParameters(self, parameters):
         with self.stateLock:
-            newParameters = deepcopy(parameters)
+            newParameters = parameters.clone()
             # First make sure this parameters object has listeners still
             newParameters.listeners = self.currGameState.parameters.listeners
 
@@ -352,77 +499,52 @@ class GameState(object):
             currentServerTime = time.time()
             if event.serverTime > currentServerTime:
                 self._addFutureEvent(event)
+            elif event.transient:
+                self._applyTransientEvent(event)
             else:
                 self._addPastEvent(event)
 
+    def _applyTransientEvent(self, event):
+        """Transient events don't change the state so there is nothing to replay, just apply them once."""
+        newEvent = event.apply(self)
+        if newEvent:
+            self.addEvent(newEvent)
+
     def _addFutureEvent(self, event):
-        self.futureEvents.append(event)
-        self._recheckTimer()
+        self.futureEvents.push(event)
+        self._getScheduler().wakeAt(self.futureEvents.nextTime())
 
-    def _recheckTimer(self):
-        with self.stateLock:
-            if self.nextFutureEventTimer:
-                self.nextFutureEventTimer.cancel()
-                self.nextFutureEventTimer = None
-
-            nextEvent = None
-            currTime = time.time()
-            # Process any overdue events and find the next future event
-            for e in self.futureEvents[:]:
-                if e.serverTime <= currTime:
-                    # remove from futureEvents then apply immediately
-                    # Note this must be this way round as addEvent calls this
-                    self.futureEvents.remove(e)
-                    self.addEvent(e)
-                else:
-                    # check if this is the earliest event we have seen
-                    if not nextEvent or nextEvent.serverTime > e.serverTime:
-                        nextEvent = e
-
-            if nextEvent:
-                self.nextFutureEventTimer = Timer(
-                    nextEvent.serverTime - currTime,
-                    lambda: self._handleFutureEventTimer(nextEvent)
-                )
-                self.nextFutureEventTimer.start()
-                # print("Waiting until " + str(nextEvent.serverTime) + " for " + str(nextEvent))
-
-    def _handleFutureEventTimer(self, nextEvent):
+    def _getScheduler(self):
+        if not self.scheduler:
+            self.scheduler = EventScheduler(self._handleFutureEvents)
+            self.scheduler.start()
+        return self.scheduler
+
+    def _handleFutureEvents(self):
+        """Apply any future events which are now due and wait for the next one."""
         with self.stateLock:
-            # check that the times are still correct
-            if nextEvent.serverTime > time.time():
-                print("Timer woke us up before it was due. trying again")
-            else:
-                # print("Handling " + str(nextEvent) + " due to timer")
-                # We are done with this timer now
-                self.nextFutureEventTimer = None
-                # Check whether we still want this event.
-                if nextEvent in self.futureEvents:
-                    # remove from futureEvents then apply immediately
-                    # Note this must be this way round as addEvent calls this
-                    self.futureEvents.remove(nextEvent)
-                    self.addEvent(nextEvent)
-            self._recheckTimer()
+            for e in self.futureEvents.popDue(time.time()):
+                # print("Handling " + str(e) + " due to timer")
+                self.addEvent(e)
+
+            nextTime = self.futureEvents.nextTime()
+            if nextTime is not None:
+                self._getScheduler().wakeAt(nextTime)
 
     def _addPastEvent(self, event):
         if event.serverTime < self.confidencePoint:
             raise RuntimeError(
                 "Tried to add a new event which is prior to the current confidence point. This doesn't make sense as the confidence point is after all possible events.")
-        elif len(self.uncertainEvents) == 0 or (event.serverTime >= self.uncertainEvents[-1].serverTime):
+
+        newIndex = self.uncertainEvents.insert(event)
+        if newIndex == len(self.uncertainEvents) - 1:
             # This is later than anything we have seen so far, just apply it now.
-            self.uncertainEvents.append(event)
             newEvent = event.apply(self)
+            self._checkpointIfDue()
             if newEvent:
                 self.addEvent(newEvent)
         else:
-            # This needs to be inserted in the appropriate position in the uncertain events list and we need to recalculate our latest state by applying all uncertainEvents to the baseline
-            newIndex = 0
-            for e in self.uncertainEvents:
-                if event.serverTime > e.serverTime:
-                    newIndex = newIndex + 1
-                else:
-                    break
-            self.uncertainEvents.insert(newIndex, event)
+            # This has been inserted in the appropriate position in the uncertain events list and we need to recalculate our latest state by re-applying the uncertainEvents after it.
 
             # Apply the event as if it happened last as a first approximation and the re-apply to see if anything changed.
             newEvents = []
@@ -432,28 +554,105 @@ class GameState(object):
                 # If this is a future event, it doesn't affect the reapply
                 # If it is a past event, it will do its own re-applying so must be added once we are done.
                 newEvents.append(newEvent)
-            self._reapplyEvents(newEvents)
+            self._reapplyEvents(newEvents, newIndex)
 
         # TODO: Do we need this? Won't applying the new event cause this (or something more specific) to have been called already?
         self._notifyStateChangedListeners()
 
-    def _reapplyEvents(self, newEvents=None):
-        """ reapply all uncertain events on top of the baseline.
+    def addEvents(self, events):
+        """Add several events at once.
+        The past events are merged into the uncertain events together and, if any of them are late,
+        we only re-apply the uncertain events once from the earliest of them rather than once per event.
+        """
+        with self.stateLock:
+            currentServerTime = time.time()
+            pastEvents = []
+            for event in events:
+                if event.serverTime > currentServerTime:
+                    self._addFutureEvent(event)
+                elif event.transient:
+                    self._applyTransientEvent(event)
+                else:
+                    pastEvents.append(event)
+
+            if len(pastEvents) <= 1:
+                for event in pastEvents:
+                    self._addPastEvent(event)
+                return
+
+            for event in pastEvents:
+                if event.serverTime < self.confidencePoint:
+                    raise RuntimeError(
+                        "Tried to add a new event which is prior to the current confidence point. This doesn't make sense as the confidence point is after all possible events.")
+
+            firstNewIndex = self.uncertainEvents.insertMany(pastEvents)
+            newEvents = []
+            if firstNewIndex == len(self.uncertainEvents) - len(pastEvents):
+                # These are all later than anything we have seen so far, just apply them in order.
+                for index in range(firstNewIndex, len(self.uncertainEvents)):
+                    newEvent = self.uncertainEvents[index].apply(self)
+                    if newEvent:
+                        newEvents.append(newEvent)
+                    self._checkpointIfDue(index + 1)
+                for newEvent in newEvents:
+                    self.addEvent(newEvent)
+            else:
+                # As with a single late event, apply the new events as a first approximation and then re-apply
+                # everything from the earliest of them, but only once.
+                for event in sorted(pastEvents, key=lambda e: e.serverTime):
+                    newEvent = event.apply(self)
+                    if newEvent:
+                        newEvents.append(newEvent)
+                self._reapplyEvents(newEvents, firstNewIndex)
+
+            self._notifyStateChangedListeners()
+
+    def _checkpointIfDue(self, appliedCount=None):
+        """Take a checkpoint of the current state if enough events have been applied since the last one.
+        appliedCount is how many of the uncertain events the current state includes, by default all of them.
+        """
+        if appliedCount is None:
+            appliedCount = len(self.uncertainEvents)
+        if appliedCount - self.checkpoints.lastIndex() >= CHECKPOINT_INTERVAL:
+            self._addCheckpoint(appliedCount)
+
+    def _addCheckpoint(self, appliedCount):
+        writtenKeys = self.currGameState.takeWrittenKeys()
+        self.checkpoints.add(appliedCount, self.currGameState.clone(), writtenKeys)
+        return writtenKeys
+
+    def _reapplyEvents(self, newEvents=None, fromIndex=0):
+        """ reapply the uncertain events from fromIndex onwards.
+            We start from the nearest checkpoint at or before fromIndex (or the baseline if there isn't one)
             This should be the last thing which is done as part of adding an event as it may recurse into addEvent at the end.
         """
         if newEvents is None:
             newEvents = []
         self.pauseListeners = True
         oldGameState = self.currGameState
-        self.currGameState = deepcopy(self.baselineGameState)
 
-        for event in self.uncertainEvents:
-            newEvent = event.apply(self)
+        (startIndex, startState) = self.checkpoints.latestAtOrBefore(fromIndex)
+        if startState is None:
+            startState = self.baselineGameState
+
+        # Only the players written since where we start, either before or during the reapply, can have changed.
+        changedKeys = self.checkpoints.writtenSince(startIndex)
+        changedKeys.update(oldGameState.writtenKeys())
+
+        # The checkpoints after where we start are about to be recalculated.
+        self.checkpoints.truncate(startIndex)
+        self.currGameState = startState.clone()
+
+        for index in range(startIndex, len(self.uncertainEvents)):
+            newEvent = self.uncertainEvents[index].apply(self)
             if newEvent:
                 # We need to add a new event but we are in the middle of reapplying.
                 # If this is a future event, it doesn't affect the reapply
                 # If it is a past event, it will do its own re-applying so must be added once we are done.
                 newEvents.append(newEvent)
+            if index + 1 - self.checkpoints.lastIndex() >= CHECKPOINT_INTERVAL:
+                changedKeys.update(self._addCheckpoint(index + 1))
+        changedKeys.update(self.currGameState.writtenKeys())
 
         # un-pause listeners as we want to be told about changes due to these new events.
         self.pauseListeners = False
@@ -461,34 +660,59 @@ class GameState(object):
         # Check if any players stats might have been corrected as a result of this reapplying.
         # Send them a snapshot in case it has.
 
-        # detect changes
-        for oldPlayer in oldGameState.players.itervalues():
-            newPlayer = self.getOrCreatePlayer(oldPlayer.team_id, oldPlayer.player_id)
+        # detect changes, including to shots from triggers which are still being held down.
+        now = time.time()
+        # All of the adjusted players share one (immutable) copy of the parameters.
+        parametersSnapshot = None
+        for key in sorted(changedKeys):
+            if key not in oldGameState.players:
+                continue
+            self.getOrCreatePlayer(*key)
+            oldPlayer = oldGameState.playerAt(key, now)
+            newPlayer = self.currGameState.playerAt(key, now)
             if oldPlayer != newPlayer:
                 print("Detected a Player in need of adjusting: ", oldPlayer, "->", newPlayer)
-                parametersSnapshot = deepcopy(self.currGameState.parameters)
+                if parametersSnapshot is None:
+                    parametersSnapshot = self.currGameState.parameters.clone()
                 self._notifyPlayerAdjustedListeners(oldPlayer.team_id, oldPlayer.player_id, newPlayer, parametersSnapshot)
 
         # add the new events
         for newEvent in newEvents:
             self.addEvent(newEvent)
 
+    def cancelEvents(self, eventType=None, player=None, after=None):
+        """Cancel the uncertain and future events which are instances of eventType, for the given
+        (team, playerId) player and later than the serverTime after. Any of these can be None to match everything.
+
+        Only the matching events are looked at and we only reapply events if an uncertain one was cancelled.
+        """
+        with self.stateLock:
+            firstCancelledIndex = None
+            for e in list(self.uncertainEvents.find(eventType, player)):
+                if after is None or e.serverTime > after:
+                    index = self.uncertainEvents.remove(e)
+                    if firstCancelledIndex is None or index < firstCancelledIndex:
+                        firstCancelledIndex = index
+            for e in list(self.futureEvents.find(eventType, player)):
+                if after is None or e.serverTime > after:
+                    self.futureEvents.cancel(e)
+            if firstCancelledIndex is not None:
+                # we need to reapply the events now that some have been removed
+                self._reapplyEvents(fromIndex=firstCancelledIndex)
+
     def cancelEvent(self, predicate):
-        """Cancel all uncertain and future events which match the given predicate"""
+        """Cancel all uncertain and future events which match the given predicate.
+        This has to check every event, use cancelEvents if you can.
+        """
         with self.stateLock:
-            cancelledAnyUncertain = False
-            for e in self.uncertainEvents[:]:
-                if predicate(e):
-                    self.uncertainEvents.remove(e)
-                    # print("Cancelled: " + str(e))
-                    cancelledAnyUncertain = True
-            for e in self.futureEvents[:]:
+            firstCancelledIndex = self.uncertainEvents.removeWhere(predicate)
+            for e in list(self.futureEvents):
                 if predicate(e):
                     # print("Cancelled: " + str(e))
-                    self.futureEvents.remove(e)
-            if cancelledAnyUncertain:
+                    self.futureEvents.cancel(e)
+            if firstCancelledIndex is not None:
                 # we need to reapply the events now that some have been removed
-                self._reapplyEvents()
+                self._reapplyEvents(fromIndex=firstCancelledIndex)
             # print("New State: " + str(self.uncertainEvents) + " / " + str(self.futureEvents))
 
     def adjustConfidencePoint(self, newConfidencePoint):
@@ -498,27 +722,30 @@ class GameState(object):
             if len(self.uncertainEvents) == 0:
                 # Nothing to do
                 self.confidencePoint = newConfidencePoint
-            elif newConfidencePoint > self.uncertainEvents[len(self.uncertainEvents) - 1].serverTime:
+            elif newConfidencePoint > self.uncertainEvents.lastTime():
                 # new confidence point is later than all received events, just use the latest state as the baseline one.
-                self.baselineGameState = deepcopy(self.currGameState)
-                self.uncertainEvents = []
+                self.baselineGameState = self.currGameState.clone()
+                self.uncertainEvents.clear()
+                self.checkpoints.clear()
                 self.confidencePoint = newConfidencePoint
             else:
-                # new confidence point in the middle of our uncertain events. Rewind to our old confidence point, apply forward to our new confidence point and save that as baseline.
+                # new confidence point in the middle of our uncertain events.
+                # Rewind to the nearest checkpoint (or our old confidence point), apply forward to our new confidence point and save that as baseline.
                 self.pauseListeners = True
                 latestGameState = self.currGameState
-                self.currGameState = self.baselineGameState
-                confidencePointIndex = 0
-                for e in self.uncertainEvents:
-                    if e.serverTime > newConfidencePoint:
-                        # too far into the future
-                        break
-                    else:
-                        confidencePointIndex = confidencePointIndex + 1
-                        e.apply(self)
+                confidencePointIndex = self.uncertainEvents.countUpTo(newConfidencePoint)
+
+                (startIndex, startState) = self.checkpoints.latestAtOrBefore(confidencePointIndex)
+                if startState is None:
+                    startState = self.baselineGameState
+                # The checkpoint is about to be dropped so we can use it as the new baseline without copying it.
+                self.currGameState = startState
+                for e in self.uncertainEvents[startIndex:confidencePointIndex]:
+                    e.apply(self)
 
                 if confidencePointIndex > 0:
-                    self.uncertainEvents = self.uncertainEvents[confidencePointIndex:]
+                    self.uncertainEvents.dropBefore(confidencePointIndex)
+                    self.checkpoints.rebase(confidencePointIndex)
                 self.baselineGameState = self.currGameState
                 # Now fast-forward to where we were when we started this calculation.
                 self.currGameState = latestGameState
@@ -526,6 +753,11 @@ class GameState(object):
 
                 self.pauseListeners = False
 
+    def stop(self):
+        """Stop applying future events, waiting for any which are being applied to finish"""
+        if self.scheduler:
+            self.scheduler.stop()
+
     def addListener(self,
                     currentStateChanged=None,
                     playerAdjusted=None,
@@ -535,7 +767,8 @@ class GameState(object):
                     fired=None,
                     connectionsChanged=None,
                     playerInitialising=None,
-                    playerInitialised=None
+                    playerInitialised=None,
+                    playerOutOfContact=None
                     ):
         """
         Add listeners which get notified about changes to gameState
@@ -559,6 +792,8 @@ class GameState(object):
             self.playerInitialisingListeners.append(playerInitialising)
         if playerInitialised:
             self.playerInitialisedListeners.append(playerInitialised)
+        if playerOutOfContact:
+            self.playerOutOfContactListeners.append(playerOutOfContact)
 
     def _notifyStateChangedListeners(self):
         if not self.pauseListeners:
@@ -602,6 +837,11 @@ class GameState(object):
             for listener in self.connectionsChangedListeners:
                 listener()
 
+    def _notifyPlayerOutOfContactListeners(self, teamID, playerID, outOfContact):
+        if not self.pauseListeners:
+            for listener in self.playerOutOfContactListeners:
+                listener(teamID, playerID, outOfContact)
+
     def _notifyPlayerInitialisedListeners(self):
         if not self.pauseListeners:
             for listener in self.playerInitialisedListeners:
@@ -13,6 +13,9 @@ class Parameters(object):
     Parameters can be influenced by effects which come and go.
     How these changing values impact the game play is not the responsibility of this class
     but it does offer a listener system to be notified when a value changes
+
+    Parameter objects are never changed once they are in self.parameters, changing an effect
+    replaces the Parameter (and the dict holding it) instead. This means clone() can share them.
     """
     def __init__(self):
         self.listeners = []
@@ -27,15 +30,31 @@ class Parameters(object):
         if not valueRE.match(value):
             raise MalformedValueError(value)
 
-        self.parameters[parameter_name].addEffect(qualifier_pattern, effect_id, value)
+        parameter = self._replaceParameter(parameter_name)
+        parameter.addEffect(qualifier_pattern, effect_id, value)
 
         self._notifyListeners(parameter_name, qualifier_pattern)
 
     def _removeEffect(self, parameter_name, effect_id):
-        e = self.parameters[parameter_name].removeEffect(effect_id)
+        parameter = self._replaceParameter(parameter_name)
+        e = parameter.removeEffect(effect_id)
 
         self._notifyListeners(parameter_name, e.qualifierPattern)
 
+    def _replaceParameter(self, parameter_name):
+        """Replace the named parameter with a copy which can be changed without affecting any clones."""
+        parameter = self.parameters[parameter_name].copy()
+        self.parameters = dict(self.parameters)
+        self.parameters[parameter_name] = parameter
+        return parameter
+
+    def clone(self):
+        """Take a copy of these parameters in constant time. The Parameter objects are shared with the copy."""
+        other = Parameters.__new__(Parameters)
+        other.listeners = list(self.listeners)
+        other.parameters = self.parameters
+        return other
+
     def _getValue(self, parameter_name, qualifier):
         return self.parameters[parameter_name].value(qualifier)
 
@@ -146,6 +165,11 @@ class Parameter(object):
         else:
             raise ValueError('Parameter should be deserialised from a dict not a ' + type(input_obj))
 
+    def copy(self):
+        other = Parameter(self.baseValue)
+        other.effects = list(self.effects)
+        return other
+
     def toSimpleTypes(self):
         return {
             'baseValue': self.baseValue,
@@ -0,0 +1,130 @@
+class PersistentMap(object):
+    """A dict-like map which can be copied in constant time.
+    A copy shares its storage with the original until either of them is changed,
+    at which point the changed one takes its own copy of the storage.
+
+    Only use this for immutable values (like Player) as the values themselves are always shared.
+
+    The keys which are written to are recorded so that we can tell which ones might have changed
+    without comparing every value, see writtenKeys(). A copy starts with nothing recorded.
+    """
+    __slots__ = ('_data', '_owned', '_written')
+
+    def __init__(self, items=None):
+        if items:
+            self._data = dict(items)
+        else:
+            self._data = {}
+        self._owned = True
+        self._written = set()
+
+    def clone(self):
+        """Take a copy of this map in constant time"""
+        other = PersistentMap.__new__(PersistentMap)
+        other._data = self._data
+        other._owned = False
+        other._written = set()
+        self._owned = False
+        return other
+
+    copy = clone
+
+    def _own(self):
+        """Make sure we aren't sharing storage with anyone else before changing it"""
+        if not self._owned:
+            self._data = dict(self._data)
+            self._owned = True
+
+    # Writing
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+        self._written.add(key)
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+        self._written.add(key)
+
+    def pop(self, key, *default):
+        self._own()
+        self._written.add(key)
+        return self._data.pop(key, *default)
+
+    def clear(self):
+        self._written.update(self._data)
+        # No need to copy the storage just to empty it.
+        self._data = {}
+        self._owned = True
+
+    # Change tracking
+
+    def writtenKeys(self):
+        """The keys which have been set or deleted since this map was created (or takeWrittenKeys was called)"""
+        return set(self._written)
+
+    def takeWrittenKeys(self):
+        """Return the written keys and start recording afresh"""
+        written = self._written
+        self._written = set()
+        return written
+
+    # Reading
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def iterkeys(self):
+        return self._data.iterkeys()
+
+    def itervalues(self):
+        return self._data.itervalues()
+
+    def iteritems(self):
+        return self._data.iteritems()
+
+    def toDict(self):
+        return dict(self._data)
+
+    # Misc
+
+    def __eq__(self, other):
+        if isinstance(other, PersistentMap):
+            return self._data == other._data
+        elif isinstance(other, dict):
+            return self._data == other
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "PersistentMap(%r)" % (self._data,)
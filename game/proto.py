@@ -5,28 +5,50 @@ from datetime import date
 
 
 class Event():
-    """ An event is a message from a particular client (or the server if id == 0) at a particular time."""
-    def __init__(self, msgStr, event_id, time):
+    """ An event is a message from a particular client (or the server if id == 0) at a particular time.
+
+    Events which the client keeps until the server acknowledges them also have a sequence number (see SESSION),
+    which is written as E(id,time,#seq,msg).
+    """
+    def __init__(self, msgStr, event_id, time, seq=None):
         self.msgStr = msgStr
         self.id = event_id
         self.time = time
+        self.seq = seq
 
     def toStr(self):
-        return "E(%x,%f,%s)" % (self.id, self.time, self.msgStr)
+        if self.seq is None:
+            return "E(%x,%f,%s)" % (self.id, self.time, self.msgStr)
+        return "E(%x,%f,#%x,%s)" % (self.id, self.time, self.seq, self.msgStr)
 
     def __str__(self):
-        return "E(%x,%f(%s),%s)" % (self.id, self.time, date.fromtimestamp(self.time).isoformat(), self.msgStr)
+        seqStr = "" if self.seq is None else "#%x," % self.seq
+        return "E(%x,%f(%s),%s%s)" % (self.id, self.time, date.fromtimestamp(self.time).isoformat(), seqStr, self.msgStr)
 
     __repr__ = toStr
 
 
+_EVENT_REGEX = re.compile(r"^E\(([0-9a-f]+),([0-9.]+),(?:#([0-9a-f]+),)?(.*)\)$")
+
+
 def parseEvent(line):
-    regex = re.compile(r"^E\(([0-9a-f]+),([0-9.]+),(.*)\)$")
-    m = regex.match(line)
+    m = _EVENT_REGEX.match(line)
     if not m:
         raise MessageParseException("Couldn't parse an event from '%s'" % line)
-    (event_id, time, msgStr) = m.groups()
-    return Event(msgStr, long(event_id, 16), float(time))
+    (event_id, time, seq, msgStr) = m.groups()
+    return Event(msgStr, long(event_id, 16), float(time), None if seq is None else long(seq, 16))
+
+
+def toEvent(msg):
+    """Messages are received as text lines or as Events which have already been decoded from binary frames"""
+    if isinstance(msg, Event):
+        return msg
+    return parseEvent(msg)
+
+
+def messageName(msgStr):
+    """The name which a message starts with, e.g. Ping for Ping() or H for the gun's H1,2,3"""
+    return msgStr.partition("(")[0].rstrip("0123456789,")
 
 
 class MessageParseException(Exception):
@@ -34,20 +56,38 @@ class MessageParseException(Exception):
 
 
 class Message():
-    """ A message, this is wrapped in an Event for client <-> server and sent raw from client <-> arduino."""
+    """ A message, this is wrapped in an Event for client <-> server and sent raw from client <-> arduino.
+
+    The regex is the definition of the message. Its name (see messageName) is used to dispatch to it
+    and messages without any arguments are compared directly rather than with the regex.
+    """
     def __init__(self, regex, subst):
         if regex is None:
             self.regex = None
+            self.name = None
+            self.literal = None
         else:
             self.regex = re.compile("^" + regex + "$")
+            self.name = messageName(regex.partition("\\")[0])
+            # e.g. Ping\(\) is just the string Ping()
+            withoutBrackets = regex.replace(r"\(", "").replace(r"\)", "")
+            self.literal = regex.replace("\\", "") if withoutBrackets.isalnum() else None
         self.subst = subst
 
-    def parse(self, line, action=lambda: True):
+    def parseArgs(self, line):
+        """Return the args in line as a tuple of strings or None if line isn't this message"""
+        if self.literal is not None:
+            return () if line == self.literal else None
         m = self.regex.match(line)
-        if m:
+        return m.groups() if m else None
+
+    def parse(self, line, action=lambda: True, context=()):
+        """If line is this message, call action with context followed by the args from line"""
+        args = self.parseArgs(line)
+        if args is not None:
             # Note that the number of groups in the regex must match the number of args which action takes
             # (and the default can only be used if there are no capture groups)
-            actionResult = action(*m.groups())
+            actionResult = action(*(context + args))
             return actionResult or actionResult is None  # If the action doesn't return anything, assume all went well!
         else:
             return False
@@ -59,37 +99,60 @@ class Message():
 
 
 class MessageHandler():
+    """A table of functions to call for each message. Build it once and then call handle for each message.
+
+    The functions are called with any context passed to handle followed by the message's args, so they can be
+    registered with the decorator in a class body and be passed self (and e.g. the event) for each message.
+    """
     def __init__(self):
-        self.handlers = []
+        # message name -> (msg, f) for the handlers of messages with that name, so we only try the ones which might match.
+        self.handlers = {}
 
     def handles(self, msg):
         """A decorator which calls the decorated function if the given msg can be used to parse the given msgStr"""
         def handles_decorator(f):
-            # defer a function to check if a msgStr parses and if so, invoke f and return True
-            def handles_inner(msgStr):
-                if msg.parse(msgStr, f):
-                    return True
-            self.handlers.append(handles_inner)
+            self.handlers.setdefault(msg.name, []).append((msg, f))
 
             # leave the function definition as-is even though it is practically useless now it has been used by the decorator.
             return f
         return handles_decorator
 
-    def handle(self, msgStr):
-        for handler in self.handlers:
-            if handler(msgStr):
+    def handle(self, msgStr, *context):
+        for (msg, f) in self.handlers.get(messageName(msgStr), ()):
+            if msg.parse(msgStr, f, context):
                 return True
         return False
 
+    def match(self, msgStr):
+        """Return (f, args) for the first handler whose message msgStr is, or None. Nothing is called,
+        so this can be used to parse a message in one place and handle it in another."""
+        for (msg, f) in self.handlers.get(messageName(msgStr), ()):
+            args = msg.parseArgs(msgStr)
+            if args is not None:
+                return (f, args)
+        return None
+
+
+# The latest protocol version which we understand, the first which has binary frames
+# and the first where the client's events have sequence numbers which the server acknowledges.
+PROTOCOL_VERSION = 3
+BINARY_PROTOCOL_VERSION = 2
+SEQUENCE_PROTOCOL_VERSION = 3
 
 # both client <--> server
 PING = Message(r"Ping\(\)", "Ping()")
-PONG = Message(r"Pong\((\d*),(\d)\)", "Pong(%d,%s)")
+PONG = Message(r"Pong\(([0-9.]*),(\d)\)", "Pong(%f,%s)")  # ping event time, reply wanted
 
 # client -> server only
 RECV = Message(r"Recv\((\d*),(\d*),(.*)\)", "Recv(%d,%d,%s)")
 SENT = Message(r"Sent\((\d*),(\d*),(.*)\)", "Sent(%d,%d,%s)")
-HELLO = Message(r"Hello\(\)", "Hello()")  # TODO: Add a protocol version check here
+# The protocol version the sender understands (missing for version 1).
+# The server replies with the version to use, if it is later than 1, and from then on each end may use binaryProto.
+HELLO = Message(r"Hello\((\d*)\)", "Hello(%d)")
+WATERMARK = Message(r"Watermark\(\)", "Watermark()")  # There are no more events from this client before the time of this event.
+# The sequence numbers of this client's events from now on are from this session (a random number chosen when it starts).
+# The server replies with an ACK of the last one it has from the session, so the client knows what it needs to resend.
+SESSION = Message(r"Session\(([0-9a-f]+)\)", "Session(%x)")
 
 # server -> client only
 STARTGAME = Message(r"StartGame\((\d*)\)", "StartGame(%d)")
@@ -99,6 +162,7 @@ DELETED = Message(r"Deleted\(\)", "Deleted()")
 PLAYER_SNAPSHOT = Message(r"PlayerSnapshot\((.*)\)", "PlayerSnapshot(%s)")
 PARAMETERS_SNAPSHOT = Message(r"ParametersSnapshot\((.*)\)", "ParametersSnapshot(%s)")
 START_INITIALISING = Message(r"StartInitialising\(\)", "StartInitialising()")
+ACK = Message(r"Ack\((\d+)\)", "Ack(%d)")  # We have all of the client's events from this session up to this sequence number.
 
 # gun -> client (and usually also inside SENT and RECV for client -> server)
 # NB. If we can create these, it is for the fakeGun
@@ -4,14 +4,13 @@ from __future__ import print_function
 
 import argparse
 import sys
-import json
 import signal
 from time import sleep
 
 from gameState import GameState
 from gameLogic import GameLogic
-from serverConnection.listeningThread import ListeningThread
-from player import Player
+from serverConnection.listeningThread import ListeningThread, DEFAULT_MAX_LAG, TRANSPORTS, THREADED_TRANSPORT
+from serverConnection.snapshotScheduler import SnapshotScheduler
 import proto
 
 from api.restapi import RestApiThread
@@ -20,24 +19,24 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='BraidsTag server.')
     parser.add_argument('-H', '--headless', action='store_true', help='start headless. There will be no UI although the REST API will still allow control')
     parser.add_argument('-a', '--appPath',  type=str, help='filesystem path of the admin webapp build. If specified, the app will be served on /.')
+    parser.add_argument('-l', '--maxLag', type=float, default=DEFAULT_MAX_LAG, help='seconds a gun can lag behind before we stop waiting for its events. Lower values keep less history.')
+
+    parser.add_argument('-t', '--transport', choices=TRANSPORTS, default=THREADED_TRANSPORT, help='how to service the connections: a pair of threads for each one or a single select loop for all of them.')
 
     args = parser.parse_args()
 
     gameState = GameState()
     gameLogic = GameLogic(gameState)
 
-    main = ListeningThread(gameLogic)
+    main = ListeningThread(gameLogic, args.maxLag, args.transport)
     main.start()
 
     api = RestApiThread(gameState, gameLogic, main, args.appPath)
     api.start()
 
-    def playerAdjusted(teamID, playerID, player, parameters):
-        msg = proto.PLAYER_SNAPSHOT.create(json.dumps(player, cls=Player.Encoder))
-        main.queueMessage(teamID, playerID, msg)
-
-        msg = proto.PARAMETERS_SNAPSHOT.create(json.dumps(parameters.toSimpleTypes()))
-        main.queueMessage(teamID, playerID, msg)
+    # Replays can adjust a player many times in quick succession, this sends them the latest snapshot once.
+    snapshotScheduler = SnapshotScheduler(main)
+    snapshotScheduler.start()
 
     def gameStarted():
         main.queueMessageToAll(proto.STARTGAME.create(gameState.gameTimeRemaining()))
@@ -48,7 +47,7 @@ if __name__ == '__main__':
     gameState.addListener(
         gameStarted=gameStarted,
         gameStopped=gameStopped,
-        playerAdjusted=playerAdjusted
+        playerAdjusted=snapshotScheduler.playerAdjusted
     )
 
     def exit_server(retval):
@@ -58,7 +57,9 @@ if __name__ == '__main__':
         gameState.withCurrGameState(print_players)
 
         main.stop()
+        snapshotScheduler.stop()
         api.stop()
+        gameState.stop()
 
         sys.exit(retval)
 
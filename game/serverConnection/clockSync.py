@@ -0,0 +1,78 @@
+from __future__ import print_function
+
+from collections import deque
+
+
+class ClockSyncEstimator(object):
+    """Estimates how far a client's clock is from ours using ping round trips, in the same way as NTP.
+
+    Each ping gives us the server time it was sent, the client time it was answered and the server time
+    the answer arrived. If the network delay is the same both ways, the client's clock read the answer's
+    time at the midpoint of the round trip, and the true offset is within half the round trip time of that.
+
+    We keep a window of samples and only use the ones with the lowest round trip times as they have the
+    least queueing delay in them. The offset is fitted against time so that clock drift is tracked too.
+    """
+    windowSize = 16
+    bestSampleCount = 4
+    # How fast we assume a clock can drift when working out how much our estimate might be out by (100ppm)
+    maxDriftRate = 100e-6
+    # Ignore fitted drifts which are faster than this, they are noise rather than a real clock.
+    maxFittedDrift = 1e-3
+
+    def __init__(self):
+        # samples are (serverTime, offset, roundTripTime), a positive offset means the client is ahead of us.
+        self.samples = deque(maxlen=self.windowSize)
+        self.referenceTime = None
+        self.offset = 0.0  # at referenceTime
+        self.drift = 0.0  # seconds per second
+        self.bestRoundTripTime = None
+        self.lastSampleTime = None
+
+    def addSample(self, serverSendTime, clientTime, serverRecvTime):
+        """Add the timings of one ping"""
+        roundTripTime = serverRecvTime - serverSendTime
+        if roundTripTime < 0:
+            # This can't be right (e.g. our clock has been changed), ignore it.
+            return
+        midpoint = (serverSendTime + serverRecvTime) / 2.0
+        self.samples.append((midpoint, clientTime - midpoint, roundTripTime))
+        self.lastSampleTime = serverRecvTime
+        self._estimate()
+
+    def _estimate(self):
+        best = sorted(self.samples, key=lambda sample: sample[2])[:self.bestSampleCount]
+        # The lower the round trip time, the more we trust the sample. Don't let a 0 RTT sample take over completely.
+        weights = [1.0 / (roundTripTime + 1e-3) for (_, _, roundTripTime) in best]
+        totalWeight = sum(weights)
+
+        meanTime = sum(w * t for (w, (t, _, _)) in zip(weights, best)) / totalWeight
+        meanOffset = sum(w * o for (w, (_, o, _)) in zip(weights, best)) / totalWeight
+
+        # weighted least squares fit of the offset against time gives the drift.
+        timeVariance = sum(w * (t - meanTime) ** 2 for (w, (t, _, _)) in zip(weights, best))
+        drift = 0.0
+        if timeVariance > 0:
+            drift = sum(w * (t - meanTime) * (o - meanOffset) for (w, (t, o, _)) in zip(weights, best)) / timeVariance
+            drift = max(-self.maxFittedDrift, min(self.maxFittedDrift, drift))
+
+        self.referenceTime = meanTime
+        self.offset = meanOffset
+        self.drift = drift
+        self.bestRoundTripTime = best[0][2]
+
+    def offsetAt(self, serverTime):
+        """How far ahead of us we think the client's clock is at serverTime"""
+        if self.referenceTime is None:
+            return 0.0
+        return self.offset + self.drift * (serverTime - self.referenceTime)
+
+    def clientTimeToServer(self, clientTime):
+        # The offset changes so slowly that it doesn't matter that we look it up with the client's time.
+        return clientTime - self.offsetAt(clientTime)
+
+    def errorBound(self, now):
+        """How far out a converted time might be, or None if we don't have any samples yet"""
+        if self.bestRoundTripTime is None:
+            return None
+        return self.bestRoundTripTime / 2.0 + self.maxDriftRate * abs(now - self.lastSampleTime)
@@ -0,0 +1,190 @@
+from __future__ import print_function
+
+from collections import OrderedDict
+from threading import RLock
+
+# The states a connection goes through.
+DISCONNECTED = "disconnected"  # We have a tcp connection but haven't received an application payload
+UNINITIALISED = "uninitialised"  # We have received an application payload but not in the game yet.
+INITIALISING = "initialising"  # We are waiting for it to shoot the initialisation target.
+ESTABLISHED = "established"  # It is a player in the game.
+STATES = (DISCONNECTED, UNINITIALISED, INITIALISING, ESTABLISHED)
+
+
+class ConnectionSnapshot(object):
+    """A consistent copy of the registry, for the UI and REST api to read without holding anything up"""
+    def __init__(self, connections, connectedClients, uninitialised, initialising, disconnected):
+        self.connections = connections  # (team, player) -> connection
+        self.connectedClients = connectedClients  # client id -> (team, player)
+        self.uninitialised = uninitialised  # connections, oldest first
+        self.initialising = initialising
+        self.disconnected = disconnected  # how many
+
+
+class ConnectionRegistry(object):
+    """Keeps track of the connections, what state they are in and which player (and client id) they belong to.
+
+    The connections' threads, the listening thread, the UI and the REST api all use this so everything is done under
+    one lock. Each index has its reverse, so every lookup and state change is O(1) however many guns there are.
+    """
+    def __init__(self):
+        self._lock = RLock()
+        self._states = {}  # connection -> state
+        # state -> the connections in it (as an ordered set, so the uninitialised ones are initialised in order)
+        self._byState = dict((state, OrderedDict()) for state in STATES)
+        self._connections = {}  # (team, player) -> connection
+        self._keys = {}  # connection -> (team, player)
+        # These are remembered after a connection is lost, so that the client gets its player back when it reconnects.
+        self._clientKeys = {}  # client id -> (team, player)
+        self._clientIds = {}  # (team, player) -> client id
+        self._clientConnections = {}  # client id -> its latest connection
+
+    def _setState(self, connection, state):
+        oldState = self._states.get(connection)
+        if oldState is not None:
+            del self._byState[oldState][connection]
+        self._states[connection] = state
+        self._byState[state][connection] = True
+
+    def _discard(self, connection):
+        """Forget about a connection, returning the (team, player) it had, if any"""
+        state = self._states.pop(connection, None)
+        if state is not None:
+            del self._byState[state][connection]
+        key = self._keys.pop(connection, None)
+        if key is not None:
+            del self._connections[key]
+        client_id = getattr(connection, 'clientId', None)
+        if self._clientConnections.get(client_id) is connection:
+            del self._clientConnections[client_id]
+        return key
+
+    def _forgetClient(self, client_id):
+        """Forget which player a client id belongs to"""
+        key = self._clientKeys.pop(client_id, None)
+        if key is not None:
+            del self._clientIds[key]
+
+    def add(self, connection):
+        """Register a new tcp connection"""
+        with self._lock:
+            self._setState(connection, DISCONNECTED)
+
+    def helloReceived(self, connection, client_id):
+        with self._lock:
+            connection.clientId = client_id
+            self._clientConnections[client_id] = connection
+            self._setState(connection, UNINITIALISED)
+
+    def startInitialising(self, connection=None):
+        """Move a connection (or if None, the one which has been uninitialised longest) to initialising
+        and return it, or None if there aren't any. There is only one initialising connection at a time, if there was
+        already one it goes back to being uninitialised."""
+        with self._lock:
+            if connection is None:
+                uninitialised = self._byState[UNINITIALISED]
+                if not uninitialised:
+                    return None
+                connection = next(iter(uninitialised))
+            for previous in list(self._byState[INITIALISING]):
+                if previous is not connection:
+                    self._setState(previous, UNINITIALISED)
+            self._setState(connection, INITIALISING)
+            return connection
+
+    def establish(self, connection, key):
+        """Associate a connection with the player (team, player) and its client id.
+        Returns the connection this replaced (which is forgotten about), or None."""
+        with self._lock:
+            previous = self._connections.get(key)
+            if previous is connection:
+                previous = None
+            if previous is not None:
+                self._discard(previous)
+            oldKey = self._keys.pop(connection, None)
+            if oldKey is not None:
+                del self._connections[oldKey]
+
+            self._connections[key] = connection
+            self._keys[connection] = key
+            client_id = getattr(connection, 'clientId', None)
+            if client_id is not None:
+                self._forgetClient(self._clientIds.get(key))
+                self._clientIds.pop(self._clientKeys.get(client_id), None)
+                self._clientKeys[client_id] = key
+                self._clientIds[key] = client_id
+                self._clientConnections[client_id] = connection
+            self._setState(connection, ESTABLISHED)
+            return previous
+
+    def remove(self, connection):
+        """Forget a lost connection, returning its (team, player) if it had one. The client's player is remembered."""
+        with self._lock:
+            return self._discard(connection)
+
+    def move(self, src_key, dst_key):
+        """Move a player's connection and client id. Returns a (connection, replaced connection) tuple, either of which
+        is None if there wasn't one. The connection which dst_key had is forgotten about."""
+        with self._lock:
+            previous = None
+            connection = self._connections.pop(src_key, None)
+            if connection is not None:
+                previous = self._connections.get(dst_key)
+                if previous is not None:
+                    self._discard(previous)
+                self._connections[dst_key] = connection
+                self._keys[connection] = dst_key
+            client_id = self._clientIds.pop(src_key, None)
+            if client_id is not None:
+                self._forgetClient(self._clientIds.get(dst_key))
+                self._clientIds[dst_key] = client_id
+                self._clientKeys[client_id] = dst_key
+            return (connection, previous)
+
+    def forget(self, key):
+        """Forget a player entirely, returning its connection, if it had one"""
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is not None:
+                self._discard(connection)
+            self._forgetClient(self._clientIds.get(key))
+            return connection
+
+    def get(self, key):
+        """The established connection for (team, player), or None"""
+        return self._connections.get(key)
+
+    def keyOf(self, connection):
+        """The (team, player) of a connection, or None"""
+        return self._keys.get(connection)
+
+    def clientKey(self, client_id):
+        """The (team, player) a client belongs to, or None"""
+        return self._clientKeys.get(client_id)
+
+    def clientConnection(self, client_id):
+        """The latest connection from a client, or None"""
+        return self._clientConnections.get(client_id)
+
+    def state(self, connection):
+        return self._states.get(connection)
+
+    @property
+    def initialising(self):
+        with self._lock:
+            return next(iter(self._byState[INITIALISING]), None)
+
+    def established(self):
+        """A list of ((team, player), connection) for the established connections"""
+        with self._lock:
+            return list(self._connections.items())
+
+    def snapshot(self):
+        with self._lock:
+            return ConnectionSnapshot(
+                dict(self._connections),
+                dict(self._clientKeys),
+                list(self._byState[UNINITIALISED]),
+                next(iter(self._byState[INITIALISING]), None),
+                len(self._byState[DISCONNECTED]),
+            )
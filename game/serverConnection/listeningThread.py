@@ -2,36 +2,59 @@
 
 from __future__ import print_function
 
+import random
 import socket
 import time
-from threading import Thread
+from threading import Thread, Lock
 import json
 
 from core import ClientServer
+from connection import PreparedEvent
+from eventLoop import EventLoop
 import proto
-from serverConnection import ServerConnection
+from serverConnection import ServerConnection, ReceivedSequence
 from msgHandler import ServerMsgHandler
+from watermarks import WatermarkTracker
+from connectionRegistry import ConnectionRegistry
+from timerWheel import TimerWheel
 from player import Player
 
+# How long (in seconds) a connection can lag behind before we stop holding the confidence point back for it.
+# Raising this makes late events less likely to be clamped, lowering it bounds how many uncertain events are kept.
+DEFAULT_MAX_LAG = ServerConnection.outOfContactTime
+
+# How the connections to the clients are serviced, either a read and a write thread for each connection
+# or one thread which waits for all of them with select.
+THREADED_TRANSPORT = 'threaded'
+SELECT_TRANSPORT = 'select'
+TRANSPORTS = (THREADED_TRANSPORT, SELECT_TRANSPORT)
+
 
 class ListeningThread(Thread):
     """A thread which listens for new connections from a client.
        Spawns a Server instance to handle the ongoing communication and stores them all to enable sending broadcast messages
     """
-    def __init__(self, game_logic):
+    def __init__(self, game_logic, max_lag=DEFAULT_MAX_LAG, transport=THREADED_TRANSPORT):
         super(ListeningThread, self).__init__(group=None)
+        if transport not in TRANSPORTS:
+            raise ValueError("Unknown transport: %s" % transport)
         self.name = "Server Listening Thread"
         self.gameLogic = game_logic
 
-        self.msgHandler = ServerMsgHandler(self, game_logic)
+        # Messages are parsed on the connections' threads and applied by the handler's sequencer.
+        self.msgHandler = ServerMsgHandler(self, game_logic, sequenced=True)
 
         game_logic.gameState.addListener(playerMoved=self.movePlayer)
 
-        self.connections = {}
-        self.disconnectedConnections = set()  # We have a tcp connection but haven't received an application payload
-        self.uninitialisedConnections = set()  # We have received an application payload but not in the game yet.
-        self.initialisingConnection = None
-        self.connectedClients = {}
+        # Which state each connection is in and which player and client it belongs to.
+        self.registry = ConnectionRegistry()
+        self.receivedSequences = {}  # client id -> ReceivedSequence of its latest session
+        # The established connections' watermarks, used to move the confidence point on.
+        self.watermarks = WatermarkTracker(max_lag)
+        self.lowWatermark = None
+        # (parameters dict, PreparedEvent) for the last ParametersSnapshot we sent so it can be shared until they change.
+        self._parametersSnapshot = None
+        self._parametersSnapshotLock = Lock()
 
         print ("Starting game server on", ClientServer.SERVER, ":", ClientServer.PORT)
         self.serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -40,10 +63,21 @@ class ListeningThread(Thread):
         self.serversocket.listen(5)
         self.shouldStop = False
 
+        # When we have an event loop, this thread runs it rather than accepting connections itself.
+        self.eventLoop = EventLoop() if transport == SELECT_TRANSPORT else None
+        self.oocUpdater = self.OOCUpdater(self)
+
     def run(self):
         # Launch an OOC Check Thread too
-        self.oocUpdater = self.OOCUpdater(self)
         self.oocUpdater.start()
+        self.msgHandler.sequencer.start()
+
+        if self.eventLoop:
+            self.eventLoop.addListeningSocket(self.serversocket, self.acceptConnection)
+            self.eventLoop.run()
+            # Only close the socket once the loop has stopped waiting for it.
+            self.serversocket.close()
+            return
 
         # start serving
         while True:
@@ -51,159 +85,244 @@ class ListeningThread(Thread):
                 return
 
             try:
-                (clientsocket, dummy_address) = self.serversocket.accept()
-                # this function is added to the class dynamically so pylint doesn't think it is there.
-                clientsocket.setblocking(1)  # pylint:disable=no-member
-                self.disconnectedConnections.add(ServerConnection(clientsocket, self, self.msgHandler))
+                self.acceptConnection()
             except KeyboardInterrupt:
                 break
             except socket.timeout:
                 pass
 
+    def acceptConnection(self):
+        (clientsocket, dummy_address) = self.serversocket.accept()
+        if self.eventLoop is None:
+            # this function is added to the class dynamically so pylint doesn't think it is there.
+            clientsocket.setblocking(1)  # pylint:disable=no-member
+        self.registry.add(ServerConnection(clientsocket, self, self.msgHandler, self.eventLoop))
+
+    @property
+    def initialisingConnection(self):
+        return self.registry.initialising
+
     def recievedHello(self, server, client_id):
         """ Register that we have received the first application message from a client """
-        try:
-            self.disconnectedConnections.remove(server)
-        except KeyError:
-            pass
-
-        self.uninitialisedConnections.add(server)
-        server.clientId = client_id
+        self.registry.helloReceived(server, client_id)
         self.gameLogic.gameState._notifyConnectionsChangedListeners()
 
-    def startInitialising(self, server):
-        """ Register that a particular client has been selected as initialising """
-        try:
-            self.uninitialisedConnections.remove(server)
-        except KeyError:
-            pass
-        if self.initialisingConnection:
+    def startInitialising(self, server=None):
+        """ Register that a particular client (or if None, the one which has been waiting longest) has been selected
+        as initialising. Returns the connection, or None if there wasn't one waiting."""
+        if self.registry.initialising:
             print("started initialisation when we already had an uninitialised client")
+        server = self.registry.startInitialising(server)
+        if server is None:
+            return None
 
-        self.initialisingConnection = server
         server.queueMessage(proto.START_INITIALISING.create())
         self.gameLogic.gameState._notifyPlayerInitialisingListeners()
+        return server
 
     def establishConnection(self, server, player):
         """ Register that a connection has associated itself with a player"""
-        try:
-            self.uninitialisedConnections.remove(server)
-        except KeyError:
-            pass
-        try:
-            self.disconnectedConnections.remove(server)
-        except KeyError:
-            pass
-        if self.initialisingConnection == server:
-            self.initialisingConnection = None
-
-        self.connections[(player.team_id, player.player_id)] = server
-        self.connectedClients[server.clientId] = (player.team_id, player.player_id)
+        previous = self.registry.establish(server, (player.team_id, player.player_id))
+        if previous:
+            self._dropReplaced(previous)
+        self.watermarks.track(server, server.lastContact)
+        self.oocUpdater.track(server)
         self.gameLogic.gameState._notifyPlayerInitialisedListeners()
 
     def lostConnection(self, server):
         """ Register that a connection has been lost"""
-        # remove from here just in case
-        try:
-            self.uninitialisedConnections.remove(server)
-        except KeyError:
-            pass
+        self.registry.remove(server)
+        self.watermarks.untrack(server)
+        self.oocUpdater.untrack(server)
+
+    def _dropReplaced(self, server):
+        """Stop a connection which another connection has replaced (e.g. when a gun reconnects before we noticed its
+        old connection had gone), so it doesn't hold the confidence point back or keep being pinged."""
+        self.watermarks.untrack(server)
+        self.oocUpdater.untrack(server)
         try:
-            self.disconnectedConnections.remove(server)
-        except KeyError:
+            # Don't wait for its write thread, we might be applying events (or holding the state lock).
+            server.stop(wait=False)
+        except socket.error:
+            # It has probably gone already.
             pass
-        if self.initialisingConnection == server:
-            self.initialisingConnection = None
 
-        # look the connection up, it isn't worth storing the reverse mapping as this shouldn't happen very often, I hope!
-        for key in self.connections:
-            if self.connections[key] == server:
-                del self.connections[key]
-                break
+    def receivedSequence(self, client_id, session):
+        """The ReceivedSequence for a client's session. If the client has started a new session, we start again."""
+        received_sequence = self.receivedSequences.get(client_id)
+        if received_sequence is None or received_sequence.session != session:
+            received_sequence = self.receivedSequences[client_id] = ReceivedSequence(session)
+        return received_sequence
 
     def isConnected(self, client_id):
         """Check is a client is already connected. If so, return the (team, player) tuple otherwise return None"""
-        return self.connectedClients.get(client_id)
+        return self.registry.clientKey(client_id)
 
     def queueMessageToAll(self, msg):
-        """ send a message to all clients. Note that this doesn't include unestablished connections."""
-        for key in self.connections:
-            self.connections[key].queueMessage(msg)
+        """ send a message to all clients. Note that this doesn't include unestablished connections.
+        The message is stamped and encoded once and then shared by all the connections."""
+        prepared = PreparedEvent(msg)
+        for (dummy_key, server) in self.registry.established():
+            server.queuePrepared(prepared)
 
     def queueMessage(self, team_id, player_id, msg):
-        if (team_id, player_id) in self.connections:
-            self.connections[(team_id, player_id)].queueMessage(msg)
+        server = self.registry.get((team_id, player_id))
+        if server:
+            server.queueMessage(msg)
+
+    def queuePrepared(self, team_id, player_id, prepared):
+        """Send a PreparedEvent, which might also be sent to other clients, to one client"""
+        server = self.registry.get((team_id, player_id))
+        if server:
+            server.queuePrepared(prepared)
+
+    def parametersSnapshot(self, parameters):
+        """A PreparedEvent of a ParametersSnapshot for parameters. While the parameters stay the same, this is
+        shared by all the clients it is sent to (e.g. after a replay adjusts many players) rather than encoded for each."""
+        with self._parametersSnapshotLock:
+            # Parameters replace their dict of Parameter objects when they change so this tells us if they are the same.
+            if self._parametersSnapshot is None or self._parametersSnapshot[0] is not parameters.parameters:
+                msg = proto.PARAMETERS_SNAPSHOT.create(json.dumps(parameters.toSimpleTypes()))
+                self._parametersSnapshot = (parameters.parameters, PreparedEvent(msg))
+            return self._parametersSnapshot[1]
+
+    def connectionStats(self):
+        """The send queue counters of each established connection, keyed by (team, player)"""
+        return dict((key, server.queueStats()) for (key, server) in self.registry.established())
 
     def movePlayer(self, src_team_id, src_player_id, player):
-        if (src_team_id, src_player_id) in self.connections:
-            self.connections[(player.team_id, player.player_id)] = self.connections[(src_team_id, src_player_id)]
-            del self.connections[(src_team_id, src_player_id)]
+        (server, previous) = self.registry.move((src_team_id, src_player_id), (player.team_id, player.player_id))
+        if previous:
+            self._dropReplaced(previous)
+        if server:
             self.queueMessage(player.team_id, player.player_id, proto.PLAYER_SNAPSHOT.create(json.dumps(player, cls=Player.Encoder)))
             # TODO: should effects move as well?
 
     def deletePlayer(self, team_id, player_id):
         self.queueMessage(team_id, player_id, proto.DELETED.create())
-        if (team_id, player_id) in self.connections:
-            del self.connections[(team_id, player_id)]
-
         # Forget about the client Id too. Don't remember that we deleted it, we rely on the client not reconnecting
-        for key in self.connectedClients:
-            if self.connectedClients[key] == (team_id, player_id):
-                del self.connectedClients[key]
-                break
-
-    def considerMovingConfidencePoint(self, changed_time):
-        """Check if the message we just recieved at the given time moves the confidence point
-         and, if so. Tell the GameState about it"""
-        if len(self.connections) == 0:
+        server = self.registry.forget((team_id, player_id))
+        if server:
+            self.watermarks.untrack(server)
+            self.oocUpdater.untrack(server)
+
+    def updateWatermark(self, server, watermark):
+        """Record that a connection won't send any more events before watermark
+        and move the confidence point on if that has moved the low watermark."""
+        self.watermarks.update(server, watermark)
+        self.oocUpdater.heardFrom(server)
+        self.considerMovingConfidencePoint()
+
+    def considerMovingConfidencePoint(self):
+        """Check if the low watermark of all the connections has moved on (or enough time has passed for the
+         lagging connections to be ignored) and, if so, tell the GameState about the new confidence point"""
+        low_watermark = self.watermarks.lowWatermark(time.time())
+        if low_watermark is None:
             return
-        earliest_last_contact = min([x.lastContact for x in self.connections.values()])
-        if earliest_last_contact == changed_time:
-            # This has bumped up the confidence point
-            self.gameLogic.gameState.adjustConfidencePoint(earliest_last_contact)
+        with self.gameLogic.gameState.stateLock:
+            if self.lowWatermark is not None and low_watermark <= self.lowWatermark:
+                return
+            self.lowWatermark = low_watermark
+            self.gameLogic.gameState.adjustConfidencePoint(low_watermark)
 
     def stop(self):
         self.shouldStop = True
-        self.serversocket.close()
+        if self.eventLoop:
+            self.eventLoop.stop()
+        else:
+            self.serversocket.close()
         self.oocUpdater.stop()
+        self.msgHandler.sequencer.stop()
 
     class OOCUpdater(Thread):
+        """Pings each established connection every latencyCheckInterval and notices when they go out of contact
+        (and come back into contact), telling the GameState's playerOutOfContact listeners.
+
+        Each connection's deadlines are kept on a TimerWheel, so each tick only costs as much as the deadlines which
+        have passed. The pings are spread across the interval so that they (and their replies) don't all happen at once.
+        """
+        tickInterval = 0.5
+        # This is also how often we sample the clients' clocks.
+        latencyCheckInterval = 10
+        # As time passes, lagging connections stop holding the confidence point back so check it this often.
+        confidencePointInterval = 3
+
         def __init__(self, listening_thread):
             Thread.__init__(self)
+            self.setDaemon(True)
             self.name = "OOCUpdater"
             self.listeningThread = listening_thread
-            self.connections = listening_thread.connections
             self.shouldStop = False
-            self._triggeredOOCWarning = {}
+            self.wheel = TimerWheel(self.tickInterval)
+            self._lock = Lock()
+            self._timers = {}  # server -> [ping timer, out of contact timer]
+            self._outOfContact = set()
 
         def stop(self):
             self.shouldStop = True
 
         def run(self):
-            latency_check_interval = 30
-            last_triggered_latency_check = 0
+            self._considerMovingConfidencePoint()
             while not self.shouldStop:
-                time.sleep(3)
-
-                # ping to test latency.
-                if time.time() > last_triggered_latency_check + latency_check_interval:
-                    last_triggered_latency_check = time.time()
-                    for key, server in self.connections.items():
-                        server.startLatencyCheck()
-
-                # Check if we have gone out of contact
-                for key, server in self.connections.items():
-                    if key not in self._triggeredOOCWarning:
-                        self._triggeredOOCWarning[key] = False
-
-                    if server.isOutOfContact():
-                        self._triggeredOOCWarning[key] = True
-                        # (team_id, player_id) = key
-                        # TODO
-                        # self.listeningThread.gameState.playerOutOfContactUpdated.emit(team_id, player_id, True)
-
-                    if self._triggeredOOCWarning[key] and (not server.isOutOfContact()):
-                        # (team_id, player_id) = key
-                        self._triggeredOOCWarning[key] = False
-                        # TODO
-                        # self.listeningThread.gameState.playerOutOfContactUpdated.emit(team_id, player_id, False)
+                time.sleep(self.tickInterval)
+                self.wheel.advance(time.time())
+
+        def track(self, server):
+            """Start pinging a connection and watching for it going out of contact"""
+            with self._lock:
+                self._cancel(server)
+                self._timers[server] = [
+                    self.wheel.schedule(time.time() + random.uniform(0, self.latencyCheckInterval), self._ping, server),
+                    self.wheel.schedule(server.lastContact + server.outOfContactTime, self._checkContact, server),
+                ]
+
+        def untrack(self, server):
+            with self._lock:
+                self._cancel(server)
+
+        def _cancel(self, server):
+            for timer in self._timers.pop(server, ()):
+                self.wheel.cancel(timer)
+            self._outOfContact.discard(server)
+
+        def heardFrom(self, server):
+            """Called whenever we hear from a connection, which is only news if it was out of contact"""
+            if server not in self._outOfContact:
+                return
+            with self._lock:
+                if server not in self._outOfContact:
+                    return
+                self._outOfContact.discard(server)
+                self._timers[server][1] = self.wheel.schedule(server.lastContact + server.outOfContactTime, self._checkContact, server)
+            self._notify(server, False)
+
+        def _ping(self, server):
+            with self._lock:
+                if server not in self._timers:
+                    return
+                self._timers[server][0] = self.wheel.schedule(time.time() + self.latencyCheckInterval, self._ping, server)
+            server.startLatencyCheck()
+
+        def _checkContact(self, server):
+            with self._lock:
+                if server not in self._timers:
+                    return
+                deadline = server.lastContact + server.outOfContactTime
+                if deadline > time.time():
+                    # We have heard from it since this was scheduled, so wait until the new deadline.
+                    # This is cheaper than rescheduling every time we hear from a connection.
+                    self._timers[server][1] = self.wheel.schedule(deadline, self._checkContact, server)
+                    return
+                self._timers[server][1] = None
+                self._outOfContact.add(server)
+            self._notify(server, True)
+
+        def _notify(self, server, out_of_contact):
+            key = self.listeningThread.registry.keyOf(server)
+            if key:
+                (team_id, player_id) = key
+                self.listeningThread.gameLogic.gameState._notifyPlayerOutOfContactListeners(team_id, player_id, out_of_contact)
+
+        def _considerMovingConfidencePoint(self):
+            self.wheel.schedule(time.time() + self.confidencePointInterval, self._considerMovingConfidencePoint)
+            self.listeningThread.considerMovingConfidencePoint()
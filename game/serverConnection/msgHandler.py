@@ -3,110 +3,205 @@
 from __future__ import print_function
 
 import time
+import traceback
 from threading import Lock
 import json
 
 import proto
 from player import Player
+from sequencer import Sequencer
+
+
+class ParsedEvent(object):
+    """An event from a client and the handler (with its args) which will apply it, or None if we don't understand it"""
+    __slots__ = ('event', 'handler', 'args')
+
+    def __init__(self, event, handler, args):
+        self.event = event
+        self.handler = handler
+        self.args = args
 
 
 class ServerMsgHandler():
-    """A class to handle messages from clients to the server. There should only be one instance of this class"""
-    def __init__(self, listeningThread, gameLogic):
+    """A class to handle messages from clients to the server. There should only be one instance of this class.
+
+    Handling is in two stages. Messages are parsed (and their handlers found) on the thread which received them,
+    then they are applied. If we have a sequencer, it applies everything on its own thread so parsing one client's
+    messages never waits for another's. Otherwise they are applied straight away, which is simpler for tests.
+    """
+    def __init__(self, listeningThread, gameLogic, sequenced=False):
         self.listeningThread = listeningThread
         self.gameLogic = gameLogic
+        self.sequencer = Sequencer(self) if sequenced else None
+        self.parseErrors = 0
 
     # so we don't try to process messages from 2 clients at once.
     eventLock = Lock()
 
     def handleMsg(self, full_line, connection):
-        with self.eventLock:
-            event = proto.parseEvent(full_line)
-
-            # TODO: generic commsListener.
-            # if mainWindow: # This should only be None in tests.
-            #   mainWindow.lineReceived(event)
-
-            self.__handleEvent(event, connection)
-
         # TODO be more discerning
-        return event.time
-
-    def __handleEvent(self, event, connection):
-        """handle an event, you must be holding self.eventLock before calling this"""
-        h1 = proto.MessageHandler()
-
-        @h1.handles(proto.RECV)
-        def recv(recvTeamStr, recvPlayerStr, line):  # pylint: disable=W0612
-            recv_team = int(recvTeamStr)
-            recv_player = int(recvPlayerStr)
-
-            h2 = proto.MessageHandler()
-
-            @h2.handles(proto.HIT)
-            def hit(sentTeamStr, sentPlayerStr, damageStr):  # pylint: disable=W0612
-                sent_team = int(sentTeamStr)
-                sent_player = int(sentPlayerStr)
-                damage = int(damageStr)
-
-                server_time = connection.clientTimeToServer(event.time)
-
-                self.gameLogic.hit(server_time, recv_team, recv_player, sent_team, sent_player, damage)
-
-            @h2.handles(proto.INIT_HIT)
-            def initHit():  # pylint: disable=W0612
-                # This is a shot from a gun which is initialising.
-                # TODO: allow the UI to pick the team
-                player = self.gameLogic.gameState.createNewPlayer()
-
-                self.finishInitialisation(player, self.listeningThread.initialisingConnection)
-
-            @h2.handles(proto.TRIGGER)
-            def trigger():  # pylint: disable=W0612
-                server_time = connection.clientTimeToServer(event.time)
-
-                self.gameLogic.trigger(server_time, recv_team, recv_player)
-
-            @h2.handles(proto.TRIGGER_RELEASE)
-            def triggerRelease():  # pylint: disable=W0612
-                server_time = connection.clientTimeToServer(event.time)
-
-                self.gameLogic.triggerRelease(server_time, recv_team, recv_player)
-
-            @h2.handles(proto.FULL_AMMO)
-            def fullAmmo():  # pylint: disable=W0612
-                pass
-                # server_time = connection.clientTimeToServer(event.time)
-
-                # TODO
-                # self.gameLogic.fullAmmo(serverTime, recvTeam, recvPlayer)
-
-            return h2.handle(line)
-
-        @h1.handles(proto.HELLO)
-        def hello():  # pylint: disable=W0612
-            client_id = event.id
-            existing_ids = self.listeningThread.isConnected(client_id)
-            self.listeningThread.recievedHello(connection, client_id)
-            if existing_ids:
-                player = self.gameLogic.gameState.getOrCreatePlayer(existing_ids[0], existing_ids[1])
-                self.finishInitialisation(player, connection)
-
-        @h1.handles(proto.PING)
-        def ping():  # pylint: disable=W0612
-            connection.queueMessage(proto.PONG.create(event.time, 1))
-
-        @h1.handles(proto.PONG)
-        def pong(startTime, reply):  # pylint: disable=W0612
-            now = time.time()
-            latency = (now - int(startTime)) / 2
-            connection.setLatency(latency)
-            connection.setClientClockDrift(event.time - (now - latency))
-
-            if int(reply):
-                connection.queueMessage(proto.PONG.create(event.time, 0))
-
-        return h1.handle(event.msgStr)
+        return self.handleMsgs([full_line], connection)[0]
+
+    def handleMsgs(self, full_lines, connection):
+        """Handle several messages from one connection together.
+        The game events they cause are added as one batch. Returns the time of each message,
+        or True for one which couldn't be parsed (and has been skipped)."""
+        parse_start = time.time()
+        parsed = []
+        results = []
+        for full_line in full_lines:
+            try:
+                parsed_event = self.parse(full_line)
+            except Exception:  # pylint:disable=broad-except
+                # Don't lose the rest of what we received with it (or the connection) over one bad message.
+                print("Couldn't parse %r" % (full_line,))
+                traceback.print_exc()
+                self.parseErrors += 1
+                results.append(True)
+                continue
+            parsed.append(parsed_event)
+            results.append(parsed_event.event.time)
+
+        if self.sequencer:
+            if parsed:
+                self.sequencer.submit(connection, parsed, time.time() - parse_start)
+        else:
+            if len(parsed) > 1:
+                with self.gameLogic.batch():
+                    applied_times = self.apply(parsed, connection)
+            else:
+                applied_times = self.apply(parsed, connection)
+            if applied_times:
+                connection.eventsApplied(applied_times)
+
+        return results
+
+    def parse(self, full_line):
+        """Parse a message from a client into a ParsedEvent. This doesn't change anything so can be called on any thread."""
+        event = proto.toEvent(full_line)
+
+        # TODO: generic commsListener.
+        # if mainWindow: # This should only be None in tests.
+        #   mainWindow.lineReceived(event)
+
+        if proto.messageName(event.msgStr) == proto.RECV.name:
+            recv_args = proto.RECV.parseArgs(event.msgStr)
+            if recv_args is not None:
+                (recvTeamStr, recvPlayerStr, line) = recv_args
+                (handler, args) = self.gunHandlers.match(line) or (None, ())
+                return ParsedEvent(event, handler, (int(recvTeamStr), int(recvPlayerStr)) + args)
+
+        (handler, args) = self.eventHandlers.match(event.msgStr) or (None, ())
+        return ParsedEvent(event, handler, args)
+
+    def apply(self, parsed, connection):
+        """Apply ParsedEvents from one connection to the game. Only one thread (the sequencer if we have one) calls this.
+        Returns the times of the events which have been dealt with, leaving out any whose handler raised."""
+        applied_times = []
+        with self.eventLock:
+            for parsed_event in parsed:
+                try:
+                    if parsed_event.event.seq is not None and not connection.hasSession():
+                        # This was queued on the client before it reconnected and got here ahead of its SESSION, so
+                        # we can't tell whether we have already had it. The client sends it again once we have
+                        # acknowledged the session, so leave it (and its time) until then.
+                        connection.earlySequenced += 1
+                        continue
+                    if not connection.isNewEvent(parsed_event.event):
+                        # We've already handled this, the client sent it again because it hadn't heard that we had it.
+                        applied_times.append(parsed_event.event.time)
+                        continue
+                    if parsed_event.handler:
+                        parsed_event.handler(self, parsed_event.event, connection, *parsed_event.args)
+                except Exception:  # pylint:disable=broad-except
+                    # Don't let one bad message stop the others (which might be from other connections) being applied.
+                    traceback.print_exc()
+                    continue
+                applied_times.append(parsed_event.event.time)
+        return applied_times
+
+    # The handlers for messages from clients, called with (self, event, connection, *args).
+    # These are built once, when the class is defined.
+    eventHandlers = proto.MessageHandler()
+    # The handlers for gun messages passed on in a RECV, called with (self, event, connection, recv_team, recv_player, *args)
+    gunHandlers = proto.MessageHandler()
+
+    @gunHandlers.handles(proto.HIT)
+    def _hit(self, event, connection, recv_team, recv_player, sentTeamStr, sentPlayerStr, damageStr):
+        sent_team = int(sentTeamStr)
+        sent_player = int(sentPlayerStr)
+        damage = int(damageStr)
+
+        server_time = connection.clientTimeToServer(event.time)
+
+        self.gameLogic.hit(server_time, recv_team, recv_player, sent_team, sent_player, damage)
+
+    @gunHandlers.handles(proto.INIT_HIT)
+    def _initHit(self, event, connection, recv_team, recv_player):  # pylint: disable=W0613
+        # This is a shot from a gun which is initialising.
+        # TODO: allow the UI to pick the team
+        player = self.gameLogic.gameState.createNewPlayer()
+
+        self.finishInitialisation(player, self.listeningThread.initialisingConnection)
+
+    @gunHandlers.handles(proto.TRIGGER)
+    def _trigger(self, event, connection, recv_team, recv_player):
+        server_time = connection.clientTimeToServer(event.time)
+
+        self.gameLogic.trigger(server_time, recv_team, recv_player)
+
+    @gunHandlers.handles(proto.TRIGGER_RELEASE)
+    def _triggerRelease(self, event, connection, recv_team, recv_player):
+        server_time = connection.clientTimeToServer(event.time)
+
+        self.gameLogic.triggerRelease(server_time, recv_team, recv_player)
+
+    @gunHandlers.handles(proto.FULL_AMMO)
+    def _fullAmmo(self, event, connection, recv_team, recv_player):  # pylint: disable=W0613
+        pass
+        # server_time = connection.clientTimeToServer(event.time)
+
+        # TODO
+        # self.gameLogic.fullAmmo(serverTime, recvTeam, recvPlayer)
+
+    @eventHandlers.handles(proto.HELLO)
+    def _hello(self, event, connection, versionStr):
+        version = min(int(versionStr or 1), proto.PROTOCOL_VERSION)
+        if version > 1:
+            # Tell the client which version we are going to use. Older clients don't understand this so don't get it.
+            connection.queueMessage(proto.HELLO.create(version))
+        connection.setProtocolVersion(version)
+
+        client_id = event.id
+        existing_ids = self.listeningThread.isConnected(client_id)
+        self.listeningThread.recievedHello(connection, client_id)
+        if existing_ids:
+            player = self.gameLogic.gameState.getOrCreatePlayer(existing_ids[0], existing_ids[1])
+            self.finishInitialisation(player, connection)
+
+    @eventHandlers.handles(proto.SESSION)
+    def _session(self, event, connection, sessionStr):
+        connection.setSession(self.listeningThread.receivedSequence(event.id, int(sessionStr, 16)))
+
+    @eventHandlers.handles(proto.WATERMARK)
+    def _watermark(self, event, connection):  # pylint: disable=W0613
+        # Nothing to do, the event time is used to update the connection's watermark like any other message.
+        pass
+
+    @eventHandlers.handles(proto.PING)
+    def _ping(self, event, connection):
+        connection.queueMessage(proto.PONG.create(event.time, 1))
+
+    @eventHandlers.handles(proto.PONG)
+    def _pong(self, event, connection, startTime, reply):
+        # startTime is when we sent the ping and event.time is when the client answered it.
+        # Clients from before the binary protocol send startTime in whole seconds, which is too coarse to estimate
+        # their clock from, so their events' times are used as they are.
+        if connection.protocolVersion >= proto.BINARY_PROTOCOL_VERSION:
+            connection.addClockSample(float(startTime), event.time, time.time())
+
+        if int(reply):
+            connection.queueMessage(proto.PONG.create(event.time, 0))
 
     def finishInitialisation(self, player, connection):
         connection.queueMessage(proto.PLAYER_SNAPSHOT.create(json.dumps(player, cls=Player.Encoder)))
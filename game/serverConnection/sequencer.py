@@ -0,0 +1,121 @@
+from __future__ import print_function
+
+import time
+import traceback
+from threading import Thread, Lock
+import Queue
+
+
+class StageStats(object):
+    """How long one stage of handling messages has taken"""
+    def __init__(self):
+        self.count = 0  # messages
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds, count=1):
+        self.count += count
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def toSimpleTypes(self):
+        return {
+            'count': self.count,
+            'meanSeconds': self.total / self.count if self.count else None,
+            'maxSeconds': self.max,
+        }
+
+
+class Sequencer(Thread):
+    """The one thread which applies clients' messages to the game.
+
+    The connections' threads parse what they receive and submit it here, so they never wait for each other's parsing.
+    Whatever has been submitted by the time we are ready is applied as one batch, so a burst of messages from many
+    guns only causes one re-apply of the game state.
+    """
+    # Don't let one batch grow without limit while the guns are busy.
+    maxBatchSize = 256
+
+    def __init__(self, msg_handler):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.name = "Sequencer"
+        self.msgHandler = msg_handler
+        self.queue = Queue.Queue()
+        self.shouldStop = False
+
+        # Per-stage latencies. parse is per message, queue is the time from being submitted to starting to be applied,
+        # and apply is per batch (with its count being the number of messages in the batches).
+        self._statsLock = Lock()
+        self.parseStats = StageStats()
+        self.queueStats = StageStats()
+        self.applyStats = StageStats()
+        self.batches = 0
+
+    def submit(self, connection, parsed, parse_time):
+        """Queue ParsedEvents which were received together on connection, and took parse_time to parse, to be applied"""
+        with self._statsLock:
+            self.parseStats.add(parse_time, len(parsed))
+        self.queue.put((connection, parsed, time.time()))
+
+    def stop(self):
+        """Stop applying messages. This blocks until the batch being applied (if any) is finished."""
+        self.shouldStop = True
+        # wake up the thread if it is waiting.
+        self.queue.put(None)
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self.shouldStop:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.maxBatchSize:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self.applyBatch(batch)
+
+    def applyBatch(self, batch):
+        """Apply a list of (connection, parsed, submitted time) together"""
+        start = time.time()
+        applied = []  # (connection, times of the events which were applied)
+        try:
+            with self.msgHandler.gameLogic.batch():
+                for (connection, parsed, dummy_submitted) in batch:
+                    try:
+                        applied.append((connection, self.msgHandler.apply(parsed, connection)))
+                    except Exception:  # pylint:disable=broad-except
+                        # Keep going for the sake of the other connections.
+                        traceback.print_exc()
+        except Exception:  # pylint:disable=broad-except
+            # The batch didn't make it into the game.
+            traceback.print_exc()
+            applied = []
+
+        # The connections' watermarks can only move on once their events have been added to the game.
+        for (connection, applied_times) in applied:
+            if not applied_times:
+                continue
+            try:
+                connection.eventsApplied(applied_times)
+            except Exception:  # pylint:disable=broad-except
+                traceback.print_exc()
+        end = time.time()
+
+        with self._statsLock:
+            self.batches += 1
+            self.applyStats.add(end - start, sum(len(parsed) for (dummy_connection, parsed, dummy_submitted) in batch))
+            for (dummy_connection, parsed, submitted) in batch:
+                self.queueStats.add(start - submitted, len(parsed))
+
+    def stats(self):
+        with self._statsLock:
+            return {
+                'batches': self.batches,
+                'parse': self.parseStats.toSimpleTypes(),
+                'queue': self.queueStats.toSimpleTypes(),
+                'apply': self.applyStats.toSimpleTypes(),
+            }
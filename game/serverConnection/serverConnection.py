@@ -5,29 +5,94 @@ from __future__ import print_function
 import time
 
 from connection import ClientServerConnection
+from clockSync import ClockSyncEstimator
+import proto
+
+
+class ReceivedSequence(object):
+    """How far we have got with the sequenced events from one session of a client.
+    This outlives the connection so that events which are sent again after reconnecting are only handled once."""
+    __slots__ = ('session', 'lastSeq')
+
+    def __init__(self, session):
+        self.session = session
+        self.lastSeq = 0
+
+    def accept(self, seq):
+        """Return True if the event with sequence number seq hasn't been seen before, and note that it has now"""
+        if seq <= self.lastSeq:
+            return False
+        self.lastSeq = seq
+        return True
 
 
 class ServerConnection(ClientServerConnection):
     """A connection from a client to the server. There are many instances of this class, 1 for each connection"""
     outOfContactTime = 120
 
-    def __init__(self, sock, listeningThread, msgHandler):
-        ClientServerConnection.__init__(self)
+    def __init__(self, sock, listeningThread, msgHandler, eventLoop=None):
+        ClientServerConnection.__init__(self, eventLoop=eventLoop)
         self.listeningThread = listeningThread  # TODO: Can we remove this reference?
         self.msgHandler = msgHandler
         self.lastContact = time.time()
         self.latency = 0
         self.clientClockDrift = 0
+        self.clockSync = ClockSyncEstimator()
+        # The ReceivedSequence of the client's session (once it has told us which that is) and what we last acknowledged.
+        self.receivedSequence = None
+        self.acknowledgedSeq = None
+        self.duplicates = 0
+        # Sequenced events which arrived before the client told us its session.
+        self.earlySequenced = 0
 
         self.setSocket(sock)
 
     def handleMsg(self, fullLine):
-        event_time = self.msgHandler.handleMsg(fullLine, self)
-
-        self.lastContact = event_time
-        self.listeningThread.considerMovingConfidencePoint(event_time)
-
-        return event_time
+        return self.msgHandler.handleMsg(fullLine, self)
+
+    def handleMsgs(self, fullLines):
+        return self.msgHandler.handleMsgs(fullLines, self)
+
+    def eventsApplied(self, event_times):
+        """Called once the events we received together have been applied to the game"""
+        self._heardFrom(max(event_times))
+        # One acknowledgement covers everything in the batch.
+        self._acknowledge()
+
+    def setSession(self, received_sequence):
+        """The client has told us which session its sequence numbers are from, reply with how far we have got"""
+        self.receivedSequence = received_sequence
+        self.acknowledgedSeq = None
+        self._acknowledge()
+
+    def hasSession(self):
+        """Whether the client has told us which session its sequence numbers are from"""
+        return self.receivedSequence is not None
+
+    def isNewEvent(self, event):
+        """Return False if event is one we have already handled, which the client sent again after reconnecting"""
+        if event.seq is None or self.receivedSequence is None:
+            return True
+        if self.receivedSequence.accept(event.seq):
+            return True
+        self.duplicates += 1
+        return False
+
+    def _acknowledge(self):
+        if self.receivedSequence is None or self.receivedSequence.lastSeq == self.acknowledgedSeq:
+            return
+        self.acknowledgedSeq = self.receivedSequence.lastSeq
+        self.queueMessage(proto.ACK.create(self.acknowledgedSeq))
+
+    def _heardFrom(self, event_time):
+        """Note that the client has sent us everything up to event_time (in its clock)"""
+        server_time = self.clientTimeToServer(event_time)
+        self.lastContact = server_time
+
+        # Other clients' events might have been converted with errors in the other direction,
+        # so only count this client as being up to date as far as we are sure of.
+        error_bound = self.clockSync.errorBound(time.time()) or 0
+        self.listeningThread.updateWatermark(self, server_time - error_bound)
 
     def onDisconnect(self):
         # not much we can do until they reconnect apart from note the disconnection
@@ -45,13 +110,12 @@ class ServerConnection(ClientServerConnection):
     def outOfContactTimeStr(self):
         return "{:,}s".format((time.time() - self.lastContact))
 
-    def setLatency(self, latency):
-        self.latency = latency
-
-    def setClientClockDrift(self, drift):
-        """Set the difference between the client and server clocks.
-           A positive drift means the client is ahead of the server"""
-        self.clientClockDrift = drift
+    def addClockSample(self, server_send_time, client_time, server_recv_time):
+        """Add the timings of a ping we sent which the client answered at client_time"""
+        self.clockSync.addSample(server_send_time, client_time, server_recv_time)
+        self.latency = (server_recv_time - server_send_time) / 2.0
+        # A positive drift means the client is ahead of the server
+        self.clientClockDrift = self.clockSync.offsetAt(server_recv_time)
 
     def clientTimeToServer(self, client_time):
-        return client_time
+        return self.clockSync.clientTimeToServer(client_time)
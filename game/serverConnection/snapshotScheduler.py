@@ -0,0 +1,74 @@
+from __future__ import print_function
+
+import json
+import time
+import traceback
+from threading import Thread, Condition
+
+import proto
+from player import Player
+
+
+class SnapshotScheduler(Thread):
+    """Sends players' snapshots to their guns, at most one PlayerSnapshot and ParametersSnapshot pair per player
+    every flushInterval.
+
+    A replay can adjust the same player many times within a few milliseconds (e.g. a chain of late hits), so rather
+    than sending a snapshot for each adjustment we note that the player is dirty and send the latest state once
+    flushInterval has passed since the first adjustment.
+    """
+    # How long (in seconds) to wait for further adjustments before sending a snapshot.
+    flushInterval = 0.05
+
+    def __init__(self, listening_thread):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.name = "Snapshot Scheduler"
+        self.listeningThread = listening_thread
+        self.shouldStop = False
+        self._changed = Condition()
+        self._dirty = {}  # (team_id, player_id) -> the latest (player, parameters)
+
+        self.adjustments = 0
+        self.snapshotsSent = 0
+
+    def playerAdjusted(self, team_id, player_id, player, parameters):
+        """Note that a player has changed. This is a playerAdjusted listener for the GameState."""
+        with self._changed:
+            self.adjustments += 1
+            self._dirty[(team_id, player_id)] = (player, parameters)
+            self._changed.notify()
+
+    def stop(self):
+        with self._changed:
+            self.shouldStop = True
+            self._changed.notify()
+
+    def run(self):
+        while True:
+            with self._changed:
+                while not self._dirty and not self.shouldStop:
+                    self._changed.wait()
+                if self.shouldStop:
+                    return
+
+                # Give any other adjustments in this replay a chance to arrive.
+                flush_time = time.time() + self.flushInterval
+                while not self.shouldStop and time.time() < flush_time:
+                    self._changed.wait(flush_time - time.time())
+
+            try:
+                self.flush()
+            except Exception:  # pylint:disable=broad-except
+                traceback.print_exc()
+
+    def flush(self):
+        """Send the snapshots of all the dirty players now"""
+        with self._changed:
+            (dirty, self._dirty) = (self._dirty, {})
+
+        for ((team_id, player_id), (player, parameters)) in dirty.items():
+            msg = proto.PLAYER_SNAPSHOT.create(json.dumps(player, cls=Player.Encoder))
+            self.listeningThread.queueMessage(team_id, player_id, msg)
+            self.listeningThread.queuePrepared(team_id, player_id, self.listeningThread.parametersSnapshot(parameters))
+            self.snapshotsSent += 1
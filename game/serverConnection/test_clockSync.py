@@ -0,0 +1,61 @@
+"""Test estimating the offset of client clocks"""
+
+import pytest
+from clockSync import ClockSyncEstimator
+
+
+def test_no_samples():
+    estimator = ClockSyncEstimator()
+
+    assert estimator.clientTimeToServer(1000) == 1000
+    assert estimator.errorBound(1000) is None
+
+
+def test_single_sample():
+    estimator = ClockSyncEstimator()
+
+    # The client is 50s ahead, the ping took 2s there and back.
+    estimator.addSample(100, 151, 102)
+
+    assert estimator.offsetAt(102) == 50
+    assert estimator.clientTimeToServer(1050) == 1000
+    assert estimator.errorBound(102) == 1
+
+
+def test_lowest_round_trip_samples_are_trusted():
+    estimator = ClockSyncEstimator()
+
+    # Slow round trips where the answer was delayed on the way back.
+    for t in range(0, 100, 10):
+        estimator.addSample(t, t + 50, t + 8)
+    # Quick round trips
+    for t in range(100, 140, 10):
+        estimator.addSample(t, t + 50.1, t + 0.2)
+
+    assert estimator.offsetAt(140) == pytest.approx(50, abs=0.01)
+    assert estimator.errorBound(130.2) == pytest.approx(0.1)
+
+
+def test_drift():
+    estimator = ClockSyncEstimator()
+
+    # The client clock runs 100ppm fast.
+    for t in range(0, 1000, 100):
+        estimator.addSample(t, 20 + t * 1.0001 + 0.5, t + 1)
+
+    assert estimator.drift == pytest.approx(0.0001)
+    assert estimator.clientTimeToServer(20 + 2000 * 1.0001) == pytest.approx(2000, abs=0.01)
+
+
+def test_error_bound_grows_with_time():
+    estimator = ClockSyncEstimator()
+    estimator.addSample(100, 150, 102)
+
+    assert estimator.errorBound(10102) == pytest.approx(1 + 10000 * estimator.maxDriftRate)
+
+
+def test_negative_round_trip_ignored():
+    estimator = ClockSyncEstimator()
+    estimator.addSample(100, 150, 99)
+
+    assert estimator.errorBound(100) is None
@@ -0,0 +1,91 @@
+"""Test keeping track of the connections' states, players and client ids"""
+
+from connectionRegistry import ConnectionRegistry, DISCONNECTED, UNINITIALISED, INITIALISING, ESTABLISHED
+
+
+class FakeConnection(object):
+    clientId = None
+
+
+def test_states():
+    registry = ConnectionRegistry()
+    connection = FakeConnection()
+
+    registry.add(connection)
+    assert registry.state(connection) == DISCONNECTED
+    assert registry.snapshot().disconnected == 1
+
+    registry.helloReceived(connection, 0x123)
+    assert connection.clientId == 0x123
+    assert registry.state(connection) == UNINITIALISED
+    assert registry.clientConnection(0x123) is connection
+
+    assert registry.startInitialising() is connection
+    assert registry.state(connection) == INITIALISING
+    assert registry.initialising is connection
+
+    assert registry.establish(connection, (1, 2)) is None
+    assert registry.state(connection) == ESTABLISHED
+    assert registry.initialising is None
+    assert registry.established() == [((1, 2), connection)]
+
+    assert registry.remove(connection) == (1, 2)
+    assert registry.state(connection) is None
+    assert registry.clientConnection(0x123) is None
+    assert registry.clientKey(0x123) == (1, 2)
+
+
+def test_initialised_in_order():
+    registry = ConnectionRegistry()
+    connections = [FakeConnection() for _ in range(3)]
+    for (client_id, connection) in enumerate(connections):
+        registry.helloReceived(connection, client_id)
+
+    assert registry.startInitialising() is connections[0]
+    # Only one initialises at a time, the previous one goes back to waiting.
+    assert registry.startInitialising(connections[2]) is connections[2]
+    assert registry.snapshot().uninitialised == [connections[1], connections[0]]
+
+
+def test_reconnecting_client_replaces_connection():
+    registry = ConnectionRegistry()
+    old = FakeConnection()
+    registry.helloReceived(old, 0x123)
+    registry.establish(old, (1, 1))
+
+    new = FakeConnection()
+    registry.helloReceived(new, 0x123)
+    assert registry.establish(new, (1, 1)) is old
+    assert registry.get((1, 1)) is new
+    assert registry.state(old) is None
+
+    # so when the old connection is eventually noticed to have gone, the player keeps the new one.
+    assert registry.remove(old) is None
+    assert registry.get((1, 1)) is new
+
+
+def test_snapshot_is_a_copy():
+    registry = ConnectionRegistry()
+    connection = FakeConnection()
+    registry.helloReceived(connection, 0x123)
+    registry.establish(connection, (1, 1))
+
+    snapshot = registry.snapshot()
+    registry.forget((1, 1))
+
+    assert snapshot.connections == {(1, 1): connection}
+    assert snapshot.connectedClients == {0x123: (1, 1)}
+    assert registry.snapshot().connections == {}
+    assert registry.clientKey(0x123) is None
+
+
+def test_move_onto_another_connection():
+    registry = ConnectionRegistry()
+    (moving, other) = (FakeConnection(), FakeConnection())
+    registry.establish(moving, (1, 1))
+    registry.establish(other, (1, 2))
+
+    assert registry.move((1, 1), (1, 2)) == (moving, other)
+    assert registry.get((1, 2)) is moving
+    assert registry.state(other) is None
+    assert registry.move((1, 1), (1, 3)) == (None, None)
@@ -1,8 +1,14 @@
 """Test listening for new connections and keeping track of them"""
 
+import threading
+import time
+
 import pytest
 from listeningThread import ListeningThread
+from serverConnection import ServerConnection
+from timerWheel import TimerWheel
 from player import Player
+from parameters import Parameters
 
 # pylint:disable=redefined-outer-name
 
@@ -26,14 +32,17 @@ def test_establishConnection(listening_thread, mocker):
     client_id = 'abc123'
     server.clientId = client_id
 
-    listening_thread.uninitialisedConnections = {server, server2}
+    listening_thread.registry.helloReceived(server, client_id)
+    listening_thread.registry.helloReceived(server2, 'def456')
 
     listening_thread.establishConnection(server, player)
 
-    assert listening_thread.uninitialisedConnections == {server2}
-    assert listening_thread.initialisingConnection is None
-    assert listening_thread.connections[(1, 1)] == server
-    assert listening_thread.connectedClients[client_id] == (1, 1)
+    snapshot = listening_thread.registry.snapshot()
+    assert snapshot.uninitialised == [server2]
+    assert snapshot.initialising is None
+    assert snapshot.connections == {(1, 1): server}
+    assert snapshot.connectedClients == {client_id: (1, 1)}
+    assert listening_thread.registry.keyOf(server) == (1, 1)
     listening_thread.gameLogic.gameState._notifyPlayerInitialisedListeners.assert_called_once()
 
 
@@ -45,15 +54,18 @@ def test_establishConnection_initialising(listening_thread, mocker):
     client_id = 'abc123'
     server.clientId = client_id
 
-    listening_thread.uninitialisedConnections = {server2}
-    listening_thread.initialisingConnection = server
+    listening_thread.registry.helloReceived(server2, 'def456')
+    listening_thread.registry.helloReceived(server, client_id)
+    listening_thread.registry.startInitialising(server)
 
     listening_thread.establishConnection(server, player)
 
-    assert listening_thread.uninitialisedConnections == {server2}
+    snapshot = listening_thread.registry.snapshot()
+    assert snapshot.uninitialised == [server2]
+    assert snapshot.initialising is None
     assert listening_thread.initialisingConnection is None
-    assert listening_thread.connections[(1, 1)] == server
-    assert listening_thread.connectedClients[client_id] == (1, 1)
+    assert snapshot.connections == {(1, 1): server}
+    assert snapshot.connectedClients == {client_id: (1, 1)}
     listening_thread.gameLogic.gameState._notifyPlayerInitialisedListeners.assert_called_once()
 
 
@@ -61,13 +73,254 @@ def test_startInitialising(listening_thread, mocker):
     """Test startInitialising"""
     server = mocker.MagicMock()
 
-    listening_thread.uninitialisedConnections = {server}
+    listening_thread.registry.helloReceived(server, 'abc123')
 
-    listening_thread.startInitialising(server)
+    assert listening_thread.startInitialising() == server
 
     assert listening_thread.initialisingConnection == server
-    assert listening_thread.uninitialisedConnections == set([])
-
+    assert listening_thread.registry.snapshot().uninitialised == []
+    server.queueMessage.assert_called_once_with("StartInitialising()")
     listening_thread.gameLogic.gameState._notifyPlayerInitialisingListeners.assert_called_once()
 
+    # There isn't another one waiting.
+    assert listening_thread.startInitialising() is None
+
+
+def test_lostConnection_and_reconnect(listening_thread, mocker):
+    """Test a lost connection is forgotten but its client still gets its player back"""
+    server = mocker.MagicMock()
+    listening_thread.registry.add(server)
+    listening_thread.registry.helloReceived(server, 'abc123')
+    listening_thread.establishConnection(server, Player(team_id=2, player_id=3))
+
+    listening_thread.lostConnection(server)
+    assert listening_thread.registry.get((2, 3)) is None
+    assert listening_thread.registry.state(server) is None
+    assert listening_thread.isConnected('abc123') == (2, 3)
+
+    server2 = mocker.MagicMock()
+    listening_thread.registry.helloReceived(server2, 'abc123')
+    listening_thread.establishConnection(server2, Player(team_id=2, player_id=3))
+    assert listening_thread.registry.get((2, 3)) is server2
+
+
+def test_reconnect_before_lost_connection(listening_thread, mocker, monkeypatch):
+    """Test that a connection replaced by the client reconnecting is stopped and no longer holds the confidence point back"""
+    monkeypatch.setattr('time.time', lambda: 100)
+    old = mocker.MagicMock()
+    old.lastContact = 10
+    listening_thread.registry.helloReceived(old, 'abc123')
+    listening_thread.establishConnection(old, Player(team_id=1, player_id=1))
+
+    new = mocker.MagicMock()
+    new.lastContact = 50
+    listening_thread.registry.helloReceived(new, 'abc123')
+    listening_thread.establishConnection(new, Player(team_id=1, player_id=1))
+
+    old.stop.assert_called_once_with(wait=False)
+    assert not listening_thread.watermarks.isTracked(old)
+    assert old not in listening_thread.oocUpdater._timers
+    listening_thread.updateWatermark(new, 60)
+    listening_thread.gameLogic.gameState.adjustConfidencePoint.assert_called_with(60)
+
+    # Moving a player onto another player's connection replaces it too.
+    other = mocker.MagicMock()
+    other.lastContact = 50
+    listening_thread.establishConnection(other, Player(team_id=1, player_id=2))
+    listening_thread.movePlayer(1, 1, Player(team_id=1, player_id=2))
+    other.stop.assert_called_once_with(wait=False)
+    assert not listening_thread.watermarks.isTracked(other)
+    assert other not in listening_thread.oocUpdater._timers
+
+
+def test_replacing_live_connection_doesnt_block(listening_thread, mocker):
+    """Test that replacing a connection whose write thread is waiting for something to send doesn't wait for it"""
+    def real_connection():
+        sock = mocker.MagicMock()
+        sock.recv_into.side_effect = lambda *args: threading.Event().wait()
+        sock.send.side_effect = len
+        return ServerConnection(sock, listening_thread, listening_thread.msgHandler)
+
+    old = real_connection()
+    listening_thread.registry.helloReceived(old, 'abc123')
+    listening_thread.establishConnection(old, Player(team_id=1, player_id=1))
+    new = real_connection()
+    listening_thread.registry.helloReceived(new, 'abc123')
+
+    start = time.time()
+    listening_thread.establishConnection(new, Player(team_id=1, player_id=1))
+    assert time.time() - start < 0.5
+
+    # and the old write thread does finish
+    old.writeThread.join(1)
+    assert not old.writeThread.is_alive()
+    new.stop()
+
+
+def test_movePlayer_and_deletePlayer(listening_thread, mocker):
+    """Test moving and deleting a player moves and forgets its connection and client id"""
+    server = mocker.MagicMock()
+    listening_thread.registry.helloReceived(server, 'abc123')
+    listening_thread.establishConnection(server, Player(team_id=1, player_id=1))
+
+    listening_thread.movePlayer(1, 1, Player(team_id=2, player_id=1))
+    assert listening_thread.registry.get((1, 1)) is None
+    assert listening_thread.registry.get((2, 1)) is server
+    assert listening_thread.registry.keyOf(server) == (2, 1)
+    assert listening_thread.isConnected('abc123') == (2, 1)
+
+    listening_thread.deletePlayer(2, 1)
+    server.queueMessage.assert_called_with("Deleted()")
+    assert listening_thread.registry.get((2, 1)) is None
+    assert listening_thread.isConnected('abc123') is None
+    assert listening_thread.registry.snapshot().connectedClients == {}
+
 # TODO lots more
+
+
+def test_updateWatermark(listening_thread, mocker, monkeypatch):
+    """Test the confidence point follows the lowest watermark"""
+    monkeypatch.setattr('time.time', lambda: 100)
+    server = mocker.MagicMock()
+    server.lastContact = 10
+    server2 = mocker.MagicMock()
+    server2.lastContact = 20
+    adjustConfidencePoint = listening_thread.gameLogic.gameState.adjustConfidencePoint
+
+    listening_thread.establishConnection(server, Player(team_id=1, player_id=1))
+    listening_thread.establishConnection(server2, Player(team_id=1, player_id=2))
+
+    listening_thread.updateWatermark(server2, 40)
+    adjustConfidencePoint.assert_called_once_with(10)
+
+    listening_thread.updateWatermark(server, 50)
+    adjustConfidencePoint.assert_called_with(40)
+
+    # The confidence point never goes backwards, even when a connection which is further behind is added.
+    server3 = mocker.MagicMock()
+    server3.lastContact = 20
+    listening_thread.establishConnection(server3, Player(team_id=2, player_id=1))
+    listening_thread.updateWatermark(server3, 30)
+    assert adjustConfidencePoint.call_count == 2
+
+    # and once that connection has gone, we can move on again.
+    listening_thread.lostConnection(server3)
+    listening_thread.updateWatermark(server2, 60)
+    adjustConfidencePoint.assert_called_with(50)
+
+
+def test_lagging_connection_doesnt_hold_back_confidence_point(listening_thread, mocker, monkeypatch):
+    """Test that a connection we haven't heard from for a long time is ignored"""
+    monkeypatch.setattr('time.time', lambda: 1000)
+    server = mocker.MagicMock()
+    server.lastContact = 10
+    listening_thread.watermarks.maxLag = 100
+
+    listening_thread.establishConnection(server, Player(team_id=1, player_id=1))
+    listening_thread.considerMovingConfidencePoint()
+
+    listening_thread.gameLogic.gameState.adjustConfidencePoint.assert_called_once_with(900)
+
+
+def test_queueMessageToAll(listening_thread, mocker):
+    """Test a broadcast is prepared once and shared by all the connections"""
+    server = mocker.MagicMock()
+    server2 = mocker.MagicMock()
+    listening_thread.registry.establish(server, (1, 1))
+    listening_thread.registry.establish(server2, (1, 2))
+
+    listening_thread.queueMessageToAll("StopGame()")
+
+    prepared = server.queuePrepared.call_args[0][0]
+    assert prepared.event.msgStr == "StopGame()"
+    server2.queuePrepared.assert_called_once_with(prepared)
+
+
+def test_parametersSnapshot(listening_thread):
+    """Test the ParametersSnapshot is shared until the parameters change"""
+    parameters = Parameters()
+
+    snapshot = listening_thread.parametersSnapshot(parameters)
+    assert snapshot.event.msgStr.startswith("ParametersSnapshot(")
+    assert listening_thread.parametersSnapshot(parameters.clone()) is snapshot
+
+    parameters._addEffect("player.maxHealth", "1.*", 1, "+10")
+    changed = listening_thread.parametersSnapshot(parameters)
+    assert changed is not snapshot
+    assert changed.event.msgStr != snapshot.event.msgStr
+
+
+def test_receivedSequence(listening_thread):
+    """Test that a client's sequence numbers are remembered until it starts a new session"""
+    received_sequence = listening_thread.receivedSequence(0x123def, 1)
+    assert received_sequence.accept(1)
+    assert listening_thread.receivedSequence(0x123def, 1) is received_sequence
+    assert listening_thread.receivedSequence(0x456, 1) is not received_sequence
+
+    restarted = listening_thread.receivedSequence(0x123def, 2)
+    assert restarted.lastSeq == 0
+    assert restarted.accept(1)
+
+
+def test_out_of_contact(listening_thread, mocker, monkeypatch):
+    """Test that a connection going out of contact, and coming back, is noticed and reported"""
+    now = [1000]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    ooc_updater = listening_thread.oocUpdater
+    ooc_updater.wheel = TimerWheel(ooc_updater.tickInterval, now=now[0])
+    notify = listening_thread.gameLogic.gameState._notifyPlayerOutOfContactListeners
+    server = mocker.MagicMock()
+    server.lastContact = 1000
+    server.outOfContactTime = 120
+    listening_thread.establishConnection(server, Player(team_id=1, player_id=2))
+
+    # Hearing from it before the deadline pushes the deadline back.
+    now[0] = 1100
+    server.lastContact = 1100
+    ooc_updater.wheel.advance(1150)
+    assert not notify.called
+
+    now[0] = 1250
+    ooc_updater.wheel.advance(now[0])
+    notify.assert_called_once_with(1, 2, True)
+
+    server.lastContact = 1250
+    listening_thread.updateWatermark(server, 1250)
+    notify.assert_called_with(1, 2, False)
+
+    # and it is being watched again.
+    now[0] = 1400
+    ooc_updater.wheel.advance(now[0])
+    notify.assert_called_with(1, 2, True)
+    assert notify.call_count == 3
+
+
+def test_pings_spread_out(listening_thread, mocker, monkeypatch):
+    """Test each connection is pinged once per interval, but not all at the same time"""
+    now = [1000]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    ooc_updater = listening_thread.oocUpdater
+    ooc_updater.wheel = TimerWheel(ooc_updater.tickInterval, now=now[0])
+    interval = ooc_updater.latencyCheckInterval
+    servers = []
+    for player_id in range(1, 21):
+        server = mocker.MagicMock()
+        server.lastContact = 1000
+        server.outOfContactTime = 120
+        listening_thread.establishConnection(server, Player(team_id=1, player_id=player_id))
+        servers.append(server)
+
+    def advance(to):
+        now[0] = to
+        return ooc_updater.wheel.advance(to)
+
+    pinged = advance(1000 + interval / 2.0)
+    assert 0 < pinged < len(servers)
+    advance(1000 + interval)
+    assert all(server.startLatencyCheck.call_count == 1 for server in servers)
+
+    # Once it has gone, it isn't pinged any more.
+    listening_thread.lostConnection(servers[0])
+    advance(1000 + 2 * interval)
+    assert servers[0].startLatencyCheck.call_count == 1
+    assert all(server.startLatencyCheck.call_count == 2 for server in servers[1:])
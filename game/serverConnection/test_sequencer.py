@@ -0,0 +1,104 @@
+"""Test applying clients' messages on the sequencer's thread"""
+
+import time
+
+import pytest
+from msgHandler import ServerMsgHandler
+
+# pylint:disable=redefined-outer-name
+
+
+@pytest.fixture
+def msg_handler(mocker):
+    return ServerMsgHandler(mocker.MagicMock(), mocker.MagicMock(), sequenced=True)
+
+
+@pytest.fixture
+def server(mocker):
+    server = mocker.MagicMock()
+    server.clientTimeToServer.side_effect = lambda t: t + 100
+    return server
+
+
+def test_parsed_not_applied(msg_handler, server):
+    """Test that messages are parsed by handleMsgs but left for the sequencer to apply"""
+    assert msg_handler.handleMsgs(["E(123def,100,Recv(1,1,T))", "E(123def,101,Recv(1,2,H2,1,3))"], server) == [100, 101]
+
+    assert msg_handler.gameLogic.mock_calls == []
+    server.eventsApplied.assert_not_called()
+    (connection, parsed, dummy_submitted) = msg_handler.sequencer.queue.get_nowait()
+    assert connection is server
+    assert [(p.event.time, p.handler, p.args) for p in parsed] == [
+        (100, ServerMsgHandler.gunHandlers.match("T")[0], (1, 1)),
+        (101, ServerMsgHandler.gunHandlers.match("H2,1,3")[0], (1, 2, "2", "1", "3")),
+    ]
+
+
+def test_unparseable_line_skipped(msg_handler, server):
+    """Test that a line which can't be parsed doesn't lose the rest of what was received with it"""
+    assert msg_handler.handleMsgs(["E(123def,100,Recv(1,1,T))", "garbage", "E(123def,101,Recv(1,1,t))"], server) == [100, True, 101]
+    assert msg_handler.parseErrors == 1
+
+    sequencer = msg_handler.sequencer
+    sequencer.applyBatch([sequencer.queue.get_nowait()])
+    msg_handler.gameLogic.trigger.assert_called_once_with(200, 1, 1)
+    msg_handler.gameLogic.triggerRelease.assert_called_once_with(201, 1, 1)
+    server.eventsApplied.assert_called_once_with([100, 101])
+
+
+def test_apply_batch(msg_handler, server, mocker):
+    """Test that everything submitted together is applied as one batch"""
+    server2 = mocker.MagicMock()
+    server2.clientTimeToServer.side_effect = lambda t: t + 200
+    msg_handler.handleMsgs(["E(123def,100,Recv(1,1,T))", "E(123def,101,Recv(1,1,t))"], server)
+    msg_handler.handleMsg("E(456,102,Recv(2,1,T))", server2)
+
+    sequencer = msg_handler.sequencer
+    sequencer.applyBatch([sequencer.queue.get_nowait(), sequencer.queue.get_nowait()])
+
+    msg_handler.gameLogic.batch.assert_called_once_with()
+    assert msg_handler.gameLogic.trigger.call_args_list == [mocker.call(200, 1, 1), mocker.call(302, 2, 1)]
+    msg_handler.gameLogic.triggerRelease.assert_called_once_with(201, 1, 1)
+    server.eventsApplied.assert_called_once_with([100, 101])
+    server2.eventsApplied.assert_called_once_with([102])
+
+    stats = sequencer.stats()
+    assert stats['batches'] == 1
+    assert stats['parse']['count'] == 3
+    assert stats['queue']['count'] == 3
+    assert stats['apply']['count'] == 3
+
+
+def test_failing_submission_doesnt_stop_batch(msg_handler, server, mocker):
+    """Test that a message which can't be applied doesn't stop the rest of the batch, and isn't counted as applied"""
+    server2 = mocker.MagicMock()
+    server2.clientTimeToServer.side_effect = lambda t: t + 200
+    # Nobody is initialising, so this fails.
+    msg_handler.listeningThread.initialisingConnection = None
+    msg_handler.gameLogic.gameState.createNewPlayer.return_value = None
+    msg_handler.handleMsg("E(123def,100,Recv(1,1,InitHit))", server)
+    msg_handler.handleMsgs(["E(456,101,Recv(1,2,H1,1,5))", "E(456,102,Recv(1,2,T))"], server2)
+    msg_handler.gameLogic.trigger.side_effect = [ValueError("broken")]
+
+    sequencer = msg_handler.sequencer
+    sequencer.applyBatch([sequencer.queue.get_nowait(), sequencer.queue.get_nowait()])
+
+    msg_handler.gameLogic.hit.assert_called_once_with(301, 1, 2, 1, 1, 5)
+    server.eventsApplied.assert_not_called()
+    server2.eventsApplied.assert_called_once_with([101])
+
+
+def test_thread(msg_handler, server):
+    sequencer = msg_handler.sequencer
+    sequencer.start()
+    try:
+        msg_handler.handleMsg("E(123def,100,Recv(1,1,T))", server)
+        end = time.time() + 2
+        while not server.eventsApplied.called and time.time() < end:
+            time.sleep(0.01)
+        msg_handler.gameLogic.trigger.assert_called_once_with(200, 1, 1)
+        server.eventsApplied.assert_called_once_with([100])
+    finally:
+        sequencer.stop()
+        sequencer.join(1)
+    assert not sequencer.is_alive()
@@ -1,7 +1,10 @@
 """Test how the client handles messages from the server"""
 
+import threading
+
 import pytest
 from msgHandler import ServerMsgHandler
+from serverConnection import ServerConnection, ReceivedSequence
 from player import Player
 from parameters import Parameters
 
@@ -20,17 +23,17 @@ def test_ping(msg_handler, mocker):
     """Test handling of PING message"""
     server = mocker.MagicMock()
     assert msg_handler.handleMsg("E(123def,1516565652,Ping())", server)
-    server.queueMessage.assert_called_once_with("Pong(1516565652,1)")
+    server.queueMessage.assert_called_once_with("Pong(1516565652.000000,1)")
 
 
 def test_simple_pong(msg_handler, monkeypatch, mocker):
     """Test handling of PONG message which doesn't need a response"""
     server = mocker.MagicMock()
+    server.protocolVersion = 2
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     assert msg_handler.handleMsg("E(123def,1200,Pong(100,0))", server)
-    server.setLatency.assert_called_once_with(100)
-    server.setClientClockDrift.assert_called_once_with(1000)
+    server.addClockSample.assert_called_once_with(100, 1200, 300)
     assert server.queueMessage.call_count == 0
 
 
@@ -38,7 +41,7 @@ def test_reply_pong(msg_handler, mocker):
     """Test handling of PONG message which requests a response"""
     server = mocker.MagicMock()
     assert msg_handler.handleMsg("E(123def,1516565852,Pong(1516565652,1))", server)
-    server.queueMessage.assert_called_once_with("Pong(1516565852,0)")
+    server.queueMessage.assert_called_once_with("Pong(1516565852.000000,0)")
 
 
 def test_hello_new(msg_handler, mocker):
@@ -51,6 +54,20 @@ def test_hello_new(msg_handler, mocker):
     msg_handler.gameLogic.gameState.withCurrGameState.side_effect = lambda x: x(cgs)
     assert msg_handler.handleMsg("E(123def,1516565852,Hello())", server)
     msg_handler.listeningThread.recievedHello.assert_called_once_with(server, 0x123def)
+    server.setProtocolVersion.assert_called_once_with(1)
+    server.queueMessage.assert_not_called()
+
+
+@pytest.mark.parametrize("client_version,version", [(2, 2), (3, 3), (4, 3)])
+def test_hello_binary(msg_handler, mocker, client_version, version):
+    """Test handling of HELLO message from a client which understands the binary protocol"""
+    server = mocker.MagicMock()
+    msg_handler.listeningThread.isConnected.return_value = None
+
+    assert msg_handler.handleMsg("E(123def,1516565852,Hello(%d))" % client_version, server)
+    server.queueMessage.assert_called_once_with("Hello(%d)" % version)
+    server.setProtocolVersion.assert_called_once_with(version)
+    msg_handler.listeningThread.recievedHello.assert_called_once_with(server, 0x123def)
 
 
 def test_hello_existing(msg_handler, mocker):
@@ -176,3 +193,96 @@ def test_recv_triggerRelease(msg_handler, mocker):
 
     server.clientTimeToServer.assert_called_once_with(100)
     msg_handler.gameLogic.triggerRelease.assert_called_once_with(200, 1, 1)
+
+
+def test_handle_msgs(msg_handler, mocker):
+    """Test handling several messages at once adds the game events as one batch"""
+    server = mocker.MagicMock()
+    server.clientTimeToServer.side_effect = lambda t: t + 100
+
+    assert msg_handler.handleMsgs(["E(123def,100,Recv(1,1,T))", "E(123def,101,Recv(1,1,t))"], server) == [100, 101]
+
+    msg_handler.gameLogic.batch.assert_called_once_with()
+    msg_handler.gameLogic.trigger.assert_called_once_with(200, 1, 1)
+    msg_handler.gameLogic.triggerRelease.assert_called_once_with(201, 1, 1)
+
+
+def test_watermark(msg_handler, mocker):
+    """Test handling of WATERMARK message, the time is all that matters"""
+    server = mocker.MagicMock()
+
+    assert msg_handler.handleMsg("E(123def,1516565852,Watermark())", server) == 1516565852
+    assert server.queueMessage.call_count == 0
+    assert msg_handler.gameLogic.mock_calls == []
+
+
+@pytest.fixture
+def connection(msg_handler, mocker):
+    """A real connection, so that it keeps track of the sequence numbers it has handled"""
+    sock = mocker.MagicMock()
+    sock.recv_into.side_effect = lambda *args: threading.Event().wait()
+    sock.send.side_effect = len
+    connection = ServerConnection(sock, msg_handler.listeningThread, msg_handler)
+    connection.queueMessage = mocker.MagicMock()
+    return connection
+
+
+def test_session(msg_handler, connection):
+    """Test that the client is told how far we have got with its session"""
+    received_sequence = ReceivedSequence(0xabc)
+    received_sequence.lastSeq = 7
+    msg_handler.listeningThread.receivedSequence.return_value = received_sequence
+
+    assert connection.handleMsg("E(123def,1516565852,Session(abc))")
+
+    msg_handler.listeningThread.receivedSequence.assert_called_once_with(0x123def, 0xabc)
+    connection.queueMessage.assert_called_once_with("Ack(7)")
+
+
+def test_duplicates_dropped(msg_handler, connection):
+    """Test that events which the client sends again are only handled once and are acknowledged together"""
+    msg_handler.listeningThread.receivedSequence.return_value = ReceivedSequence(0xabc)
+    connection.handleMsg("E(123def,1516565852,Session(abc))")
+    connection.queueMessage.reset_mock()
+
+    connection.handleMsgs(["E(123def,100,#1,Recv(1,1,T))", "E(123def,101,#2,Recv(1,1,t))"])
+    connection.queueMessage.assert_called_once_with("Ack(2)")
+
+    connection.handleMsgs(["E(123def,100,#1,Recv(1,1,T))", "E(123def,101,#2,Recv(1,1,t))", "E(123def,102,#3,Recv(1,1,T))"])
+    assert msg_handler.gameLogic.trigger.call_count == 2
+    assert msg_handler.gameLogic.triggerRelease.call_count == 1
+    assert connection.duplicates == 2
+    connection.queueMessage.assert_called_with("Ack(3)")
+
+    # Nothing new, so nothing to acknowledge
+    connection.handleMsg("E(123def,103,Watermark())")
+    assert connection.queueMessage.call_count == 2
+
+
+def test_pong_v1(msg_handler, connection, monkeypatch):
+    """Test that a PONG from a client which sends the ping time in whole seconds doesn't change its clock estimate"""
+    monkeypatch.setattr('time.time', lambda: 100.9)
+    assert connection.protocolVersion == 1
+    assert connection.handleMsg("E(123def,100.5,Pong(100,0))")
+    assert connection.clientTimeToServer(1000) == 1000
+
+
+def test_sequenced_before_session(msg_handler, connection, mocker):
+    """Test that events left in the queue of a client's old connection, which arrive ahead of its SESSION, are only
+    handled when the client sends them again after we have acknowledged the session"""
+    received_sequence = ReceivedSequence(0xabc)
+    received_sequence.lastSeq = 1
+    msg_handler.listeningThread.receivedSequence.return_value = received_sequence
+    mocker.patch.object(connection, 'eventsApplied')
+
+    connection.handleMsgs(["E(123def,100,#2,Recv(1,1,T))", "E(123def,101,Watermark())"])
+    assert not msg_handler.gameLogic.trigger.called
+    assert connection.earlySequenced == 1
+    connection.eventsApplied.assert_called_once_with([101])
+
+    connection.handleMsg("E(123def,102,Session(abc))")
+    connection.queueMessage.assert_called_once_with("Ack(1)")
+
+    connection.handleMsg("E(123def,100,#2,Recv(1,1,T))")
+    assert msg_handler.gameLogic.trigger.call_count == 1
+    assert connection.duplicates == 0
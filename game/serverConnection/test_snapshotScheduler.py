@@ -0,0 +1,67 @@
+"""Test sending coalesced snapshots when players are adjusted"""
+
+import time
+
+import pytest
+from snapshotScheduler import SnapshotScheduler
+from player import Player
+from parameters import Parameters
+
+# pylint:disable=redefined-outer-name
+
+
+@pytest.fixture
+def listening_thread(mocker):
+    return mocker.MagicMock()
+
+
+@pytest.fixture
+def scheduler(listening_thread):
+    return SnapshotScheduler(listening_thread)
+
+
+def test_latest_snapshot_sent_once(scheduler, listening_thread):
+    """Test that many adjustments of a player only send the latest snapshot"""
+    parameters = Parameters()
+    for health in range(5, 0, -1):
+        scheduler.playerAdjusted(1, 2, Player(team_id=1, player_id=2, health=health), parameters)
+
+    scheduler.flush()
+
+    listening_thread.queueMessage.assert_called_once()
+    (team_id, player_id, msg) = listening_thread.queueMessage.call_args[0]
+    assert (team_id, player_id) == (1, 2)
+    assert msg.startswith("PlayerSnapshot(")
+    assert '"health": 1' in msg
+    listening_thread.parametersSnapshot.assert_called_once_with(parameters)
+    listening_thread.queuePrepared.assert_called_once_with(1, 2, listening_thread.parametersSnapshot.return_value)
+    assert scheduler.adjustments == 5
+    assert scheduler.snapshotsSent == 1
+
+
+def test_each_player_sent(scheduler, listening_thread):
+    parameters = Parameters()
+    scheduler.playerAdjusted(1, 1, Player(team_id=1, player_id=1), parameters)
+    scheduler.playerAdjusted(1, 2, Player(team_id=1, player_id=2), parameters)
+    scheduler.playerAdjusted(1, 1, Player(team_id=1, player_id=1), parameters)
+
+    scheduler.flush()
+
+    assert sorted(call[0][:2] for call in listening_thread.queueMessage.call_args_list) == [(1, 1), (1, 2)]
+
+    # Nothing is dirty any more
+    scheduler.flush()
+    assert listening_thread.queueMessage.call_count == 2
+
+
+def test_thread_flushes(scheduler, listening_thread):
+    scheduler.flushInterval = 0.01
+    scheduler.start()
+    try:
+        scheduler.playerAdjusted(1, 2, Player(team_id=1, player_id=2), Parameters())
+        time.sleep(0.2)
+        listening_thread.queueMessage.assert_called_once()
+    finally:
+        scheduler.stop()
+        scheduler.join(1)
+    assert not scheduler.is_alive()
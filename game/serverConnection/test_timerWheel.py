@@ -0,0 +1,70 @@
+"""Test the timer wheel used to schedule pings and out of contact checks"""
+
+from timerWheel import TimerWheel
+
+
+def test_timers_called_in_order_when_due(mocker):
+    wheel = TimerWheel(1, slotCount=8, now=0)
+    callback = mocker.MagicMock()
+    wheel.schedule(2.5, callback, 'b')
+    wheel.schedule(1, callback, 'a')
+    assert len(wheel) == 2
+
+    assert wheel.advance(0.9) == 0
+    assert wheel.advance(2) == 1
+    callback.assert_called_once_with('a')
+
+    # Never early, the deadlines are rounded up to the next tick.
+    assert wheel.advance(2.9) == 0
+    assert wheel.advance(3) == 1
+    callback.assert_called_with('b')
+    assert len(wheel) == 0
+
+
+def test_cancel(mocker):
+    wheel = TimerWheel(1, slotCount=8, now=0)
+    callback = mocker.MagicMock()
+    timer = wheel.schedule(2, callback)
+    wheel.cancel(timer)
+    wheel.cancel(timer)
+    wheel.cancel(None)
+
+    assert wheel.advance(5) == 0
+    assert len(wheel) == 0
+    assert not callback.called
+
+
+def test_past_deadline_called_on_next_tick(mocker):
+    wheel = TimerWheel(1, slotCount=8, now=10)
+    callback = mocker.MagicMock()
+    wheel.schedule(3, callback)
+
+    assert wheel.advance(10.5) == 0
+    assert wheel.advance(11) == 1
+
+
+def test_timers_beyond_a_revolution(mocker):
+    wheel = TimerWheel(1, slotCount=8, now=0)
+    calls = []
+    for deadline in [3, 11, 19, 30]:
+        wheel.schedule(deadline, calls.append, deadline)
+
+    # 3, 11 and 19 share a slot, but only the ones which are due are called.
+    wheel.advance(4)
+    assert calls == [3]
+    wheel.advance(12)
+    assert calls == [3, 11]
+
+    # Falling behind by more than a revolution still calls everything due, in order.
+    wheel.advance(100)
+    assert calls == [3, 11, 19, 30]
+
+
+def test_broken_timer_doesnt_stop_others(mocker):
+    wheel = TimerWheel(1, slotCount=8, now=0)
+    callback = mocker.MagicMock()
+    wheel.schedule(1, mocker.MagicMock(side_effect=ValueError))
+    wheel.schedule(1, callback)
+
+    assert wheel.advance(1) == 2
+    callback.assert_called_once_with()
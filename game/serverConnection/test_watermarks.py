@@ -0,0 +1,82 @@
+"""Test the structures used to keep track of the connections' watermarks"""
+
+import random
+
+from watermarks import IndexedMinHeap, WatermarkTracker
+
+
+def test_heap_min():
+    heap = IndexedMinHeap()
+    assert heap.peek() is None
+
+    heap.set('a', 5)
+    heap.set('b', 3)
+    heap.set('c', 4)
+    assert heap.peek() == ('b', 3)
+
+    heap.set('b', 6)
+    assert heap.peek() == ('c', 4)
+
+    heap.remove('c')
+    assert heap.peek() == ('a', 5)
+    assert 'c' not in heap
+    assert len(heap) == 2
+
+
+def test_heap_matches_sorting():
+    random.seed(1)
+    heap = IndexedMinHeap()
+    values = {}
+    for _ in range(2000):
+        key = random.randint(0, 50)
+        if random.random() < 0.2:
+            heap.remove(key)
+            values.pop(key, None)
+        else:
+            value = random.randint(0, 1000)
+            heap.set(key, value)
+            values[key] = value
+
+        if values:
+            assert heap.peek()[1] == min(values.values())
+            assert heap.get(heap.peek()[0]) == min(values.values())
+        else:
+            assert heap.peek() is None
+
+
+def test_low_watermark():
+    tracker = WatermarkTracker()
+    assert tracker.lowWatermark(100) is None
+
+    tracker.track('a', 10)
+    tracker.track('b', 20)
+    assert tracker.lowWatermark(100) == 10
+
+    tracker.update('a', 30)
+    assert tracker.lowWatermark(100) == 20
+
+    # Watermarks don't go backwards
+    tracker.update('b', 5)
+    assert tracker.lowWatermark(100) == 20
+
+    tracker.untrack('b')
+    assert tracker.lowWatermark(100) == 30
+
+
+def test_untracked_updates_are_ignored():
+    tracker = WatermarkTracker()
+
+    tracker.update('a', 30)
+
+    assert tracker.lowWatermark(100) is None
+    assert not tracker.isTracked('a')
+
+
+def test_max_lag():
+    tracker = WatermarkTracker(maxLag=50)
+    tracker.track('a', 10)
+    tracker.track('b', 90)
+
+    # 'a' is lagging too far behind so is ignored.
+    assert tracker.lowWatermark(100) == 50
+    assert tracker.lowWatermark(55) == 10
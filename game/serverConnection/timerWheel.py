@@ -0,0 +1,82 @@
+from __future__ import print_function
+
+import math
+import time
+import traceback
+from threading import Lock
+
+
+class Timer(object):
+    """A callback scheduled on a TimerWheel. Pass it to TimerWheel.cancel to stop it being called."""
+    __slots__ = ('tick', 'callback', 'args', 'slot')
+
+    def __init__(self, tick, callback, args, slot):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.slot = slot
+
+
+class TimerWheel(object):
+    """A hashed timer wheel: the timers are kept in slotCount slots by the tick they are due in, modulo slotCount.
+
+    Scheduling and cancelling a timer is O(1) and each tick only looks at the timers in its slot. As long as timers
+    are scheduled less than a revolution (slotCount * tickInterval) ahead, that is just the ones which are due,
+    so the cost of advancing is proportional to the number of expired timers, not the number scheduled.
+    """
+    def __init__(self, tickInterval, slotCount=512, now=None):
+        self.tickInterval = tickInterval
+        self._slots = [set() for _ in range(slotCount)]
+        # The last tick we have called the timers of.
+        self._tick = int((time.time() if now is None else now) // tickInterval)
+        self._lock = Lock()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, deadline, callback, *args):
+        """Call callback(*args) once deadline has passed (within a tick), returning the Timer"""
+        with self._lock:
+            # Round up so that we are never early. If the deadline has passed, call it on the next tick.
+            tick = max(int(math.ceil(deadline / self.tickInterval)), self._tick + 1)
+            slot = self._slots[tick % len(self._slots)]
+            timer = Timer(tick, callback, args, slot)
+            slot.add(timer)
+            self._count += 1
+            return timer
+
+    def cancel(self, timer):
+        """Stop a timer being called. It is fine if it has already been called or cancelled (or is None)."""
+        if timer is None:
+            return
+        with self._lock:
+            if timer.slot is not None:
+                timer.slot.discard(timer)
+                timer.slot = None
+                self._count -= 1
+
+    def advance(self, now):
+        """Call the timers which are due by now, returning how many were called"""
+        expired = []
+        with self._lock:
+            target = int(now // self.tickInterval)
+            # If we have fallen more than a revolution behind, each slot only needs looking at once.
+            for tick in range(self._tick + 1, min(target, self._tick + len(self._slots)) + 1):
+                slot = self._slots[tick % len(self._slots)]
+                due = [timer for timer in slot if timer.tick <= target]
+                for timer in due:
+                    slot.discard(timer)
+                    timer.slot = None
+                expired.extend(due)
+            self._tick = max(self._tick, target)
+            self._count -= len(expired)
+
+        expired.sort(key=lambda timer: timer.tick)
+        for timer in expired:
+            try:
+                timer.callback(*timer.args)
+            except Exception:  # pylint:disable=broad-except
+                # One broken timer shouldn't stop the others.
+                traceback.print_exc()
+        return len(expired)
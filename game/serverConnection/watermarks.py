@@ -0,0 +1,132 @@
+from __future__ import print_function
+
+from threading import Lock
+
+
+class IndexedMinHeap(object):
+    """A min-heap of values which can each be looked up, changed or removed by their key in O(log n)."""
+
+    def __init__(self):
+        # entries are [value, key], positions maps key to the index of its entry in the heap.
+        self._heap = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def get(self, key, default=None):
+        if key in self._positions:
+            return self._heap[self._positions[key]][0]
+        return default
+
+    def peek(self):
+        """Return a (key, value) tuple for the smallest value, or None if the heap is empty"""
+        if not self._heap:
+            return None
+        (value, key) = self._heap[0]
+        return (key, value)
+
+    def set(self, key, value):
+        """Add key with value or change its value"""
+        if key in self._positions:
+            index = self._positions[key]
+            oldValue = self._heap[index][0]
+            self._heap[index][0] = value
+            if value < oldValue:
+                self._siftUp(index)
+            else:
+                self._siftDown(index)
+        else:
+            self._heap.append([value, key])
+            self._positions[key] = len(self._heap) - 1
+            self._siftUp(len(self._heap) - 1)
+
+    def remove(self, key):
+        """Remove key, it is fine if it isn't there"""
+        index = self._positions.pop(key, None)
+        if index is None:
+            return
+        last = self._heap.pop()
+        if index < len(self._heap):
+            # Put the last entry in the gap and move it to where it belongs.
+            self._heap[index] = last
+            self._positions[last[1]] = index
+            self._siftUp(index)
+            self._siftDown(self._positions[last[1]])
+
+    def _swap(self, i, j):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i][1]] = i
+        self._positions[heap[j][1]] = j
+
+    def _siftUp(self, index):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self._heap[index][0] < self._heap[parent][0]:
+                self._swap(index, parent)
+                index = parent
+            else:
+                return
+
+    def _siftDown(self, index):
+        size = len(self._heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
+
+
+class WatermarkTracker(object):
+    """Keeps the watermark of each connection: the time before which it won't send us any more events.
+    The lowest of these is the point we can be confident we have all events before.
+
+    maxLag is the grace policy: a connection which is more than maxLag seconds behind the current time
+    (e.g. a gun which is out of contact) stops holding the low watermark back. This bounds how many
+    uncertain events we keep and how far back we have to replay them. None means never give up on a connection.
+    """
+
+    def __init__(self, maxLag=None):
+        self.maxLag = maxLag
+        self._watermarks = IndexedMinHeap()
+        self._lock = Lock()
+
+    def track(self, connection, watermark):
+        """Start including a connection in the low watermark"""
+        with self._lock:
+            self._watermarks.set(connection, watermark)
+
+    def untrack(self, connection):
+        with self._lock:
+            self._watermarks.remove(connection)
+
+    def isTracked(self, connection):
+        return connection in self._watermarks
+
+    def update(self, connection, watermark):
+        """Move a connection's watermark on. Watermarks never go backwards and untracked connections are ignored."""
+        with self._lock:
+            current = self._watermarks.get(connection)
+            if current is not None and watermark > current:
+                self._watermarks.set(connection, watermark)
+
+    def lowWatermark(self, now):
+        """The time before which we don't expect any more events, or None if there are no connections"""
+        with self._lock:
+            lowest = self._watermarks.peek()
+        if lowest is None:
+            return None
+
+        low = lowest[1]
+        if self.maxLag is not None and low < now - self.maxLag:
+            # Don't wait any longer for the connections which are lagging too far behind.
+            low = now - self.maxLag
+        return low
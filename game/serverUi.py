@@ -59,7 +59,7 @@ class GameStateModel(QAbstractTableModel):
             indexTuple = (index.column() + 1, index.row() + 1)
             if indexTuple not in self.gameState.withCurrGameState(lambda s: s.players.keys()):
                 return None
-            return self.gameState.withCurrGameState(lambda s: s.players[indexTuple])
+            return self.gameState.getCurrentPlayer(*indexTuple)
 
         return None
 
@@ -358,17 +358,17 @@ class PlayerDetailsWidget(QWidget):
 
     def __updateFromPlayer(self):
         if (self.teamID, self.playerID) in self.gameState.withCurrGameState(lambda s: s.players.keys()):
-            player = self.gameState.getOrCreatePlayer(self.teamID, self.playerID)
+            player = self.gameState.getCurrentPlayer(self.teamID, self.playerID)
             self.idLabel.setText("Team: %d, Player: %d" % (player.team_id, player.player_id))
             self.ammoLabel.setText("Ammo: %d" % player.ammo)
             self.healthLabel.setText("%d / %d" % (player.health, self.gameState.getPlayerParameter(player, "maxHealth")))
-            try:
-                if self.listeningThread.connections[(player.teamID, player.playerID)].isOutOfContact():
-                    self.warningLabel.setText("WARNING: This player has been out\nof contact for at least %s" % self.listeningThread.connections[(player.teamID, player.playerID)].outOfContactTimeStr())
-                else:
-                    self.warningLabel.setText("")
-            except KeyError:
+            connection = self.listeningThread.registry.get((player.teamID, player.playerID))
+            if connection is None:
                 self.warningLabel.setText("WARNING: This player is disconnected")
+            elif connection.isOutOfContact():
+                self.warningLabel.setText("WARNING: This player has been out\nof contact for at least %s" % connection.outOfContactTimeStr())
+            else:
+                self.warningLabel.setText("")
         else:
             self.idLabel.setText("None")
             self.ammoLabel.setText("0")
@@ -407,11 +407,11 @@ class InitialisationButton(QPushButton):
         self.refresh()
 
     def initialise(self):
-        connection = self.listeningThread.uninitialisedConnections.pop()
-        self.listeningThread.startInitialising(connection)
+        self.listeningThread.startInitialising()
 
     def refresh(self):
-        self.setEnabled(bool(not self.listeningThread.initialisingConnection and self.listeningThread.uninitialisedConnections))
+        snapshot = self.listeningThread.registry.snapshot()
+        self.setEnabled(bool(not snapshot.initialising and snapshot.uninitialised))
 
 
 class PlayersView(QWidget):
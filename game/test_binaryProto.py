@@ -0,0 +1,96 @@
+# pylint:disable=redefined-outer-name,E1101
+import pytest
+
+import proto
+from binaryProto import encodeFrame, encodeEvent, decodeFrame, FRAME_HEADER
+from connection import LineBuffer
+
+
+@pytest.mark.parametrize("msg_str", [
+    "Ping()",
+    "Pong(1516565652.250000,1)",
+    "Recv(1,2,T)",
+    "Recv(255,0,t)",
+    "Recv(3,4,H1,2,3)",
+    "StartGame(300)",
+])
+def test_round_trip(msg_str):
+    event = proto.Event(msg_str, 0xfedcba9876543210, 1516565652.123456)
+
+    frame = encodeFrame(event)
+    decoded = decodeFrame(frame, FRAME_HEADER.size, len(frame))
+
+    assert decoded.msgStr == msg_str
+    assert decoded.id == event.id
+    assert decoded.time == event.time
+    assert decoded.seq is None
+    assert len(frame) < len(event.toStr()) + 1
+
+
+def test_sequenced_round_trip():
+    event = proto.Event("Recv(3,4,H1,2,3)", 0x123def, 1516565652.5, 0x1234)
+
+    frame = encodeFrame(event)
+    decoded = decodeFrame(frame, FRAME_HEADER.size, len(frame))
+
+    assert (decoded.msgStr, decoded.id, decoded.time, decoded.seq) == ("Recv(3,4,H1,2,3)", 0x123def, 1516565652.5, 0x1234)
+
+
+@pytest.mark.parametrize("msg_str", [
+    "Hello(2)",
+    "Watermark()",
+    "Recv(1,2,FA)",
+    "Recv(256,2,T)",
+    "Recv(,2,T)",
+    "Recv(1,2,Tx)",
+    "StartGame(99999999999)",
+    "Pong(1.2.3,1)",
+    "PlayerSnapshot({})",
+])
+def test_text_only(msg_str):
+    event = proto.Event(msg_str, 0x123def, 1516565652.0)
+
+    assert encodeFrame(event) is None
+    assert encodeEvent(event, True) == event.toStr() + "\n"
+
+
+def test_text_unless_binary():
+    event = proto.Event("Ping()", 0x123def, 1516565652.0)
+
+    assert encodeEvent(event, False) == event.toStr() + "\n"
+    assert encodeEvent(event, True) == encodeFrame(event)
+
+
+@pytest.mark.parametrize("frame", [
+    "\x00\x00\x03abc",
+    "\x00\x00\x11\x63" + "\x00" * 16,
+    # A ping with extra bytes
+    "\x00\x00\x12\x01" + "\x00" * 17,
+])
+def test_decode_invalid(frame):
+    with pytest.raises(proto.MessageParseException):
+        decodeFrame(frame, FRAME_HEADER.size, len(frame))
+
+
+def test_mixed_stream():
+    events = [
+        proto.Event("Hello(2)", 0x123def, 1.0),
+        proto.Event("Recv(1,2,H1,2,3)", 0x123def, 2.0),
+        proto.Event("Watermark()", 0x123def, 3.0),
+        proto.Event("Recv(1,2,T)", 0x123def, 4.0),
+        proto.Event("Pong(10.000000,0)", 0x123def, 5.0),
+    ]
+    stream = "".join(encodeEvent(event, True) for event in events)
+
+    # However the stream is split up, we get the same messages out.
+    for chunkSize in [1, 2, 3, 7, len(stream)]:
+        line_buffer = LineBuffer(size=8)
+        messages = []
+        for i in range(0, len(stream), chunkSize):
+            line_buffer.feed(stream[i:i + chunkSize])
+            messages.extend(line_buffer.takeMessages())
+
+        assert [proto.toEvent(message).msgStr for message in messages] == [event.msgStr for event in events]
+        assert [proto.toEvent(message).time for message in messages] == [event.time for event in events]
+        assert isinstance(messages[0], str)
+        assert isinstance(messages[1], proto.Event)
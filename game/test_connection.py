@@ -0,0 +1,198 @@
+# pylint:disable=redefined-outer-name,E1101
+import Queue
+import socket
+import time
+
+import pytest
+
+from connection import WriteThread, PreparedEvent, OutboundQueue
+from proto import Event
+
+
+def test_heartbeat_watermark(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = len
+    write_thread = WriteThread(lambda: 0x123def, heartbeatInterval=0.01)
+    write_thread.setSocket(sock)
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.stop()
+
+    assert sock.send.call_count > 0
+    assert sock.send.call_args[0][0].startswith("E(123def,")
+    assert sock.send.call_args[0][0].endswith(",Watermark())\n")
+
+
+def test_no_heartbeat_by_default(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = len
+    write_thread = WriteThread(lambda: 0x123def)
+    write_thread.setSocket(sock)
+    write_thread.queueMessage("Ping()")
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.shouldStop = True
+
+    sock.send.assert_called_once()
+    assert sock.send.call_args[0][0].endswith(",Ping())\n")
+
+
+def test_queued_messages_sent_together(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = len
+    write_thread = WriteThread(lambda: 0x123def)
+    write_thread.setSocket(sock)
+    write_thread.queueMessage("Ping()")
+    write_thread.queueMessage("Pong(1.000000,0)")
+    write_thread.queueMessage("StartGame(10)")
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.shouldStop = True
+
+    sock.send.assert_called_once()
+    lines = sock.send.call_args[0][0].split("\n")
+    assert len(lines) == 4
+    assert lines[0].endswith(",Ping())")
+    assert lines[1].endswith(",Pong(1.000000,0))")
+    assert lines[2].endswith(",StartGame(10))")
+    assert lines[3] == ""
+    assert write_thread.messagesSent == 3
+    assert write_thread.batchesSent == 1
+    assert write_thread.sendCalls == 1
+    assert write_thread.bytesSent == len(sock.send.call_args[0][0])
+
+
+def test_partial_sends_counted(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = lambda msg: min(len(msg), 10)
+    write_thread = WriteThread(lambda: 0x123def)
+    write_thread.setSocket(sock)
+    write_thread.queueMessage("Ping()")
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.shouldStop = True
+
+    sent = "".join(call[0][0][:10] for call in sock.send.call_args_list)
+    assert sent.endswith(",Ping())\n")
+    assert write_thread.sendCalls == sock.send.call_count
+    assert write_thread.sendCalls > 1
+    assert write_thread.batchesSent == 1
+
+
+def test_binary_frames(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = len
+    write_thread = WriteThread(lambda: 0x123def)
+    write_thread.binary = True
+    write_thread.setSocket(sock)
+    write_thread.queueMessage("Ping()")
+    write_thread.queueMessage("Watermark()")
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.shouldStop = True
+
+    sent = sock.send.call_args[0][0]
+    assert sent.startswith("\x00")
+    assert sent.endswith(",Watermark())\n")
+
+
+def test_prepared_event_shared(mocker):
+    prepared = PreparedEvent("StartGame(300)", lambda: 0x123def)
+    socks = [mocker.MagicMock(), mocker.MagicMock()]
+    write_threads = []
+    for (sock, binary) in zip(socks, [False, True]):
+        sock.send.side_effect = len
+        write_thread = WriteThread(lambda: 0x123def)
+        write_thread.binary = binary
+        write_thread.setSocket(sock)
+        write_thread.queuePrepared(prepared)
+        write_thread.start()
+        write_threads.append(write_thread)
+
+    time.sleep(0.1)
+    for write_thread in write_threads:
+        write_thread.shouldStop = True
+
+    assert socks[0].send.call_args[0][0] == prepared.encode(False)
+    assert socks[0].send.call_args[0][0].endswith(",StartGame(300))\n")
+    assert socks[1].send.call_args[0][0] == prepared.encode(True)
+    assert socks[1].send.call_args[0][0].startswith("\x00")
+    assert prepared.encode(False) is prepared.encode(False)
+
+
+def test_outbound_queue_collapses_snapshots():
+    queue = OutboundQueue()
+    queue.put(Event('PlayerSnapshot({"health": 5})', 1, 100))
+    queue.put(Event("Deleted()", 1, 101))
+    queue.put(PreparedEvent('PlayerSnapshot({"health": 4})', lambda: 1))
+    queue.put(Event('ParametersSnapshot({})', 1, 102))
+
+    assert len(queue) == 3
+    assert queue.collapsed == 1
+    assert queue.get_nowait().msgStr == "Deleted()"
+    assert queue.get_nowait().event.msgStr == 'PlayerSnapshot({"health": 4})'
+    assert queue.get_nowait().msgStr == 'ParametersSnapshot({})'
+    with pytest.raises(Queue.Empty):
+        queue.get_nowait()
+
+    # Once sent, the next snapshot doesn't replace anything
+    queue.put(Event('PlayerSnapshot({"health": 3})', 1, 103))
+    assert queue.get_nowait().msgStr == 'PlayerSnapshot({"health": 3})'
+    assert queue.collapsed == 1
+
+
+def test_outbound_queue_drops_stale_pings(monkeypatch):
+    monkeypatch.setattr('time.time', lambda: 1000)
+    queue = OutboundQueue()
+    queue.put(Event("Ping()", 1, 1000 - OutboundQueue.maxPingAge - 1))
+    queue.put(Event("Deleted()", 1, 900))
+
+    assert queue.get_nowait().msgStr == "Deleted()"
+    assert queue.droppedPings == 1
+
+    queue.put(Event("Ping()", 1, 999))
+    assert queue.get_nowait().msgStr == "Ping()"
+
+
+def test_outbound_queue_full():
+    queue = OutboundQueue(maxSize=2)
+    assert queue.put(Event("Deleted()", 1, 100))
+    assert queue.put(Event("Deleted()", 1, 101))
+    assert not queue.put(Event("Deleted()", 1, 102))
+    # These replace an earlier one, so they are still accepted
+    assert queue.put(Event("Ping()", 1, 103))
+    assert queue.put(Event("Ping()", 1, 104))
+
+    assert queue.stats() == {'depth': 3, 'highWater': 3, 'collapsed': 1, 'droppedPings': 0, 'refused': 1}
+
+
+def test_overflow_calls_slow_consumer(mocker):
+    on_slow_consumer = mocker.MagicMock()
+    write_thread = WriteThread(lambda: 0x123def, onSlowConsumer=on_slow_consumer)
+    write_thread.queue = OutboundQueue(maxSize=1)
+
+    write_thread.queueMessage("Deleted()")
+    on_slow_consumer.assert_not_called()
+    write_thread.queueMessage("Deleted()")
+    on_slow_consumer.assert_called_once()
+
+
+def test_send_timeout_calls_slow_consumer(mocker):
+    sock = mocker.MagicMock()
+    sock.send.side_effect = socket.timeout
+    on_slow_consumer = mocker.MagicMock()
+    write_thread = WriteThread(lambda: 0x123def, onSlowConsumer=on_slow_consumer)
+    write_thread.setSocket(sock)
+    write_thread.queueMessage("Deleted()")
+    write_thread.start()
+
+    time.sleep(0.1)
+    write_thread.shouldStop = True
+
+    on_slow_consumer.assert_called_once()
+    assert write_thread.stats()['messagesSent'] == 0
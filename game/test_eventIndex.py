@@ -0,0 +1,42 @@
+# pylint:disable=redefined-outer-name
+from eventIndex import EventIndex
+from gameEvents import GameEvent, FireEvent, HitEvent, GameEndedEvent
+
+
+def test_find_by_type():
+    index = EventIndex()
+    fire = FireEvent(50, 1, 1)
+    hit = HitEvent(50, 1, 1, 2, 1, 1)
+    end = GameEndedEvent(60)
+    for e in [fire, hit, end]:
+        index.add(e)
+
+    assert index.find(FireEvent) == [fire]
+    assert index.find(GameEndedEvent) == [end]
+    assert sorted(index.find(GameEvent), key=id) == sorted([fire, hit, end], key=id)
+
+
+def test_find_by_player():
+    index = EventIndex()
+    fire = FireEvent(50, 1, 1)
+    fire2 = FireEvent(50, 1, 2)
+    hit = HitEvent(50, 1, 1, 2, 1, 1)
+    for e in [fire, fire2, hit]:
+        index.add(e)
+
+    assert index.find(FireEvent, (1, 1)) == [fire]
+    assert sorted(index.find(None, (1, 1)), key=id) == sorted([fire, hit], key=id)
+    assert index.find(FireEvent, (3, 3)) == []
+
+
+def test_remove():
+    index = EventIndex()
+    fire = FireEvent(50, 1, 1)
+    index.add(fire)
+    index.remove(fire)
+
+    assert index.find(FireEvent) == []
+    assert index.find(FireEvent, (1, 1)) == []
+    # Empty buckets aren't kept around
+    assert index._byType == {}
+    assert index._byPlayer == {}
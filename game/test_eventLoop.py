@@ -0,0 +1,113 @@
+# pylint:disable=redefined-outer-name,E1101
+import socket
+import time
+from threading import Thread
+
+import pytest
+
+from connection import ClientServerConnection
+from eventLoop import EventLoop
+
+
+class LoopConnection(ClientServerConnection):
+    def __init__(self, eventLoop):
+        ClientServerConnection.__init__(self, lambda: 0x123def, eventLoop)
+        self.received = []
+        self.disconnected = False
+
+    def handleMsg(self, fullLine):
+        self.received.append(fullLine)
+        return True
+
+    def onDisconnect(self):
+        self.disconnected = True
+
+
+def waitFor(condition):
+    for dummy in range(100):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def event_loop():
+    event_loop = EventLoop()
+    thread = Thread(target=event_loop.run)
+    thread.setDaemon(True)
+    thread.start()
+    yield event_loop
+    event_loop.stop()
+    thread.join()
+
+
+def test_read(event_loop):
+    (ours, theirs) = socket.socketpair()
+    connection = LoopConnection(event_loop)
+    connection.setSocket(ours)
+
+    theirs.sendall("Hello()\nE(1,2,")
+    theirs.sendall("Ping())\n")
+
+    assert waitFor(lambda: len(connection.received) == 2)
+    assert connection.received == ["Hello()", "E(1,2,Ping())"]
+
+
+def test_write(event_loop):
+    (ours, theirs) = socket.socketpair()
+    connection = LoopConnection(event_loop)
+    connection.setSocket(ours)
+
+    connection.queueMessage("Ping()")
+    connection.queueMessage("Pong(1.000000,0)")
+
+    theirs.settimeout(1)
+    received = ''
+    while received.count("\n") < 2:
+        received += theirs.recv(1024)
+    lines = received.split("\n")
+    assert lines[0].startswith("E(123def,")
+    assert lines[0].endswith(",Ping())")
+    assert lines[1].endswith(",Pong(1.000000,0))")
+
+
+def test_many_connections(event_loop):
+    pairs = [socket.socketpair() for dummy in range(50)]
+    connections = []
+    for (ours, dummy_theirs) in pairs:
+        connection = LoopConnection(event_loop)
+        connection.setSocket(ours)
+        connections.append(connection)
+
+    for (i, (dummy_ours, theirs)) in enumerate(pairs):
+        theirs.sendall("Msg(%d)\n" % i)
+
+    assert waitFor(lambda: all(connection.received for connection in connections))
+    for (i, connection) in enumerate(connections):
+        assert connection.received == ["Msg(%d)" % i]
+
+
+def test_disconnect(event_loop):
+    (ours, theirs) = socket.socketpair()
+    connection = LoopConnection(event_loop)
+    connection.setSocket(ours)
+
+    theirs.close()
+
+    assert waitFor(lambda: connection.disconnected)
+
+
+def test_unknown_message_doesnt_stop_loop(event_loop):
+    (ours, theirs) = socket.socketpair()
+    connection = LoopConnection(event_loop)
+    connection.handleMsg = lambda fullLine: False
+    connection.setSocket(ours)
+    (ours2, theirs2) = socket.socketpair()
+    connection2 = LoopConnection(event_loop)
+    connection2.setSocket(ours2)
+
+    theirs.sendall("Rubbish()\n")
+    theirs2.sendall("Hello()\n")
+
+    assert waitFor(lambda: connection2.received == ["Hello()"])
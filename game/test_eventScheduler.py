@@ -0,0 +1,52 @@
+# pylint:disable=redefined-outer-name
+import threading
+
+from eventScheduler import FutureEventQueue, EventScheduler
+from gameEvents import GameEvent
+
+
+def test_pop_due_in_order():
+    queue = FutureEventQueue()
+    event = GameEvent(150)
+    event2 = GameEvent(120)
+    event3 = GameEvent(200)
+    event4 = GameEvent(120)
+    for e in [event, event2, event3, event4]:
+        queue.push(e)
+
+    assert queue.nextTime() == 120
+    # events at the same time come out in the order they were added
+    assert queue.popDue(150) == [event2, event4, event]
+    assert list(queue) == [event3]
+    assert queue.nextTime() == 200
+
+
+def test_cancel():
+    queue = FutureEventQueue()
+    event = GameEvent(150)
+    event2 = GameEvent(160)
+    queue.push(event)
+    queue.push(event2)
+
+    assert queue.cancel(event)
+    assert not queue.cancel(event)
+
+    assert len(queue) == 1
+    assert event not in queue
+    assert queue.nextTime() == 160
+    assert queue.popDue(200) == [event2]
+    assert queue.nextTime() is None
+
+
+def test_scheduler_calls_back():
+    called = threading.Event()
+    scheduler = EventScheduler(called.set)
+    scheduler.start()
+    try:
+        scheduler.wakeAt(0)
+        assert called.wait(5)
+        assert scheduler.wakeTime is None
+    finally:
+        scheduler.stop()
+        scheduler.join(5)
+    assert not scheduler.isAlive()
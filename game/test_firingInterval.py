@@ -0,0 +1,62 @@
+from firingInterval import FiringInterval
+from player import Player
+
+
+def test_shots_due_by():
+    interval = FiringInterval(50, 20)
+
+    assert interval.shotsDueBy(40) == 0
+    assert interval.shotsDueBy(50) == 1
+    assert interval.shotsDueBy(69) == 1
+    assert interval.shotsDueBy(70) == 2
+    assert interval.shotsDueBy(1250) == 61
+
+
+def test_shot_times_are_due_despite_rounding():
+    interval = FiringInterval(0.1, 0.1)
+
+    for shot in range(1000):
+        assert interval.shotsDueBy(interval.shotTime(shot)) == shot + 1
+
+
+def test_settle():
+    interval = FiringInterval(50, 20)
+    player = Player(1, 1, ammo=10)
+
+    (player, interval) = interval.settle(player, 95)
+
+    assert player.ammo == 8
+    assert player.stats.shots_fired == 2
+    assert interval.shotsSettled == 3
+
+    # Settling again for the same time doesn't take any more shots.
+    (player, interval) = interval.settle(player, 95)
+    assert player.ammo == 8
+
+
+def test_settle_without_stats():
+    interval = FiringInterval(50, 20, countStats=False)
+
+    (player, _) = interval.settle(Player(1, 1, ammo=10), 95)
+
+    assert player.ammo == 8
+    assert player.stats.shots_fired == 0
+
+
+def test_settle_runs_out_of_ammo():
+    interval = FiringInterval(50, 1)
+
+    (player, interval) = interval.settle(Player(1, 1, ammo=10), 500)
+
+    assert player.ammo == 0
+    assert player.stats.shots_fired == 10
+    assert interval is None
+
+
+def test_settle_dead_player():
+    interval = FiringInterval(50, 20)
+
+    (player, interval) = interval.settle(Player(1, 1, ammo=10, health=0), 95)
+
+    assert player.ammo == 10
+    assert interval is None
@@ -35,7 +35,7 @@ def client_game_logic(client_game_state):
 
 def test_simple_hit_from_live_player(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(50)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -53,7 +53,7 @@ def test_simple_hit_from_live_player(game_state, game_logic, monkeypatch, mocker
 
 def test_fatal_hit_from_live_player(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(50)
 
@@ -70,7 +70,7 @@ def test_fatal_hit_from_live_player(game_state, game_logic, monkeypatch, mocker)
 
 def test_simple_hit_from_live_player_client(client_game_state, client_game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     player = client_game_state.getMainPlayer()
     client_game_logic.startGame(50)
@@ -86,7 +86,7 @@ def test_simple_hit_from_live_player_client(client_game_state, client_game_logic
 
 def test_simple_hit_from_live_player_before_game_starts(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     player = game_state.getOrCreatePlayer(1, 1)
     initialHealth = player.health
@@ -102,7 +102,7 @@ def test_simple_hit_from_live_player_before_game_starts(game_state, game_logic,
 
 def test_simple_hit_from_dead_player(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(50)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -123,7 +123,7 @@ def test_simple_hit_from_dead_player(game_state, game_logic, monkeypatch, mocker
 
 def test_historic_hit_from_live_player(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(100)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -140,7 +140,7 @@ def test_historic_hit_from_live_player(game_state, game_logic, monkeypatch, mock
 
 def test_hit_from_live_player_after_game_stops(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(100)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -150,7 +150,7 @@ def test_hit_from_live_player_after_game_stops(game_state, game_logic, monkeypat
 
     # fast-forward to after the game ends
     monkeypatch.setattr('time.time', lambda: 200 + game_state.currGameState.gameTime)
-    game_state._recheckTimer()
+    game_state._handleFutureEvents()
 
     game_logic.hit(150 + game_state.currGameState.gameTime, 1, 1, 1, 2, damage)
 
@@ -161,7 +161,7 @@ def test_hit_from_live_player_after_game_stops(game_state, game_logic, monkeypat
 
 def test_simple_hit_from_self(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(50)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -180,7 +180,7 @@ def test_add_hit_event_out_of_order(game_state, game_logic, monkeypatch, mocker)
     """Test handling of a subsequent, earlier event"""
 
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     playerAdjustedListener = mocker.MagicMock()
     game_state.addListener(playerAdjusted=playerAdjustedListener)
@@ -227,7 +227,7 @@ def test_add_hit_event_out_of_order(game_state, game_logic, monkeypatch, mocker)
 
 def test_simple_fire(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     FireEvent.repeatRate = 0
 
     game_logic.startGame(50)
@@ -243,7 +243,7 @@ def test_simple_fire(game_state, game_logic, monkeypatch, mocker):
 
 def test_simple_fire_client(client_game_state, client_game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     FireEvent.repeatRate = 0
 
     player = client_game_state.getMainPlayer()
@@ -258,7 +258,7 @@ def test_simple_fire_client(client_game_state, client_game_logic, monkeypatch, m
 
 def test_repeat_fire(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     FireEvent.repeatRate = 20
 
     game_logic.startGame(30)
@@ -267,15 +267,17 @@ def test_repeat_fire(game_state, game_logic, monkeypatch, mocker):
 
     game_logic.trigger(50, 1, 1)
 
-    player = game_state.getOrCreatePlayer(1, 1)
+    player = game_state.getCurrentPlayer(1, 1)
     assert initialAmmo - 3 == player.ammo
-    assert isinstance(game_state.futureEvents[1], FireEvent)
     assert player.stats.shots_fired == 3
+    # The repeated shots don't need any more events.
+    assert len(game_state.uncertainEvents) == 2
+    assert len(game_state.futureEvents) == 1
 
 
 def test_repeat_fire_stop(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     FireEvent.repeatRate = 20
 
     game_logic.startGame(30)
@@ -285,11 +287,93 @@ def test_repeat_fire_stop(game_state, game_logic, monkeypatch, mocker):
     game_logic.trigger(50, 1, 1)
     game_logic.triggerRelease(80, 1, 1)
 
-    player = game_state.getOrCreatePlayer(1, 1)
+    player = game_state.getCurrentPlayer(1, 1)
     assert initialAmmo - 2 == player.ammo
     assert len(game_state.futureEvents) == 1
     assert player.stats.shots_fired == 2
 
+
+def test_repeat_fire_stops_when_killed(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    FireEvent.repeatRate = 20
+
+    game_logic.startGame(30)
+    initialAmmo = game_state.getOrCreatePlayer(1, 1).ammo
+
+    game_logic.trigger(50, 1, 1)
+    game_logic.hit(75, 1, 1, 2, 1, 2000)
+
+    player = game_state.getCurrentPlayer(1, 1)
+    assert initialAmmo - 2 == player.ammo
+    assert player.stats.shots_fired == 2
+    assert (1, 1) not in game_state.currGameState.firing
+
+
+def test_repeat_fire_runs_out_of_ammo(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 1000)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    FireEvent.repeatRate = 1
+
+    game_logic.startGame(30)
+    initialAmmo = game_state.getOrCreatePlayer(1, 1).ammo
+
+    game_logic.trigger(50, 1, 1)
+
+    player = game_state.getCurrentPlayer(1, 1)
+    assert player.ammo == 0
+    assert player.stats.shots_fired == initialAmmo
+
+
+def test_repeat_fire_late_trigger_release(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    FireEvent.repeatRate = 20
+
+    game_logic.startGame(30)
+    initialAmmo = game_state.getOrCreatePlayer(1, 1).ammo
+
+    game_logic.trigger(50, 1, 1)
+    game_logic.hit(95, 2, 1, 1, 2, 1)
+    # This arrives after the hit, which is after it in time.
+    game_logic.triggerRelease(60, 1, 1)
+
+    assert initialAmmo - 1 == game_state.getCurrentPlayer(1, 1).ammo
+
+
+def test_repeat_fire_client(client_game_state, client_game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    FireEvent.repeatRate = 20
+
+    firedListener = mocker.MagicMock()
+    client_game_state.addListener(fired=firedListener)
+
+    client_game_logic.startGame(50)
+    initialAmmo = client_game_state.getMainPlayer().ammo
+
+    client_game_logic.trigger(100, None, None)
+    assert firedListener.call_count == 1
+    assert list(client_game_state.futureEvents)[0].serverTime == 120
+
+    # The gun is told about each shot when it is due
+    monkeypatch.setattr('time.time', lambda: 120)
+    client_game_state._handleFutureEvents()
+    assert firedListener.call_count == 2
+    assert list(client_game_state.futureEvents)[0].serverTime == 140
+
+    # but not after the trigger has been released
+    client_game_logic.triggerRelease(130, None, None)
+    monkeypatch.setattr('time.time', lambda: 140)
+    client_game_state._handleFutureEvents()
+    assert firedListener.call_count == 2
+    assert len(client_game_state.futureEvents) == 1
+
+    assert initialAmmo - 2 == client_game_state.getMainPlayer().ammo
+    # Only the trigger events need to be replayed.
+    assert len(client_game_state.uncertainEvents) == 3
+
+
 # TODO: Should this be a unit test?
 
 # def test_detectAndHandleClockDrift(msg_handler, server, game_state, mocker):
@@ -305,7 +389,7 @@ def test_repeat_fire_stop(game_state, game_logic, monkeypatch, mocker):
 
 def test_set_main_player_after_hit(client_game_state, client_game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     client_game_logic.startGame(50)
 
     player1 = client_game_state.getMainPlayer()
@@ -330,7 +414,7 @@ def test_set_main_player_after_hit(client_game_state, client_game_logic, monkeyp
 
 def test_set_main_player_before_hit(client_game_state, client_game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     client_game_logic.startGame(50)
 
     player1 = client_game_state.getMainPlayer()
@@ -356,7 +440,7 @@ def test_dont_detect_unrelated_changes(game_state, game_logic, monkeypatch, mock
     """Test that adding out of order events which doesn't adjust a player doesn't call playerAdjustedListener"""
 
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     playerAdjustedListener = mocker.MagicMock()
     game_state.addListener(playerAdjusted=playerAdjustedListener)
@@ -380,7 +464,7 @@ def test_detect_unrelated_changes(game_state, game_logic, monkeypatch, mocker):
     """Test that adding an out of order event which does adjust a player calls playerAdjustedListener"""
 
     monkeypatch.setattr('time.time', lambda: 300)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     playerAdjustedListener = mocker.MagicMock()
     game_state.addListener(playerAdjusted=playerAdjustedListener)
@@ -408,7 +492,7 @@ def test_detect_unrelated_changes(game_state, game_logic, monkeypatch, mocker):
 def test_detect_player_adjustment_with_stop_game(game_state, game_logic, monkeypatch, mocker):
     """Test that an out-of-order stopGame event which changes a player calls playerAdjustedListener"""
     monkeypatch.setattr('time.time', lambda: 50)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     playerAdjustedListener = mocker.MagicMock()
     game_state.addListener(playerAdjusted=playerAdjustedListener)
@@ -434,7 +518,7 @@ def test_detect_player_adjustment_with_stop_game(game_state, game_logic, monkeyp
 
 def test_parameters_snapshot(game_state, game_logic, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     game_logic.startGame(50)
     player = game_state.getOrCreatePlayer(1, 1)
@@ -450,3 +534,65 @@ def test_parameters_snapshot(game_state, game_logic, monkeypatch, mocker):
 
     # assert this has applied now.
     assert game_state.getPlayerParameter(player, "maxHealth") == initialMaxHealth * 2
+
+
+def test_trigger_release_only_stops_that_player(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    FireEvent.repeatRate = 20
+
+    game_logic.startGame(30)
+    initialAmmo = game_state.getOrCreatePlayer(1, 1).ammo
+
+    game_logic.trigger(50, 1, 1)
+    game_logic.trigger(50, 2, 1)
+    game_logic.triggerRelease(80, 1, 1)
+
+    assert initialAmmo - 2 == game_state.getCurrentPlayer(1, 1).ammo
+    assert initialAmmo - 3 == game_state.getCurrentPlayer(2, 1).ammo
+
+
+def test_batch(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+    mocker.spy(game_state, "_reapplyEvents")
+
+    game_logic.startGame(50)
+    game_logic.hit(90, 1, 1, 2, 1, 1)
+
+    with game_logic.batch():
+        game_logic.hit(70, 1, 1, 2, 1, 1)
+        game_logic.hit(60, 1, 1, 2, 1, 1)
+        game_logic.hit(80, 1, 1, 2, 1, 1)
+        # Nothing is added until the batch finishes
+        assert len(game_state.uncertainEvents) == 2
+
+    assert game_state._reapplyEvents.call_count == 1
+    assert len(game_state.uncertainEvents) == 5
+    assert game_state.getOrCreatePlayer(1, 1).stats.hits_received == 4
+
+
+def test_batch_stop_game(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    with game_logic.batch():
+        game_logic.startGame(50)
+        game_logic.stopGame(60)
+
+    # The game ended event from starting the game was added and then cancelled by stopping it.
+    assert len(game_state.futureEvents) == 0
+    assert not game_state.isGameStarted()
+
+
+def test_event_before_confidence_point_is_clamped(game_state, game_logic, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    game_logic.startGame(50)
+    game_state.adjustConfidencePoint(80)
+
+    game_logic.hit(70, 1, 1, 2, 1, 1)
+
+    assert game_state.getOrCreatePlayer(1, 1).stats.hits_received == 1
+    assert game_state.uncertainEvents[0].serverTime == 80
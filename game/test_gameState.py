@@ -20,3 +20,25 @@ def test_get_player_parameter(game_state, mocker):
     assert game_state.getPlayerParameter(player, "maxLength") == 42
 
     game_state.currGameState.parameters.getPlayerValue.assert_called_once_with("maxLength", 1, 1)
+
+
+def test_clone_is_independent(game_state):
+    game_state.getOrCreatePlayer(1, 1)
+    game_state.currGameState.stats.teamPoints[1] = 3
+    original = game_state.currGameState
+
+    clone = original.clone()
+    assert clone == original
+
+    clone.players[(1, 1)] = clone.players[(1, 1)].reduceHealth(1)
+    clone.stats.teamPoints[1] = 4
+    clone.parameters.addPlayerEffect("maxHealth", 1, 1, "id", "*2")
+    clone.gameStarted = True
+
+    assert original.players[(1, 1)].health == 5
+    assert original.stats.teamPoints == {1: 3}
+    assert original.parameters.getPlayerValue("maxHealth", 1, 1) == 100
+    assert not original.gameStarted
+    assert clone.players[(1, 1)].health == 4
+    assert clone.stats.teamPoints == {1: 4}
+    assert clone.parameters.getPlayerValue("maxHealth", 1, 1) == 200
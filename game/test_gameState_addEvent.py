@@ -1,6 +1,6 @@
 # pylint:disable=redefined-outer-name,E1101
 import pytest
-from mock import call, ANY
+from mock import call
 
 from gameState import GameState
 from gameEvents import GameEvent
@@ -16,7 +16,7 @@ def game_state():
 
 def test_add_event_before_confidence_point(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -31,7 +31,7 @@ def test_add_event_before_confidence_point(game_state, monkeypatch, mocker):
 
 def test_add_past_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -44,7 +44,7 @@ def test_add_past_event(game_state, monkeypatch, mocker):
 
 def test_add_2_past_events_in_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -61,7 +61,7 @@ def test_add_2_past_events_in_order(game_state, monkeypatch, mocker):
 
 def test_add_3_past_events_out_of_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -83,9 +83,64 @@ def test_add_3_past_events_out_of_order(game_state, monkeypatch, mocker):
     assert game_state.uncertainEvents == [event, event2, event3]
 
 
+def test_add_batch_of_past_events_out_of_order(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    event = GameEvent(50)
+    mocker.spy(event, "apply")
+    event2 = GameEvent(60)
+    mocker.spy(event2, "apply")
+    event3 = GameEvent(70)
+    mocker.spy(event3, "apply")
+
+    game_state.addEvent(event3)
+    game_state.addEvents([event2, event])
+
+    # Once when added, once when re-playing after the batch is added.
+    assert event3.apply.call_count == 2
+    assert event.apply.call_count == 2
+    assert event2.apply.call_count == 2
+    assert game_state.uncertainEvents == [event, event2, event3]
+
+
+def test_add_batch_of_past_events_in_order(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    event = GameEvent(50)
+    mocker.spy(event, "apply")
+    event2 = GameEvent(60)
+    mocker.spy(event2, "apply")
+    event3 = GameEvent(70)
+    mocker.spy(event3, "apply")
+
+    game_state.addEvent(event)
+    game_state.addEvents([event3, event2])
+
+    # Nothing needs re-applying
+    assert event.apply.call_count == 1
+    assert event2.apply.call_count == 1
+    assert event3.apply.call_count == 1
+    assert game_state.uncertainEvents == [event, event2, event3]
+
+
+def test_add_batch_with_future_event(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    event = GameEvent(50)
+    futureEvent = GameEvent(150)
+
+    game_state.addEvents([futureEvent, event])
+
+    assert game_state.uncertainEvents == [event]
+    assert list(game_state.futureEvents) == [futureEvent]
+
+
 def test_add_events_reentrant_past_in_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     event2 = GameEvent(60)
@@ -101,12 +156,12 @@ def test_add_events_reentrant_past_in_order(game_state, monkeypatch, mocker):
     assert event2.apply.call_count == 1
     assert event3.apply.call_count == 1
     assert game_state.uncertainEvents == [event, event2, event3]
-    assert game_state.futureEvents == []
+    assert list(game_state.futureEvents) == []
 
 
 def test_add_past_events_reentrant_past_out_of_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     event2 = GameEvent(60)
@@ -126,12 +181,12 @@ def test_add_past_events_reentrant_past_out_of_order(game_state, monkeypatch, mo
     assert event2.apply.call_count == 2
 
     assert game_state.uncertainEvents == [event, event2, event3]
-    assert game_state.futureEvents == []
+    assert list(game_state.futureEvents) == []
 
 
 def test_add_events_reentrant_future(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     event2 = GameEvent(60)
@@ -149,27 +204,29 @@ def test_add_events_reentrant_future(game_state, monkeypatch, mocker):
     assert event.apply.call_count == 2
     assert event3.apply.call_count == 0
     assert game_state.uncertainEvents == [event, event2]
-    assert game_state.futureEvents == [event3]
+    assert list(game_state.futureEvents) == [event3]
 
 
 def test_add_future_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
 
     game_state.addEvent(event)
 
-    gameState.Timer.assert_called_once_with(50, ANY)
+    gameState.EventScheduler.assert_called_once_with(game_state._handleFutureEvents)
+    gameState.EventScheduler.return_value.start.assert_called_once_with()
+    gameState.EventScheduler.return_value.wakeAt.assert_called_once_with(150)
 
     assert event.apply.call_count == 0
-    assert game_state.futureEvents == [event]
+    assert list(game_state.futureEvents) == [event]
 
 
 def test_add_2_future_events_in_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
@@ -179,16 +236,17 @@ def test_add_2_future_events_in_order(game_state, monkeypatch, mocker):
     game_state.addEvent(event)
     game_state.addEvent(event2)
 
-    assert gameState.Timer.call_args_list == [call(50, ANY), call(50, ANY)]
-    assert gameState.Timer.return_value.cancel.call_count == 1
+    # Only one scheduler thread is used for all future events
+    assert gameState.EventScheduler.call_count == 1
+    assert gameState.EventScheduler.return_value.wakeAt.call_args_list == [call(150), call(150)]
     assert event.apply.call_count == 0
     assert event2.apply.call_count == 0
-    assert game_state.futureEvents == [event, event2]
+    assert list(game_state.futureEvents) == [event, event2]
 
 
 def test_add_2_future_events_out_of_order(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
@@ -198,16 +256,16 @@ def test_add_2_future_events_out_of_order(game_state, monkeypatch, mocker):
     game_state.addEvent(event2)
     game_state.addEvent(event)
 
-    assert gameState.Timer.call_args_list == [call(60, ANY), call(50, ANY)]
-    assert gameState.Timer.return_value.cancel.call_count == 1
+    assert gameState.EventScheduler.call_count == 1
+    assert gameState.EventScheduler.return_value.wakeAt.call_args_list == [call(160), call(150)]
     assert event.apply.call_count == 0
     assert event2.apply.call_count == 0
-    assert game_state.futureEvents == [event2, event]
+    assert list(game_state.futureEvents) == [event, event2]
 
 
-def test_add_future_event_recheck_after_due(game_state, monkeypatch, mocker):
+def test_handle_future_events_after_due(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
@@ -215,58 +273,46 @@ def test_add_future_event_recheck_after_due(game_state, monkeypatch, mocker):
     # Add the future event
     game_state.addEvent(event)
 
-    gameState.Timer.assert_called_once_with(50, ANY)
+    gameState.EventScheduler.return_value.wakeAt.assert_called_once_with(150)
     assert event.apply.call_count == 0
     assert game_state.uncertainEvents == []
-    assert game_state.futureEvents == [event]
+    assert list(game_state.futureEvents) == [event]
 
-    # Jump forward in time (and reset timer mock)
-    gameState.Timer.reset_mock()
+    # Jump forward in time (and reset scheduler mock)
+    gameState.EventScheduler.return_value.reset_mock()
     monkeypatch.setattr('time.time', lambda: 200)
 
     # Check the now overdue event
-    game_state._recheckTimer()
+    game_state._handleFutureEvents()
 
-    assert gameState.Timer.return_value.cancel.call_count == 1
-    assert gameState.Timer.call_count == 0
+    assert gameState.EventScheduler.return_value.wakeAt.call_count == 0
     assert event.apply.call_count == 1
     assert game_state.uncertainEvents == [event]
-    assert game_state.futureEvents == []
+    assert list(game_state.futureEvents) == []
 
 
-def test_handle_future_event_timer_with_only_event(game_state, monkeypatch, mocker):
+def test_handle_future_events_before_due(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
 
-    # Add the future event
     game_state.addEvent(event)
+    gameState.EventScheduler.return_value.reset_mock()
 
-    gameState.Timer.assert_called_once_with(50, ANY)
-    assert event.apply.call_count == 0
-    assert game_state.uncertainEvents == []
-    assert game_state.futureEvents == [event]
-
-    # Jump forward in time (and reset timer mock)
-    timerHandler = gameState.Timer.call_args[0][1]
-    gameState.Timer.reset_mock()
-    monkeypatch.setattr('time.time', lambda: 200)
-
-    # call the timer handler
-    timerHandler()
+    # Woken up early
+    monkeypatch.setattr('time.time', lambda: 140)
+    game_state._handleFutureEvents()
 
-    assert gameState.Timer.return_value.cancel.call_count == 0
-    assert gameState.Timer.call_count == 0
-    assert event.apply.call_count == 1
-    assert game_state.uncertainEvents == [event]
-    assert game_state.futureEvents == []
+    gameState.EventScheduler.return_value.wakeAt.assert_called_once_with(150)
+    assert event.apply.call_count == 0
+    assert list(game_state.futureEvents) == [event]
 
 
-def test_handle_future_event_timer_with_first_event(game_state, monkeypatch, mocker):
+def test_handle_future_events_with_first_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
@@ -278,30 +324,29 @@ def test_handle_future_event_timer_with_first_event(game_state, monkeypatch, moc
     game_state.addEvent(event)
     game_state.addEvent(event2)
 
-    assert gameState.Timer.call_args_list == [call(50, ANY), call(50, ANY)]
+    assert gameState.EventScheduler.return_value.wakeAt.call_args_list == [call(150), call(150)]
     assert event.apply.call_count == 0
     assert game_state.uncertainEvents == []
-    assert game_state.futureEvents == [event, event2]
+    assert list(game_state.futureEvents) == [event, event2]
 
-    # Jump forward in time (and reset timer mock)
-    timerHandler = gameState.Timer.call_args[0][1]
-    gameState.Timer.reset_mock()
+    # Jump forward in time (and reset scheduler mock)
+    scheduledCallback = gameState.EventScheduler.call_args[0][0]
+    gameState.EventScheduler.return_value.reset_mock()
     monkeypatch.setattr('time.time', lambda: 200)
 
-    # call the timer handler
-    timerHandler()
+    # call the scheduler's callback
+    scheduledCallback()
 
-    assert gameState.Timer.return_value.cancel.call_count == 0
-    assert gameState.Timer.call_count == 1
+    gameState.EventScheduler.return_value.wakeAt.assert_called_once_with(250)
     assert event.apply.call_count == 1
     assert event2.apply.call_count == 0
     assert game_state.uncertainEvents == [event]
-    assert game_state.futureEvents == [event2]
+    assert list(game_state.futureEvents) == [event2]
 
 
-def test_handle_future_event_timer_concurrent_events(game_state, monkeypatch, mocker):
+def test_handle_future_events_concurrent_events(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(150)
     mocker.spy(event, "apply")
@@ -313,23 +358,21 @@ def test_handle_future_event_timer_concurrent_events(game_state, monkeypatch, mo
     game_state.addEvent(event)
     game_state.addEvent(event2)
 
-    assert gameState.Timer.call_args_list == [call(50, ANY), call(50, ANY)]
+    assert gameState.EventScheduler.return_value.wakeAt.call_args_list == [call(150), call(150)]
     assert event.apply.call_count == 0
     assert game_state.uncertainEvents == []
-    assert game_state.futureEvents == [event, event2]
+    assert list(game_state.futureEvents) == [event, event2]
 
-    # Jump forward in time (and reset timer mock)
-    timerHandler = gameState.Timer.call_args[0][1]
-    gameState.Timer.reset_mock()
-    gameState.Timer.return_value.cancel.reset_mock()
+    # Jump forward in time (and reset scheduler mock)
+    scheduledCallback = gameState.EventScheduler.call_args[0][0]
+    gameState.EventScheduler.return_value.reset_mock()
     monkeypatch.setattr('time.time', lambda: 200)
 
-    # call the timer handler
-    timerHandler()
+    # call the scheduler's callback
+    scheduledCallback()
 
-    assert gameState.Timer.return_value.cancel.call_count == 0
-    assert gameState.Timer.call_count == 0
+    assert gameState.EventScheduler.return_value.wakeAt.call_count == 0
     assert event.apply.call_count == 1
     assert event2.apply.call_count == 1
     assert game_state.uncertainEvents == [event, event2]
-    assert game_state.futureEvents == []
+    assert list(game_state.futureEvents) == []
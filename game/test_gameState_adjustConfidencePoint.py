@@ -3,6 +3,7 @@ import pytest
 
 from gameState import GameState
 from gameEvents import GameEvent
+from uncertainEventList import UncertainEventList
 
 
 @pytest.fixture
@@ -25,13 +26,13 @@ def test_adjust_no_events(game_state):
 
 def test_adjust_after_one_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     game_state.getOrCreatePlayer(1, 1)
     original_gameState = game_state.currGameState
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
-    game_state.uncertainEvents = [event]
+    game_state.uncertainEvents = UncertainEventList([event])
 
     game_state.adjustConfidencePoint(70)
 
@@ -45,14 +46,14 @@ def test_adjust_after_one_event(game_state, monkeypatch, mocker):
 
 def test_adjust_before_one_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     game_state.getOrCreatePlayer(1, 1)
     original_gameState = game_state.currGameState
     original_baselineGameState = game_state.baselineGameState
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
-    game_state.uncertainEvents = [event]
+    game_state.uncertainEvents = UncertainEventList([event])
 
     game_state.adjustConfidencePoint(30)
 
@@ -65,7 +66,7 @@ def test_adjust_before_one_event(game_state, monkeypatch, mocker):
 
 def test_adjust_between_events(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
     game_state.getOrCreatePlayer(1, 1)
     original_gameState = game_state.currGameState
     original_baselineGameState = game_state.baselineGameState
@@ -74,7 +75,7 @@ def test_adjust_between_events(game_state, monkeypatch, mocker):
     mocker.spy(event, "apply")
     event2 = GameEvent(60)
     mocker.spy(event2, "apply")
-    game_state.uncertainEvents = [event, event2]
+    game_state.uncertainEvents = UncertainEventList([event, event2])
 
     game_state.adjustConfidencePoint(55)
 
@@ -2,7 +2,8 @@
 import pytest
 
 from gameState import GameState
-from gameEvents import GameEvent
+from gameEvents import GameEvent, FireEvent, GameEndedEvent
+from uncertainEventList import UncertainEventList
 
 
 @pytest.fixture
@@ -13,7 +14,7 @@ def game_state():
 
 def test_cancel_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -27,8 +28,9 @@ def test_cancel_event(game_state, monkeypatch, mocker):
     event4 = GameEvent(160)
     mocker.spy(event4, "apply")
 
-    game_state.uncertainEvents = [event, event2]
-    game_state.futureEvents = [event3, event4]
+    game_state.uncertainEvents = UncertainEventList([event, event2])
+    game_state.futureEvents.push(event3)
+    game_state.futureEvents.push(event4)
 
     game_state.cancelEvent(lambda e: e is event or e is event3)
 
@@ -37,12 +39,12 @@ def test_cancel_event(game_state, monkeypatch, mocker):
     assert event3.apply.call_count == 0
     assert event4.apply.call_count == 0
     assert game_state.uncertainEvents == [event2]
-    assert game_state.futureEvents == [event4]
+    assert list(game_state.futureEvents) == [event4]
 
 
 def test_cancel_only_future_event(game_state, monkeypatch, mocker):
     monkeypatch.setattr('time.time', lambda: 100)
-    mocker.patch("gameState.Timer", autospec=True)
+    mocker.patch("gameState.EventScheduler", autospec=True)
 
     event = GameEvent(50)
     mocker.spy(event, "apply")
@@ -56,8 +58,9 @@ def test_cancel_only_future_event(game_state, monkeypatch, mocker):
     event4 = GameEvent(160)
     mocker.spy(event4, "apply")
 
-    game_state.uncertainEvents = [event, event2]
-    game_state.futureEvents = [event3, event4]
+    game_state.uncertainEvents = UncertainEventList([event, event2])
+    game_state.futureEvents.push(event3)
+    game_state.futureEvents.push(event4)
 
     game_state.cancelEvent(lambda e: e is event3)
 
@@ -66,4 +69,42 @@ def test_cancel_only_future_event(game_state, monkeypatch, mocker):
     assert event3.apply.call_count == 0
     assert event4.apply.call_count == 0
     assert game_state.uncertainEvents == [event, event2]
-    assert game_state.futureEvents == [event4]
+    assert list(game_state.futureEvents) == [event4]
+
+
+def test_cancel_events_by_type_and_player(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    fire = FireEvent(50, 1, 1)
+    fire2 = FireEvent(60, 1, 1)
+    otherFire = FireEvent(60, 1, 2)
+    futureFire = FireEvent(150, 1, 1)
+    end = GameEndedEvent(160)
+    game_state.uncertainEvents = UncertainEventList([fire, fire2, otherFire])
+    game_state.futureEvents.push(futureFire)
+    game_state.futureEvents.push(end)
+    mocker.spy(game_state, "_reapplyEvents")
+
+    game_state.cancelEvents(FireEvent, player=(1, 1), after=55)
+
+    assert game_state.uncertainEvents == [fire, otherFire]
+    assert list(game_state.futureEvents) == [end]
+    game_state._reapplyEvents.assert_called_once_with(fromIndex=1)
+
+
+def test_cancel_only_future_events_doesnt_reapply(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    event = GameEvent(50)
+    end = GameEndedEvent(150)
+    game_state.uncertainEvents = UncertainEventList([event])
+    game_state.futureEvents.push(end)
+    mocker.spy(game_state, "_reapplyEvents")
+
+    game_state.cancelEvents(GameEndedEvent, after=100)
+
+    assert game_state.uncertainEvents == [event]
+    assert list(game_state.futureEvents) == []
+    assert game_state._reapplyEvents.call_count == 0
@@ -0,0 +1,141 @@
+# pylint:disable=redefined-outer-name,E1101
+import pytest
+
+from gameState import GameState, MomentaryGameState
+from gameEvents import GameEvent
+from gameLogic import GameLogic
+
+
+@pytest.fixture
+def game_state(monkeypatch):
+    monkeypatch.setattr('gameState.CHECKPOINT_INTERVAL', 2)
+    game_state = GameState()
+    return game_state
+
+
+def add_spied_events(game_state, mocker, times):
+    events = []
+    for t in times:
+        event = GameEvent(t)
+        mocker.spy(event, "apply")
+        game_state.addEvent(event)
+        events.append(event)
+    return events
+
+
+def test_checkpoints_taken_while_adding_in_order(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    add_spied_events(game_state, mocker, [10, 20, 30, 40, 50])
+
+    assert game_state.checkpoints.indexes == [2, 4]
+
+
+def test_late_event_replays_from_checkpoint(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    events = add_spied_events(game_state, mocker, [10, 20, 30, 40, 50])
+
+    late_event = GameEvent(45)
+    mocker.spy(late_event, "apply")
+    game_state.addEvent(late_event)
+
+    # Events before the checkpoint at index 4 are not re-applied.
+    assert [e.apply.call_count for e in events] == [1, 1, 1, 1, 2]
+    # Once as a first approximation and once when re-applying.
+    assert late_event.apply.call_count == 2
+    assert game_state.uncertainEvents == events[:4] + [late_event, events[4]]
+    assert game_state.checkpoints.indexes == [2, 4, 6]
+
+
+def test_late_event_invalidates_later_checkpoints(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    events = add_spied_events(game_state, mocker, [10, 20, 30, 40, 50])
+    old_checkpoint = game_state.checkpoints.states[1]
+
+    late_event = GameEvent(15)
+    mocker.spy(late_event, "apply")
+    game_state.addEvent(late_event)
+
+    # There is no checkpoint before index 1 so everything is replayed from the baseline
+    assert [e.apply.call_count for e in events] == [2, 2, 2, 2, 2]
+    assert game_state.checkpoints.indexes == [2, 4, 6]
+    assert game_state.checkpoints.states[1] is not old_checkpoint
+
+
+def test_cancel_replays_from_checkpoint(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    events = add_spied_events(game_state, mocker, [10, 20, 30, 40, 50])
+
+    game_state.cancelEvent(lambda e: e is events[3])
+
+    # The checkpoint at index 4 included the cancelled event so we replay from the one at index 2
+    assert [e.apply.call_count for e in events] == [1, 1, 2, 1, 2]
+    assert game_state.uncertainEvents == events[:3] + events[4:]
+    assert game_state.checkpoints.indexes == [2, 4]
+
+
+def test_adjust_confidence_point_uses_checkpoint(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    events = add_spied_events(game_state, mocker, [10, 20, 30, 40, 50, 60])
+    checkpoint = game_state.checkpoints.states[1]
+
+    game_state.adjustConfidencePoint(45)
+
+    # Only the events from the checkpoint at index 4 need applying, and there are none before the confidence point
+    assert [e.apply.call_count for e in events] == [1, 1, 1, 1, 1, 1]
+    assert game_state.baselineGameState is checkpoint
+    assert game_state.uncertainEvents == events[4:]
+    # Checkpoints before the confidence point are dropped and the rest are moved along.
+    assert game_state.checkpoints.indexes == [2]
+
+
+def test_adjust_confidence_point_after_checkpoint(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    events = add_spied_events(game_state, mocker, [10, 20, 30, 40, 50])
+
+    game_state.adjustConfidencePoint(35)
+
+    # Replayed from the checkpoint at index 2
+    assert [e.apply.call_count for e in events] == [1, 1, 2, 1, 1]
+    assert game_state.uncertainEvents == events[3:]
+    assert game_state.checkpoints.indexes == [1]
+
+
+def test_only_written_players_are_compared_after_reapply(game_state, monkeypatch, mocker):
+    monkeypatch.setattr('time.time', lambda: 100)
+    mocker.patch("gameState.EventScheduler", autospec=True)
+
+    game_logic = GameLogic(game_state)
+    playerAdjustedListener = mocker.MagicMock()
+    game_state.addListener(playerAdjusted=playerAdjustedListener)
+
+    for team in range(1, 3):
+        for player in range(1, 33):
+            game_state.getOrCreatePlayer(team, player)
+    game_logic.startGame(10)
+    game_logic.hit(20, 1, 1, 2, 1, 1)
+    game_logic.hit(30, 1, 2, 2, 2, 1)
+    game_logic.hit(40, 1, 3, 2, 3, 1)
+    game_logic.hit(50, 1, 4, 2, 4, 1)
+
+    mocker.spy(MomentaryGameState, "playerAt")
+    # This is applied after the hits at 40 & 50 as an approximation and then they are re-applied.
+    # By then, 2,3 is dead so their hit at 40 shouldn't have counted.
+    game_logic.hit(35, 2, 3, 1, 5, 1000)
+
+    # Only the 7 players written since the checkpoint at index 2 are compared, not all 64.
+    assert MomentaryGameState.playerAt.call_count == 2 * 7
+    assert playerAdjustedListener.call_count == 2
+    # One copy of the parameters is shared between the adjustments.
+    assert playerAdjustedListener.call_args_list[0][0][3] is playerAdjustedListener.call_args_list[1][0][3]
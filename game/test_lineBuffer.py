@@ -0,0 +1,55 @@
+# pylint:disable=redefined-outer-name,E1101
+import socket
+
+from connection import LineBuffer
+
+
+def test_lines():
+    line_buffer = LineBuffer()
+
+    line_buffer.feed("Hello()\nE(1,2,Pi")
+    assert line_buffer.takeMessages() == ["Hello()"]
+    assert len(line_buffer) == 8
+
+    line_buffer.feed("ng())\n\nE(1,3,Ping())\n")
+    assert line_buffer.takeMessages() == ["E(1,2,Ping())", "", "E(1,3,Ping())"]
+    assert len(line_buffer) == 0
+    assert line_buffer.takeMessages() == []
+
+
+def test_line_longer_than_buffer():
+    line_buffer = LineBuffer(size=8)
+    line = "ParametersSnapshot(%s)" % ("x" * 1000)
+
+    for i in range(0, len(line), 7):
+        line_buffer.feed(line[i:i + 7])
+        assert line_buffer.takeMessages() == []
+    line_buffer.feed("\nStart")
+
+    assert line_buffer.takeMessages() == [line]
+    assert len(line_buffer) == 5
+
+
+def test_compacts_rather_than_growing():
+    line_buffer = LineBuffer(size=16)
+
+    for i in range(100):
+        line_buffer.feed("Msg(%02d)\nMs" % i)
+        assert line_buffer.takeMessages() == (["Msg(%02d)" % i] if i == 0 else ["MsMsg(%02d)" % i])
+        line_buffer.feed("")
+
+    assert len(line_buffer._buffer) == 16
+
+
+def test_recv_from():
+    (ours, theirs) = socket.socketpair()
+    line_buffer = LineBuffer(size=4)
+
+    theirs.sendall("Hello()\nE(1,2,")
+    received = 0
+    while received < 14:
+        received += line_buffer.recvFrom(ours)
+    assert line_buffer.takeMessages() == ["Hello()"]
+
+    theirs.close()
+    assert line_buffer.recvFrom(ours) == 0
@@ -153,3 +153,17 @@ def test_addPlayerEffect(mocker):
     mocker.patch.object(parameters, "_addEffect", autospec=True)
     parameters.addPlayerEffect("maxHealth", 1, 2, "id", "*2")
     parameters._addEffect.assert_called_once_with("player.maxHealth", "1/2", "id", "*2")
+
+
+def test_clone():
+    parameters = Parameters()
+    parameters._addEffect("player.maxHealth", "1/*", "id", "*2")
+
+    clone = parameters.clone()
+    assert clone == parameters
+
+    clone._addEffect("player.maxHealth", "1/*", "id2", "+1")
+    parameters._removeEffect("player.maxHealth", "id")
+
+    assert parameters._getValue("player.maxHealth", "1/2") == 100
+    assert clone._getValue("player.maxHealth", "1/2") == 201
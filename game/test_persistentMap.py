@@ -0,0 +1,64 @@
+# pylint:disable=redefined-outer-name
+from persistentMap import PersistentMap
+
+
+def test_dict_like():
+    m = PersistentMap({1: 'a'})
+    m[2] = 'b'
+
+    assert m[1] == 'a'
+    assert m.get(3) is None
+    assert 2 in m
+    assert len(m) == 2
+    assert sorted(m.keys()) == [1, 2]
+    assert m == {1: 'a', 2: 'b'}
+
+    del m[1]
+    assert m == {2: 'b'}
+
+
+def test_clone_shares_storage():
+    m = PersistentMap({1: 'a'})
+    m2 = m.clone()
+
+    assert m2 == m
+    assert m2._data is m._data
+
+
+def test_clone_copies_on_write():
+    m = PersistentMap({1: 'a', 2: 'b'})
+    m2 = m.clone()
+
+    m2[1] = 'c'
+    del m[2]
+
+    assert m == {1: 'a'}
+    assert m2 == {1: 'c', 2: 'b'}
+
+
+def test_clone_of_clone():
+    m = PersistentMap({1: 'a'})
+    m2 = m.clone()
+    m3 = m2.clone()
+
+    m3[1] = 'b'
+
+    assert m == {1: 'a'}
+    assert m2 == {1: 'a'}
+    assert m3 == {1: 'b'}
+
+
+def test_written_keys():
+    m = PersistentMap({1: 'a', 2: 'b', 3: 'c'})
+    m[1] = 'd'
+    del m[2]
+    m.pop(4, None)
+
+    assert m.writtenKeys() == {1, 2, 4}
+    assert m.clone().writtenKeys() == set()
+
+    assert m.takeWrittenKeys() == {1, 2, 4}
+    assert m.writtenKeys() == set()
+
+    m.clear()
+    assert m.writtenKeys() == {1, 3}
@@ -0,0 +1,77 @@
+# pylint:disable=redefined-outer-name,E1101
+import pytest
+
+import proto
+
+MESSAGES = [getattr(proto, name) for name in dir(proto)
+            if isinstance(getattr(proto, name), proto.Message) and getattr(proto, name).regex is not None]
+
+LINES = [
+    "Ping()", "Ping(1)", "Ping", "Pong(1516565652.000000,1)", "Pong(1516565652,0)", "Pong(,1)", "Pong(1.5,12)",
+    "Pong(a,1)", "Pong(1,1", "Recv(1,2,H3,4,5)", "Recv(,,T)", "Recv(1,2,)", "Recv(1,2)", "Recv(a,2,T)",
+    "Sent(1,2,t)", "Hello()", "Hello", "Watermark()", "StartGame(300)", "StartGame()", "StartGame(3.5)",
+    "StopGame()", "ResetGame()", "Deleted()", 'PlayerSnapshot({"a": [1, 2], "b": "(x)"})', "PlayerSnapshot()",
+    'ParametersSnapshot({"a": 1})', "StartInitialising()",
+    "H1,2,3", "H1,2", "H1,2,34", "H12,3,4", "H,1,2", "FA", "FAB", "C", "c", "d", "T", "t", "TT", "B5", "B", "B55",
+    "InitHit", "InitHit()", "", "(", ",", "Unknown(1)",
+]
+
+
+@pytest.mark.parametrize("line", LINES)
+def test_parse_args_matches_regex(line):
+    for msg in MESSAGES:
+        m = msg.regex.match(line)
+        assert msg.parseArgs(line) == (m.groups() if m else None), msg.name
+
+
+def test_message_handler_dispatch(mocker):
+    h = proto.MessageHandler()
+    ping = mocker.MagicMock(return_value=None)
+    hit = mocker.MagicMock(return_value=None)
+    h.handles(proto.PING)(ping)
+    h.handles(proto.HIT)(hit)
+
+    assert h.handle("Ping()")
+    assert h.handle("H1,2,3")
+    assert not h.handle("Pong(1,1)")
+    assert not h.handle("H1,2")
+
+    ping.assert_called_once_with()
+    hit.assert_called_once_with("1", "2", "3")
+
+
+def test_message_handler_match(mocker):
+    h = proto.MessageHandler()
+    hit = mocker.MagicMock()
+    h.handles(proto.HIT)(hit)
+
+    assert h.match("H1,2,3") == (hit, ("1", "2", "3"))
+    assert h.match("H1,2") is None
+    assert h.match("Ping()") is None
+    hit.assert_not_called()
+
+
+def test_parse_event():
+    event = proto.parseEvent("E(123def,1516565652.5,Recv(1,2,H3,4,5))")
+
+    assert event.id == 0x123def
+    assert event.time == 1516565652.5
+    assert event.msgStr == "Recv(1,2,H3,4,5)"
+    assert event.seq is None
+
+
+def test_parse_sequenced_event():
+    event = proto.Event("Recv(1,2,T)", 0x123def, 1516565652.5, 0x2a)
+    parsed = proto.parseEvent(event.toStr())
+
+    assert event.toStr() == "E(123def,1516565652.500000,#2a,Recv(1,2,T))"
+    assert (parsed.id, parsed.time, parsed.seq, parsed.msgStr) == (0x123def, 1516565652.5, 0x2a, "Recv(1,2,T)")
+
+
+@pytest.mark.parametrize("line", [
+    "E(123def,1516565652.5)", "E(123xyz,1,Ping())", "E(,1,Ping())", "E(1,,Ping())",
+    "E(1,-1,Ping())", "X(1,1,Ping())", "E(0x1,1,Ping())",
+])
+def test_parse_event_invalid(line):
+    with pytest.raises(proto.MessageParseException):
+        proto.parseEvent(line)
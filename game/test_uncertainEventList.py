@@ -0,0 +1,108 @@
+# pylint:disable=redefined-outer-name
+from uncertainEventList import UncertainEventList
+from gameEvents import GameEvent
+
+
+def test_insert_in_order():
+    events = UncertainEventList()
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+
+    assert events.insert(event) == 0
+    assert events.insert(event2) == 1
+    assert events == [event, event2]
+    assert events.lastTime() == 60
+
+
+def test_insert_out_of_order():
+    events = UncertainEventList()
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+    event3 = GameEvent(55)
+
+    events.insert(event)
+    events.insert(event2)
+    assert events.insert(event3) == 1
+    assert events == [event, event3, event2]
+
+
+def test_insert_many():
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+    events = UncertainEventList([event, event2])
+    late = GameEvent(55)
+    late2 = GameEvent(40)
+    tie = GameEvent(60)
+    later = GameEvent(70)
+
+    assert events.insertMany([tie, later, late, late2]) == 0
+    assert events == [late2, event, late, event2, tie, later]
+    assert events.indexOf(late) == 2
+    assert tie in events
+
+
+def test_insert_many_after_everything():
+    event = GameEvent(50)
+    events = UncertainEventList([event])
+    later = GameEvent(70)
+    later2 = GameEvent(60)
+
+    assert events.insertMany([later, later2]) == 1
+    assert events == [event, later2, later]
+    assert events.insertMany([]) is None
+
+
+def test_ties_are_in_arrival_order():
+    events = UncertainEventList()
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+    event3 = GameEvent(50)
+
+    events.insert(event)
+    events.insert(event2)
+    assert events.insert(event3) == 1
+    assert events == [event, event3, event2]
+
+
+def test_count_up_to():
+    events = UncertainEventList([GameEvent(50), GameEvent(60), GameEvent(60), GameEvent(70)])
+
+    assert events.countUpTo(40) == 0
+    assert events.countUpTo(60) == 3
+    assert events.countUpTo(65) == 3
+    assert events.countUpTo(80) == 4
+
+
+def test_remove():
+    event = GameEvent(50)
+    event2 = GameEvent(50)
+    event3 = GameEvent(60)
+    events = UncertainEventList([event, event2, event3])
+
+    assert events.remove(event2) == 1
+    assert events == [event, event3]
+    assert event2 not in events
+    assert events.indexOf(event3) == 1
+
+
+def test_remove_where():
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+    event3 = GameEvent(70)
+    events = UncertainEventList([event, event2, event3])
+
+    assert events.removeWhere(lambda e: e is not event) == 1
+    assert events == [event]
+    assert events.removeWhere(lambda e: False) is None
+
+
+def test_drop_before():
+    event = GameEvent(50)
+    event2 = GameEvent(60)
+    event3 = GameEvent(70)
+    events = UncertainEventList([event, event2, event3])
+
+    events.dropBefore(2)
+    assert events == [event3]
+    assert event not in events
+    assert events.insert(GameEvent(65)) == 0
@@ -0,0 +1,150 @@
+from bisect import bisect_left, bisect_right
+import heapq
+import itertools
+
+from eventIndex import EventIndex
+
+
+class UncertainEventList(object):
+    """The uncertain past events, ordered by (serverTime, arrival sequence).
+
+    Events with the same serverTime stay in the order in which they arrived so that
+    replaying them is reproducible. Finding where an event goes, or where a time falls,
+    is a bisect over the sorted keys rather than a scan.
+
+    Events are also indexed by type and player so they can be found with find().
+    """
+
+    def __init__(self, events=None):
+        self._keys = []
+        self._events = []
+        self._keysById = {}
+        self._index = EventIndex()
+        self._sequence = itertools.count()
+        if events:
+            for event in events:
+                self.insert(event)
+
+    def insert(self, event):
+        """Insert an event in order and return the index it was inserted at"""
+        key = (event.serverTime, next(self._sequence))
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._events.insert(index, event)
+        self._keysById[id(event)] = key
+        self._index.add(event)
+        return index
+
+    def insertMany(self, events):
+        """Insert several events in one sorted merge and return the index of the earliest of them.
+        Returns None if there are no events.
+        """
+        # The sequence numbers make every key unique so the events themselves are never compared.
+        newItems = sorted(((event.serverTime, next(self._sequence)), event) for event in events)
+        if not newItems:
+            return None
+
+        firstIndex = bisect_right(self._keys, newItems[0][0])
+        merged = list(heapq.merge(zip(self._keys[firstIndex:], self._events[firstIndex:]), newItems))
+        del self._keys[firstIndex:]
+        del self._events[firstIndex:]
+        self._keys.extend(key for (key, _) in merged)
+        self._events.extend(event for (_, event) in merged)
+
+        for (key, event) in newItems:
+            self._keysById[id(event)] = key
+            self._index.add(event)
+        return firstIndex
+
+    def indexOf(self, event):
+        """Find the index of an event which is in this list"""
+        return bisect_left(self._keys, self._keysById[id(event)])
+
+    def remove(self, event):
+        """Remove an event and return the index it was at"""
+        index = self.indexOf(event)
+        del self._keys[index]
+        del self._events[index]
+        del self._keysById[id(event)]
+        self._index.remove(event)
+        return index
+
+    def removeWhere(self, predicate):
+        """Remove all events which match predicate.
+        Return the index of the first removed event or None if none were removed.
+        """
+        firstRemovedIndex = None
+        keys = []
+        events = []
+        for (key, event) in zip(self._keys, self._events):
+            if predicate(event):
+                del self._keysById[id(event)]
+                self._index.remove(event)
+                if firstRemovedIndex is None:
+                    firstRemovedIndex = len(events)
+            else:
+                keys.append(key)
+                events.append(event)
+        self._keys = keys
+        self._events = events
+        return firstRemovedIndex
+
+    def countUpTo(self, serverTime):
+        """The number of events at or before serverTime"""
+        return bisect_right(self._keys, (serverTime, float('inf')))
+
+    def dropBefore(self, index):
+        """Forget the first index events as they are now certain"""
+        for event in self._events[:index]:
+            del self._keysById[id(event)]
+            self._index.remove(event)
+        del self._keys[:index]
+        del self._events[:index]
+
+    def clear(self):
+        self._keys = []
+        self._events = []
+        self._keysById = {}
+        self._index.clear()
+
+    def find(self, eventType=None, player=None):
+        """Return the events of eventType for player (either can be None to match anything) in no particular order"""
+        return self._index.find(eventType, player)
+
+    def lastTime(self):
+        """The serverTime of the latest event or None if there are no events"""
+        if self._keys:
+            return self._keys[-1][0]
+        else:
+            return None
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, index):
+        return self._events[index]
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __contains__(self, event):
+        return id(event) in self._keysById
+
+    def __eq__(self, other):
+        if isinstance(other, UncertainEventList):
+            return self._events == other._events
+        elif isinstance(other, list):
+            return self._events == other
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "UncertainEventList(%s)" % (self._events,)